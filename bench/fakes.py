@@ -0,0 +1,256 @@
+"""Подменные Google Sheets API и GitHub API для запуска бэкенда без сети.
+
+Обе подделки — транспортные адаптеры `requests`, поэтому через них проходит
+настоящий код gspread, SheetsScheduler и GitHubClient. Каждый запрос
+засыпает на `latency` секунд (с разбросом `jitter`) и учитывается в `calls`.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import unquote, urlparse, parse_qs
+
+import gspread
+import requests
+from gspread.utils import a1_to_rowcol
+from requests.adapters import BaseAdapter
+
+from services.sheets_scheduler import ScheduledHTTPClient
+
+
+def _response(request: requests.PreparedRequest, status: int, payload=None, headers: dict | None = None):
+    response = requests.Response()
+    response.status_code = status
+    response.request = request
+    response.url = request.url
+    response.headers.update({"Content-Type": "application/json", **(headers or {})})
+    response._content = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+    response.encoding = "utf-8"
+    return response
+
+
+class _FakeAPI(BaseAdapter):
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _wait(self) -> None:
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] += 1
+
+    def close(self) -> None:
+        pass
+
+
+def _parse_range(range_name: str) -> tuple[str, tuple[int, int] | None, tuple[int, int] | None]:
+    """'title'!A1:C3 -> (title, (1, 1), (3, 3)); целые строки/столбцы (1:1, B:B) тоже поддерживаются"""
+    title, _, cells = range_name.partition("!")
+    title = title.strip("'").replace("''", "'")
+    if not cells:
+        return title, None, None
+
+    def bound(a1: str, default_row: int, default_col: int) -> tuple[int, int]:
+        if a1.isdigit():
+            return int(a1), default_col
+        if a1.isalpha():
+            return default_row, a1_to_rowcol(f"{a1}1")[1]
+        return a1_to_rowcol(a1)
+
+    start, _, end = cells.partition(":")
+    first = bound(start, 1, 1)
+    last = bound(end or start, 10 ** 6, 10 ** 4) if end else first
+    return title, first, last
+
+
+class FakeSheetsAPI(_FakeAPI):
+    """Подмножество Sheets API v4, которым пользуется gspread: метаданные
+    таблицы, чтение диапазона (values.get, values.batchGet), values.update и values.batchUpdate"""
+
+    def __init__(self, spreadsheets: dict[str, dict[str, list[list[str]]]], latency: float = 0.0, jitter: float = 0.0):
+        super().__init__(latency, jitter)
+        self.spreadsheets = spreadsheets
+
+    def send(self, request, **kwargs):
+        self._wait()
+        url = urlparse(request.url)
+        match = re.match(r"^/v4/spreadsheets/([^/:]+)(.*)$", url.path)
+        if not match or match.group(1) not in self.spreadsheets:
+            return _response(request, 404, {"error": {"code": 404, "message": "Requested entity was not found.",
+                                                      "status": "NOT_FOUND"}})
+        spreadsheet_id, rest = match.group(1), unquote(match.group(2))
+        sheets = self.spreadsheets[spreadsheet_id]
+        params = parse_qs(url.query)
+
+        with self._lock:
+            if request.method == "GET" and rest == "":
+                self.calls["sheets.metadata"] += 1
+                return _response(request, 200, self._metadata(spreadsheet_id, sheets))
+            if request.method == "GET" and rest == "/values:batchGet":
+                self.calls["sheets.values.batchGet"] += 1
+                value_ranges = []
+                for range_name in params.get("ranges", []):
+                    response = self._values_get(request, sheets, range_name, False)
+                    if response.status_code != 200:
+                        return response
+                    value_ranges.append(response.json())
+                return _response(request, 200, {"spreadsheetId": spreadsheet_id, "valueRanges": value_ranges})
+            if request.method == "GET" and rest.startswith("/values/"):
+                self.calls["sheets.values.get"] += 1
+                columns = params.get("majorDimension", ["ROWS"])[0] == "COLUMNS"
+                return self._values_get(request, sheets, rest[len("/values/"):], columns)
+            if request.method == "PUT" and rest.startswith("/values/"):
+                self.calls["sheets.values.update"] += 1
+                body = json.loads(request.body)
+                self._write(sheets, rest[len("/values/"):], body["values"])
+                return _response(request, 200, {"spreadsheetId": spreadsheet_id})
+            if request.method == "POST" and rest == "/values:batchUpdate":
+                self.calls["sheets.values.batchUpdate"] += 1
+                for item in json.loads(request.body)["data"]:
+                    self._write(sheets, item["range"], item["values"])
+                return _response(request, 200, {"spreadsheetId": spreadsheet_id})
+        return _response(request, 400, {"error": {"code": 400, "message": f"Unsupported: {request.method} {rest}",
+                                                  "status": "INVALID_ARGUMENT"}})
+
+    @staticmethod
+    def _metadata(spreadsheet_id: str, sheets: dict) -> dict:
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "properties": {"title": spreadsheet_id, "locale": "ru_RU", "timeZone": "Europe/Moscow"},
+            "sheets": [{"properties": {"sheetId": index, "title": title, "index": index, "sheetType": "GRID",
+                                       "gridProperties": {"rowCount": max(len(values), 1000),
+                                                          "columnCount": max(max((len(r) for r in values), default=0), 26)}}}
+                       for index, (title, values) in enumerate(sheets.items())],
+        }
+
+    def _values_get(self, request, sheets: dict, range_name: str, columns: bool):
+        title, first, last = _parse_range(range_name)
+        if title not in sheets:
+            return _response(request, 400, {"error": {"code": 400, "message": f"Unable to parse range: {range_name}",
+                                                      "status": "INVALID_ARGUMENT"}})
+        values = sheets[title]
+        (r1, c1), (r2, c2) = first or (1, 1), last or (10 ** 6, 10 ** 4)
+        rows = [row[c1 - 1:c2] for row in values[r1 - 1:r2]]
+        if columns:
+            width = max((len(row) for row in rows), default=0)
+            rows = [[row[i] if i < len(row) else "" for row in rows] for i in range(width)]
+        rows = [row[:max((i + 1 for i, v in enumerate(row) if v != ""), default=0)] for row in rows]
+        while rows and not rows[-1]:
+            rows.pop()
+        payload = {"range": range_name, "majorDimension": "COLUMNS" if columns else "ROWS"}
+        if rows:
+            payload["values"] = rows
+        return _response(request, 200, payload)
+
+    @staticmethod
+    def _write(sheets: dict, range_name: str, new_values: list[list]) -> None:
+        title, first, _ = _parse_range(range_name)
+        values = sheets.setdefault(title, [])
+        row_i, col_i = first or (1, 1)
+        for dr, row in enumerate(new_values):
+            while len(values) < row_i + dr:
+                values.append([])
+            target = values[row_i + dr - 1]
+            for dc, value in enumerate(row):
+                while len(target) < col_i + dc:
+                    target.append("")
+                target[col_i + dc - 1] = "" if value is None else str(value)
+
+
+class FakeGitHubAPI(_FakeAPI):
+    """Эндпоинты GitHub, которые вызывают регистрация и проверка ЛР:
+    /users/{login}, содержимое .github/workflows, коммиты, check-runs и
+    GraphQL-запрос состояния CI. Ответы REST несут ETag и поддерживают 304."""
+
+    def __init__(self, users: set[str], repos: dict[str, dict], latency: float = 0.0, jitter: float = 0.0):
+        super().__init__(latency, jitter)
+        self.users = {u.lower() for u in users}
+        self.repos = {name.lower(): repo for name, repo in repos.items()}
+        self.rate_limit = 5000
+
+    def _rate_headers(self, resource: str, spent: bool) -> dict:
+        with self._lock:
+            if spent:
+                self.rate_limit = max(self.rate_limit - 1, 0)
+            return {"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": str(self.rate_limit),
+                    "X-RateLimit-Resource": resource}
+
+    def send(self, request, **kwargs):
+        self._wait()
+        path = urlparse(request.url).path
+
+        if request.method == "POST" and path == "/graphql":
+            self._count("github.graphql")
+            variables = json.loads(request.body)["variables"]
+            return _response(request, 200, self._graphql(f"{variables['owner']}/{variables['name']}"),
+                             headers=self._rate_headers("graphql", True))
+
+        status, payload, name = self._rest(path)
+        self._count(name)
+        etag = '"' + hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest() + '"'
+        if status == 200 and request.headers.get("If-None-Match") == etag:
+            return _response(request, 304, headers={"ETag": etag, **self._rate_headers("core", False)})
+        headers = self._rate_headers("core", True)
+        if status == 200:
+            headers["ETag"] = etag
+        return _response(request, status, payload, headers=headers)
+
+    def _rest(self, path: str) -> tuple[int, object, str]:
+        not_found = {"message": "Not Found"}
+        match = re.match(r"^/users/([^/]+)$", path)
+        if match:
+            login = match.group(1)
+            found = login.lower() in self.users
+            return (200, {"login": login}, "github.users") if found else (404, not_found, "github.users")
+
+        match = re.match(r"^/repos/([^/]+/[^/]+)(/.*)$", path)
+        repo = self.repos.get(match.group(1).lower()) if match else None
+        if repo is None:
+            return 404, not_found, "github.other"
+        rest = match.group(2)
+        if rest == "/contents/.github/workflows":
+            if not repo.get("workflows", True):
+                return 404, not_found, "github.contents"
+            return 200, [{"name": "ci.yml", "type": "file"}], "github.contents"
+        if rest == "/commits":
+            return 200, [{"sha": repo["sha"]}], "github.commits"
+        if rest == f"/commits/{repo['sha']}/check-runs":
+            return 200, {"total_count": len(repo["check_runs"]), "check_runs": repo["check_runs"]}, "github.check_runs"
+        return 404, not_found, "github.other"
+
+    def _graphql(self, full_name: str) -> dict:
+        repo = self.repos.get(full_name.lower())
+        if repo is None:
+            return {"data": {"repository": None}}
+        runs = [{"name": run["name"], "conclusion": (run.get("conclusion") or "").upper() or None,
+                 "permalink": run["html_url"]} for run in repo["check_runs"]]
+        return {"data": {"repository": {
+            "workflows": {"__typename": "Tree"} if repo.get("workflows", True) else None,
+            "defaultBranchRef": {"target": {"oid": repo["sha"],
+                                            "checkSuites": {"nodes": [{"checkRuns": {"nodes": runs}}]}}},
+        }}}
+
+
+def install(main, sheets_api: FakeSheetsAPI, github_api: FakeGitHubAPI) -> None:
+    """Направляет SheetsClient и GitHubClient модуля main в подделки"""
+    session = requests.Session()
+    session.mount("https://", sheets_api)
+    client = gspread.Client(None, session=session, http_client=ScheduledHTTPClient)
+    client.http_client.scheduler = main.sheets_client.scheduler
+    main.sheets_client._client = client
+    main.sheets_client._ensure_token = lambda client: None
+    main.github_client.session.mount("https://api.github.com", github_api)
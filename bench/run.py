@@ -0,0 +1,258 @@
+"""Нагрузочный прогон всех маршрутов бэкенда без сети:
+
+    python -m bench.run [--requests 200] [--concurrency 32] [--latency-ms 80] [--only grade]
+
+Google Sheets и GitHub заменены подделками из bench.fakes, Redis не нужен:
+проверка ЛР выполняется прямо в запросе. Для каждого маршрута печатаются
+p50/p95/p99, пропускная способность и число исходящих вызовов на запрос.
+Маршруты, меняющие файлы курсов (загрузка, правка, удаление), не запускаются.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROSTER_ID = "bench-roster"
+WEBHOOK_SECRET = "bench-secret"
+ADMIN_CHAT = 1
+
+
+def build_dataset(courses_dir: str, groups: int, students: int) -> tuple[dict, set, dict, list[dict]]:
+    """Таблицы, пользователи и репозитории GitHub для всех курсов из courses_dir"""
+    import yaml
+
+    spreadsheets = {ROSTER_ID: {
+        "users": [["tg_chat_id", "code", "github", "group", "student_name", "course_id"]],
+        "admins": [["tg_chat_id", "code", "admin_name", "permissions"], [str(ADMIN_CHAT), "admin", "Bench", "all"]],
+    }}
+    users, repos, courses = set(), {}, []
+    group_ids = [str(4000 + g) for g in range(1, groups + 1)]
+
+    for filename in sorted(f for f in os.listdir(courses_dir) if f.endswith(".yaml")):
+        with open(os.path.join(courses_dir, filename), encoding="utf-8") as f:
+            info = (yaml.safe_load(f) or {}).get("course") or {}
+        stem = filename[:-len(".yaml")]
+        org = info.get("github", {}).get("organization")
+        spreadsheet_id = info.get("google", {}).get("spreadsheet")
+        labs = info.get("labs") or {}
+        if not org or not spreadsheet_id or not labs:
+            continue
+        courses.append({"stem": stem, "org": org, "labs": {key: lab["github-prefix"] for key, lab in labs.items()}})
+        sheets = spreadsheets.setdefault(spreadsheet_id, {info.get("google", {}).get("info-sheet", "График"): [[""]]})
+
+        for group in group_ids:
+            group_rows = [["ID", "Студент", "GitHub", *labs]]
+            by_name = [["№", "ФИО", "GitHub"], ["", f"Группа {group}", ""]]
+            for i in range(1, students + 1):
+                login = f"student-{group}-{i}"
+                name = f"Студентов{i} Студент Группы{group}"
+                chat_id = int(group) * 1000 + i
+                group_rows.append([str(chat_id), name, login] + [""] * len(labs))
+                by_name.append([str(i), name, ""])
+                users.add(login)
+                if stem == courses[0]["stem"]:
+                    spreadsheets[ROSTER_ID]["users"].append([str(chat_id), f"code-{chat_id}", login, group, name, ""])
+                for lab_key, lab in labs.items():
+                    conclusion = "success" if (i + len(lab_key)) % 3 else "failure"
+                    repos[f"{org}/{lab['github-prefix']}-{login}"] = {
+                        "sha": hashlib.sha1(login.encode()).hexdigest(),
+                        "check_runs": [{"name": "tests", "conclusion": conclusion,
+                                        "html_url": f"https://github.com/{org}/{lab['github-prefix']}-{login}/runs/1"}],
+                    }
+            sheets[f"{group}_{stem}"] = group_rows
+            sheets[group] = by_name
+    return spreadsheets, users, repos, courses
+
+
+def scenarios(courses: list[dict], groups: int, students: int) -> list[tuple[str, callable]]:
+    """(маршрут, функция i -> (метод, путь, json, заголовки))"""
+    group_ids = [str(4000 + g) for g in range(1, groups + 1)]
+    course = courses[0]
+    lab, prefix = next(iter(course["labs"].items()))
+
+    def student(i: int) -> tuple[str, int, str, str]:
+        group = group_ids[i % len(group_ids)]
+        n = i // len(group_ids) % students + 1
+        return group, int(group) * 1000 + n, f"student-{group}-{n}", f"Студентов{n} Студент Группы{group}"
+
+    def webhook(i: int):
+        group, _, login, _ = student(i)
+        body = json.dumps({"action": "completed",
+                           "repository": {"full_name": f"{course['org']}/{prefix}-{login}"}}).encode()
+        signature = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        return "POST", "/github/webhook", body, {"X-GitHub-Event": "check_suite", "X-Hub-Signature-256": signature,
+                                                 "Content-Type": "application/json"}
+
+    def registration(i: int):
+        group, _, login, name = student(i)
+        surname, first, patronymic = name.split()
+        return "POST", f"/courses/1/groups/{group}/register", {"surname": surname, "name": first,
+                                                               "patronymic": patronymic, "github": login}, None
+
+    return [
+        ("POST /api/admin/login", lambda i: ("POST", "/api/admin/login", {"login": "admin", "password": "admin"}, None)),
+        ("GET /courses", lambda i: ("GET", "/courses", None, None)),
+        ("GET /courses/{id}", lambda i: ("GET", "/courses/1", None, None)),
+        ("GET /courses/{id}/edit", lambda i: ("GET", "/courses/1/edit", None, None)),
+        ("GET /courses/{id}/groups", lambda i: ("GET", "/courses/1/groups", None, None)),
+        ("GET /courses/{id}/groups/{g}/labs",
+         lambda i: ("GET", f"/courses/1/groups/{student(i)[0]}/labs", None, None)),
+        ("POST /courses/{id}/groups/{g}/register", registration),
+        ("POST /auth/code/login",
+         lambda i: ("POST", "/auth/code/login", {"chat_id": student(i)[1], "code": f"code-{student(i)[1]}"}, None)),
+        ("POST /auth/github/update",
+         lambda i: ("POST", "/auth/github/update", {"chat_id": student(i)[1], "github": student(i)[2]}, None)),
+        ("POST /auth/admin/code/login",
+         lambda i: ("POST", "/auth/admin/code/login", {"chat_id": ADMIN_CHAT, "code": "admin"}, None)),
+        ("GET /student-group/{chat}", lambda i: ("GET", f"/student-group/{student(i)[1]}", None, None)),
+        ("GET /labs/by-chat/{chat}", lambda i: ("GET", f"/labs/by-chat/{student(i)[1]}", None, None)),
+        ("GET /courses/by-chat/{chat}", lambda i: ("GET", f"/courses/by-chat/{student(i)[1]}", None, None)),
+        ("POST /courses/{id}/groups/{g}/register-by-chat",
+         lambda i: ("POST", f"/courses/1/groups/{student(i)[0]}/register-by-chat", {"chat_id": student(i)[1]}, None)),
+        ("POST /courses/{id}/groups/{g}/labs/{lab}/grade",
+         lambda i: ("POST", f"/courses/1/groups/{student(i)[0]}/labs/{lab}/grade", {"github": student(i)[2]}, None)),
+        ("POST /github/webhook", webhook),
+        ("GET /admin/courses", lambda i: ("GET", f"/admin/courses?chat_id={ADMIN_CHAT}", None, None)),
+        ("GET /admin/courses/{id}/yaml", lambda i: ("GET", f"/admin/courses/1/yaml?chat_id={ADMIN_CHAT}", None, None)),
+        ("GET /admin/check-chat/{chat}", lambda i: ("GET", f"/admin/check-chat/{ADMIN_CHAT}?chat_id={ADMIN_CHAT}",
+                                                    None, None)),
+        ("GET /admin/courses/{id}/groups", lambda i: ("GET", f"/admin/courses/1/groups?chat_id={ADMIN_CHAT}",
+                                                      None, None)),
+        ("GET /admin/courses/{id}/groups/{g}/results",
+         lambda i: ("GET", f"/admin/courses/1/groups/{student(i)[0]}/results?chat_id={ADMIN_CHAT}", None, None)),
+        ("POST /admin/courses/{id}/groups/{g}/labs/{lab}/grade",
+         lambda i: ("POST", f"/admin/courses/1/groups/{student(i)[0]}/labs/{lab}/grade?chat_id={ADMIN_CHAT}",
+                    None, None)),
+        ("GET /admin/sheets/queue", lambda i: ("GET", f"/admin/sheets/queue?chat_id={ADMIN_CHAT}", None, None)),
+        ("GET /admin/sheets/conflicts", lambda i: ("GET", f"/admin/sheets/conflicts?chat_id={ADMIN_CHAT}", None, None)),
+    ]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+async def drive(client, make_request, total: int, concurrency: int) -> tuple[list[float], dict[int, int], float]:
+    counter = itertools.count()
+    latencies, statuses = [], {}
+
+    async def worker():
+        while (i := next(counter)) < total:
+            method, path, body, headers = make_request(i)
+            kwargs = {"content": body} if isinstance(body, bytes) else {"json": body}
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+async def run(args) -> list[dict]:
+    import httpx
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ.update({
+        "SPREADSHEET_ID": ROSTER_ID,
+        "LOCAL_STORE_PATH": os.path.join(workdir, "store.sqlite3"),
+        "GITHUB_TOKEN": "bench-token",
+        "GITHUB_WEBHOOK_SECRET": WEBHOOK_SECRET,
+        "ADMIN_LOGIN": "admin",
+        "ADMIN_PASSWORD": "admin",
+        "REDIS_URL": "redis://127.0.0.1:1/0",
+    })
+
+    import main
+    from redis import RedisError
+    from bench.fakes import FakeGitHubAPI, FakeSheetsAPI, install
+
+    spreadsheets, users, repos, courses = build_dataset(main.COURSES_DIR, args.groups, args.students)
+    latency, jitter = args.latency_ms / 1000, args.jitter_ms / 1000
+    sheets_api = FakeSheetsAPI(spreadsheets, latency, jitter)
+    github_api = FakeGitHubAPI(users, repos, latency, jitter)
+    install(main, sheets_api, github_api)
+
+    def no_queue(kind, payload, traceparent=None, dedup_key=None):
+        raise RedisError("bench: очередь отключена")
+    main.jobs.enqueue = no_queue
+
+    results = []
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for name, make_request in scenarios(courses, args.groups, args.students):
+                if args.only and args.only not in name:
+                    continue
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await drive(client, make_request, args.warmup, 1)
+                    main.sync.flush()
+                    sheets_before, github_before = sheets_api.total_calls(), github_api.total_calls()
+                    latencies, statuses, elapsed = await drive(client, make_request, args.requests, args.concurrency)
+                    main.sync.flush()
+                sheets_calls = sheets_api.total_calls() - sheets_before
+                github_calls = github_api.total_calls() - github_before
+                results.append({
+                    "route": name,
+                    "requests": len(latencies),
+                    "statuses": statuses,
+                    "p50_ms": percentile(latencies, 50) * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+                    "rps": len(latencies) / elapsed if elapsed else 0.0,
+                    "sheets_calls_per_request": sheets_calls / max(len(latencies), 1),
+                    "github_calls_per_request": github_calls / max(len(latencies), 1),
+                })
+                print(format_row(results[-1]), flush=True)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+HEADER = f"{'route':<55} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'sheets/req':>10} {'gh/req':>7}  statuses"
+
+
+def format_row(r: dict) -> str:
+    statuses = ",".join(f"{code}x{count}" for code, count in sorted(r["statuses"].items()))
+    return (f"{r['route']:<55} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['rps']:>8.1f} "
+            f"{r['sheets_calls_per_request']:>10.2f} {r['github_calls_per_request']:>7.2f}  {statuses}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон маршрутов бэкенда на подделках Sheets и GitHub")
+    parser.add_argument("--requests", type=int, default=200, help="запросов на маршрут")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных клиентов")
+    parser.add_argument("--warmup", type=int, default=5, help="прогревочных запросов на маршрут")
+    parser.add_argument("--latency-ms", type=float, default=80, help="задержка ответа Google/GitHub")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="разброс задержки")
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--students", type=int, default=30, help="студентов в группе")
+    parser.add_argument("--only", default="", help="запускать только маршруты, содержащие подстроку")
+    parser.add_argument("--json", dest="json_path", help="сохранить результаты в JSON файл")
+    args = parser.parse_args()
+
+    print(HEADER)
+    results = asyncio.run(run(args))
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,11 @@
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.client.session import aiohttp
 import aiohttp as aiohttp_module
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 
 from ..states import AdminAuth, AdminPanel
+from ..middlewares.tracing import api_session
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -13,9 +13,11 @@ from bot_settings import Settings
 
 router = Router()
 
+RESULTS_PAGE_SIZE = 15
+
 @router.message(Command("admin"))
 async def admin_start(msg: types.Message, state: FSMContext, settings: Settings):
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         try:
             r = await s.get(f"{settings.API_BASE}/admin/check-chat/{msg.from_user.id}")
             if r.status == 200:
@@ -34,7 +36,7 @@ async def check_admin_code(
 ):
     code = msg.text.strip()
 
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.post(
             f"{settings.API_BASE}/auth/admin/code/login",
             json={"chat_id": msg.from_user.id, "code": code},
@@ -71,7 +73,7 @@ async def list_admin_courses(callback: CallbackQuery, state: FSMContext, setting
     except:
         pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/admin/courses?chat_id={callback.from_user.id}")
         if r.status != 200:
             await callback.message.answer("❌ Не удалось получить список курсов")
@@ -102,7 +104,7 @@ async def show_course_menu(callback: CallbackQuery, state: FSMContext, settings:
             await callback.message.delete()
         except:
             pass
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/courses/{course_id}")
         if r.status != 200:
             await callback.message.answer("❌ Курс не найден")
@@ -139,7 +141,7 @@ async def admin_view_yaml(callback: CallbackQuery, state: FSMContext, settings:
     except:
         pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/admin/courses/{course_id}/yaml?chat_id={callback.from_user.id}")
         if r.status != 200:
             await callback.message.answer("❌ Не удалось получить YAML файл")
@@ -209,7 +211,7 @@ async def admin_view_groups(callback: CallbackQuery, state: FSMContext, settings
     except:
         pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/admin/courses/{course_id}/groups?chat_id={callback.from_user.id}")
         if r.status != 200:
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -253,10 +255,31 @@ async def admin_view_results(callback: CallbackQuery, state: FSMContext, setting
     except:
         pass
     
+    await show_group_results(callback, state, settings, course_id, group_id)
+
+@router.callback_query(F.data.startswith("admin_results_page_"))
+async def admin_results_page(callback: CallbackQuery, state: FSMContext, settings: Settings):
+    await callback.answer()
+    course_id, cursor, group_id = callback.data.replace("admin_results_page_", "").split("_", 2)
+    
+    data = await state.get_data()
+    for message_id in data.get("results_message_ids", []):
+        try:
+            await callback.bot.delete_message(chat_id=callback.message.chat.id, message_id=message_id)
+        except:
+            pass
+    
+    await show_group_results(callback, state, settings, course_id, group_id, cursor)
+
+async def show_group_results(callback: CallbackQuery, state: FSMContext, settings: Settings,
+                             course_id: str, group_id: str, cursor: str | None = None):
     progress_msg = await callback.message.answer("🔄 Загружаю результаты...")
     
-    async with aiohttp.ClientSession() as s:
-        r = await s.get(f"{settings.API_BASE}/admin/courses/{course_id}/groups/{group_id}/results?chat_id={callback.from_user.id}")
+    params = {"chat_id": callback.from_user.id, "limit": RESULTS_PAGE_SIZE}
+    if cursor:
+        params["cursor"] = cursor
+    async with api_session() as s:
+        r = await s.get(f"{settings.API_BASE}/admin/courses/{course_id}/groups/{group_id}/results", params=params)
         
         try:
             await progress_msg.delete()
@@ -274,6 +297,8 @@ async def admin_view_results(callback: CallbackQuery, state: FSMContext, setting
         
     headers = data.get("headers", [])
     rows = data.get("rows", [])
+    row_numbers = data.get("row_numbers", [])
+    next_cursor = data.get("next_cursor")
     course_name = data.get("course_name", "Курс")
     
     if not headers or not rows:
@@ -289,9 +314,8 @@ async def admin_view_results(callback: CallbackQuery, state: FSMContext, setting
     sent_messages = []
     
     current_chunk = results_text
-    student_count = 0
     
-    for row in rows:
+    for row, row_number in zip(rows, row_numbers):
         if not row or len(row) < 2:
             continue
         
@@ -311,11 +335,7 @@ async def admin_view_results(callback: CallbackQuery, state: FSMContext, setting
         if not has_data:
             continue
             
-        student_count += 1
-        if student_count > 15:
-            break
-            
-        student_info = f"👤 **Студент #{student_count}**\n"
+        student_info = f"👤 **Студент #{row_number - 1}**\n"
         
         for i, header in enumerate(headers):
             if i >= len(row):
@@ -341,12 +361,14 @@ async def admin_view_results(callback: CallbackQuery, state: FSMContext, setting
         else:
             current_chunk = test_chunk
     
-    if len(rows) > 15:
-        current_chunk += f"⚠️ Показано {min(len(rows), 15)} из {len(rows)} студентов"
-    
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⬅️ К группам", callback_data=f"admin_view_groups_{course_id}")]
-    ])
+    keyboard_buttons = []
+    if next_cursor:
+        keyboard_buttons.append([InlineKeyboardButton(
+            text=f"➡️ Следующие {RESULTS_PAGE_SIZE}",
+            callback_data=f"admin_results_page_{course_id}_{next_cursor}_{group_id}"
+        )])
+    keyboard_buttons.append([InlineKeyboardButton(text="⬅️ К группам", callback_data=f"admin_view_groups_{course_id}")])
+    keyboard = InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
     
     if current_chunk.strip():
         msg = await callback.message.answer(current_chunk, parse_mode="Markdown", reply_markup=keyboard)
@@ -396,7 +418,7 @@ async def admin_delete_course(callback: CallbackQuery, state: FSMContext, settin
     
     progress_msg = await callback.message.answer("🔄 Удаляю курс...")
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.delete(f"{settings.API_BASE}/admin/courses/{course_id}?chat_id={callback.from_user.id}")
         
         try:
@@ -468,7 +490,7 @@ async def admin_logout(callback: CallbackQuery, state: FSMContext, settings: Set
     except:
         pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         try:
             await s.post(f"{settings.API_BASE}/auth/admin/logout", json={"chat_id": callback.from_user.id})
         except:
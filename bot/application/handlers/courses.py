@@ -1,11 +1,12 @@
+import asyncio
 from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.client.session import aiohttp
 import aiohttp as aiohttp_module
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 
 from ..states import CourseSelection, LabSubmission
+from ..middlewares.tracing import api_session
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -13,6 +14,46 @@ from bot_settings import Settings
 
 router = Router()
 
+JOB_POLL_INTERVAL = 2
+JOB_POLL_TIMEOUT = 600
+API_RETRIES = 3
+
+
+async def post_idempotent(s, url: str, payload: dict, key: str):
+    """POST с заголовком Idempotency-Key. При таймауте или обрыве соединения запрос
+    повторяется с тем же ключом, и бэкенд отдает ответ первой попытки, а не выполняет ее заново"""
+    for attempt in range(API_RETRIES):
+        try:
+            return await s.post(url, json=payload, headers={"Idempotency-Key": key})
+        except (asyncio.TimeoutError, aiohttp_module.ClientConnectionError):
+            if attempt == API_RETRIES - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
+async def wait_for_job(s, settings: Settings, job_id: str, progress_msg: types.Message) -> tuple[int, dict]:
+    """Опрашивает GET /jobs/{job_id} до завершения; возвращает (HTTP-статус, данные) как у синхронной проверки"""
+    shown_status = "queued"
+    for _ in range(JOB_POLL_TIMEOUT // JOB_POLL_INTERVAL):
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+        r = await s.get(f"{settings.API_BASE}/jobs/{job_id}")
+        if r.status != 200:
+            continue
+        job = await r.json()
+        if job["status"] == "done":
+            return 200, job["result"]
+        if job["status"] == "failed":
+            error = job.get("error") or {}
+            return error.get("status_code", 500), {"detail": error.get("detail", "Неизвестная ошибка")}
+        if job["status"] == "running" and shown_status != "running":
+            shown_status = "running"
+            try:
+                await progress_msg.edit_text("🔄 Проверяю результаты CI...")
+            except Exception:
+                pass
+    return 504, {"detail": "Проверка заняла слишком много времени, попробуйте позже"}
+
+
 @router.callback_query(F.data == "courses")
 async def list_courses_callback(callback: CallbackQuery, state: FSMContext, settings: Settings):
     await callback.answer()
@@ -29,7 +70,7 @@ async def list_courses_impl(msg: types.Message, state: FSMContext, settings: Set
         except:
             pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/courses/by-chat/{user_id}")
         if r.status != 200:
             if is_callback:
@@ -89,7 +130,7 @@ async def select_course_impl(msg: types.Message, state: FSMContext, settings: Se
     except:
         pass
     
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         r = await s.get(f"{settings.API_BASE}/courses/{course_id}")
         if r.status != 200:
             await msg.answer("Курс не найден. Попробуйте еще раз.")
@@ -107,7 +148,7 @@ async def select_course_impl(msg: types.Message, state: FSMContext, settings: Se
         await msg.answer("Для этого курса пока нет групп")
         return
 
-    async with aiohttp.ClientSession() as s:
+    async with api_session() as s:
         user_response = await s.get(f"{settings.API_BASE}/courses/by-chat/{user_id}")
         if user_response.status != 200:
             await msg.answer("Ошибка получения данных студента")
@@ -205,10 +246,13 @@ async def submit_lab_impl(msg: types.Message, state: FSMContext, settings: Setti
     
     progress_msg = await msg.answer(f"🔄 Отправляю лабораторную {selected_lab} на проверку...")
     
-    async with aiohttp.ClientSession() as s:
-        register_response = await s.post(
-            f"{settings.API_BASE}/courses/{course_id}/groups/{group_id}/register-by-chat",
-            json={"chat_id": user_id}
+    # Повторное нажатие той же кнопки и повторы запросов получают один ключ
+    request_key = f"{user_id}:{msg.chat.id}:{msg.message_id}"
+
+    async with api_session() as s:
+        register_response = await post_idempotent(
+            s, f"{settings.API_BASE}/courses/{course_id}/groups/{group_id}/register-by-chat",
+            {"chat_id": user_id}, f"register:{request_key}"
         )
         
         if register_response.status != 200:
@@ -224,13 +268,17 @@ async def submit_lab_impl(msg: types.Message, state: FSMContext, settings: Setti
             await state.clear()
             return
         
-        grade_response = await s.post(
-            f"{settings.API_BASE}/courses/{course_id}/groups/{group_id}/labs/{selected_lab}/grade",
-            json={"github": github_username}
+        grade_response = await post_idempotent(
+            s, f"{settings.API_BASE}/courses/{course_id}/groups/{group_id}/labs/{selected_lab}/grade",
+            {"github": github_username}, f"grade:{request_key}:{selected_lab}"
         )
         
-        if grade_response.status == 200:
-            grade_data = await grade_response.json()
+        grade_status = grade_response.status
+        grade_data = await grade_response.json() if grade_response.headers.get('content-type', '').startswith('application/json') else {}
+        if grade_status == 202:
+            grade_status, grade_data = await wait_for_job(s, settings, grade_data["job_id"], progress_msg)
+
+        if grade_status == 200:
             status = grade_data.get("status", "unknown")
             message = grade_data.get("message", "Проверка завершена")
             passed = grade_data.get("passed", "")
@@ -274,8 +322,7 @@ async def submit_lab_impl(msg: types.Message, state: FSMContext, settings: Setti
             except:
                 pass
             
-            error_data = await grade_response.json() if grade_response.headers.get('content-type', '').startswith('application/json') else {}
-            error_message = error_data.get("detail", "Неизвестная ошибка")
+            error_message = grade_data.get("detail", "Неизвестная ошибка")
             
             keyboard = InlineKeyboardMarkup(inline_keyboard=[
                 [InlineKeyboardButton(text="📚 К курсам", callback_data="back_to_courses")]
@@ -1,12 +1,12 @@
 from aiogram import Router, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.client.session import aiohttp
 import aiohttp as aiohttp_module
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import redis.asyncio as redis
 
 from ..states import Auth
+from ..middlewares.tracing import api_session
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
@@ -17,7 +17,7 @@ router = Router()
 @router.message(Command("start"))
 async def ask_code(msg: types.Message, state: FSMContext, settings: Settings):
     timeout = aiohttp_module.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as s:
+    async with api_session(timeout=timeout) as s:
         try:
             async with s.get(f"{settings.API_BASE}/student-group/{msg.from_user.id}") as r:
                 if r.status == 200:
@@ -35,7 +35,7 @@ async def ask_code(msg: types.Message, state: FSMContext, settings: Settings):
 
 async def check_github_and_proceed(msg: types.Message, state: FSMContext, settings: Settings):
     timeout = aiohttp_module.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as s:
+    async with api_session(timeout=timeout) as s:
         async with s.get(f"{settings.API_BASE}/student-group/{msg.from_user.id}") as student_r:
             if student_r.status != 200:
                 await msg.answer("Введи одноразовый код, который дал преподаватель")
@@ -64,7 +64,7 @@ async def check_code(
     code = msg.text.strip()
 
     timeout = aiohttp_module.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as s:
+    async with api_session(timeout=timeout) as s:
         async with s.post(
             f"{settings.API_BASE}/auth/code/login",
             json={"chat_id": msg.from_user.id, "code": code},
@@ -111,7 +111,7 @@ async def check_github(
     await msg.answer("🔄 Проверяю GitHub аккаунт...")
     
     timeout = aiohttp_module.ClientTimeout(total=10)
-    async with aiohttp.ClientSession(timeout=timeout) as s:
+    async with api_session(timeout=timeout) as s:
         async with s.post(
             f"{settings.API_BASE}/auth/github/update",
             json={"chat_id": msg.from_user.id, "github": github_username},
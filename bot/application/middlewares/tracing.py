@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import contextvars
+import secrets
+import time
+from typing import Callable, Awaitable, Any
+
+import aiohttp
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+# (trace_id, span_id, chat_id, вызовы бэкенда [(метод, путь, статус, мс)])
+_trace: contextvars.ContextVar[tuple[str, str, int | None, list] | None] = contextvars.ContextVar("trace", default=None)
+
+
+async def _on_request_start(session, ctx, params: aiohttp.TraceRequestStartParams):
+    current = _trace.get()
+    if current is None:
+        return
+    trace_id, span_id, chat_id, _ = current
+    ctx.started = time.perf_counter()
+    params.headers["traceparent"] = f"00-{trace_id}-{span_id}-01"
+    if chat_id is not None:
+        params.headers["baggage"] = f"chat_id={chat_id}"
+
+
+async def _on_request_end(session, ctx, params: aiohttp.TraceRequestEndParams):
+    current = _trace.get()
+    if current is None or not hasattr(ctx, "started"):
+        return
+    elapsed = (time.perf_counter() - ctx.started) * 1000
+    current[3].append((params.method, params.url.path, params.response.status, elapsed))
+
+
+_trace_config = aiohttp.TraceConfig()
+_trace_config.on_request_start.append(_on_request_start)
+_trace_config.on_request_end.append(_on_request_end)
+
+
+def api_session(**kwargs) -> aiohttp.ClientSession:
+    """Сессия для запросов к бэкенду: каждый запрос несет traceparent текущего апдейта"""
+    return aiohttp.ClientSession(trace_configs=[_trace_config], **kwargs)
+
+
+class Tracing(BaseMiddleware):
+    """Заводит trace id на каждый апдейт Telegram и после обработки пишет в лог
+    общее время и самый медленный вызов бэкенда. Тот же trace id бэкенд
+    получает в заголовке traceparent и записывает в свои спаны."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict], Awaitable[Any]],
+        event: Update,
+        data: dict,
+    ):
+        user = data.get("event_from_user")
+        calls: list = []
+        trace_id = secrets.token_hex(16)
+        token = _trace.set((trace_id, secrets.token_hex(8), user.id if user else None, calls))
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            _trace.reset(token)
+            if calls:
+                elapsed = (time.perf_counter() - started) * 1000
+                method, path, status, slowest = max(calls, key=lambda call: call[3])
+                print(f"[trace {trace_id}] апдейт {event.update_id}: {elapsed:.0f} мс, вызовов бэкенда {len(calls)}, "
+                      f"самый медленный {method} {path} ({status}) {slowest:.0f} мс")
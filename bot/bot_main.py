@@ -5,6 +5,7 @@ from aiogram import Bot, Dispatcher
 from bot_settings import Settings
 from application.handlers import start, courses, admin
 from application.middlewares.auth import RequireAuth
+from application.middlewares.tracing import Tracing
 
 
 async def main() -> None:
@@ -17,6 +18,7 @@ async def main() -> None:
     dp["settings"] = cfg
     dp["redis"] = redis_client
 
+    dp.update.outer_middleware(Tracing())
     dp.message.middleware(RequireAuth(redis_client))
     dp.callback_query.middleware(RequireAuth(redis_client))
     dp.include_router(start.router)
@@ -38,6 +38,31 @@ export const registerAndCheck = async (courseId, groupId, formData) => {
 };
 
 
+const JOB_POLL_INTERVAL = 2000;
+const JOB_POLL_TIMEOUT = 600000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Проверка ставится в очередь (202 + job_id): опрашиваем /jobs/{job_id},
+// пока задача не завершится, и возвращаем ее результат как у синхронного ответа
+export const waitForJob = async (jobId) => {
+  for (let waited = 0; waited < JOB_POLL_TIMEOUT; waited += JOB_POLL_INTERVAL) {
+    await sleep(JOB_POLL_INTERVAL);
+    const response = await fetch(`/api/jobs/${jobId}`);
+    if (!response.ok) continue;
+
+    const job = await response.json();
+    if (job.status === "done") return job.result;
+    if (job.status === "failed") {
+      return { status: "error", message: job.error?.detail || "Неизвестная ошибка" };
+    }
+  }
+  return {
+    status: "error",
+    message: "Проверка заняла слишком много времени, попробуйте позже",
+  };
+};
+
 export async function gradeLab(courseId, groupId, labId, github) {
   const encodedLabId = encodeURIComponent(labId);
 
@@ -52,6 +77,13 @@ export async function gradeLab(courseId, groupId, labId, github) {
     }
   );
 
-  return response.json();
+  const data = await response.json();
+  if (response.status === 202 && data.job_id) {
+    return waitForJob(data.job_id);
+  }
+  if (!response.ok) {
+    return { status: "error", message: data.detail || "Ошибка проверки" };
+  }
+  return data;
 }
 
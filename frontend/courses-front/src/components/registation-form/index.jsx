@@ -43,6 +43,8 @@ const handleSubmit = async () => {
 
       if (gradeResponse.status === "updated") {
         showSnackbar(gradeResponse.message, "success");
+      } else if (gradeResponse.status === "error") {
+        showSnackbar(gradeResponse.message, "error");
       } else {
         showSnackbar(gradeResponse.message || "Проверка завершена", "info");
       }
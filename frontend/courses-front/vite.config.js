@@ -17,7 +17,8 @@ export default defineConfig({
           if (
             path.startsWith('/api/courses') ||
             path.startsWith('/api/groups') ||
-            path.startsWith('/api/labs')
+            path.startsWith('/api/labs') ||
+            path.startsWith('/api/jobs')
           ) {
             return path.replace(/^\/api/, '');
           }
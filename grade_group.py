@@ -0,0 +1,46 @@
+"""Перепроверка ЛР у всей группы из командной строки:
+
+    python grade_group.py <course_id|course-file> <group> <lab> [--concurrency N]
+"""
+import argparse
+import json
+import sys
+
+
+def run() -> int:
+    parser = argparse.ArgumentParser(description="Проверка лабораторной работы у всей группы")
+    parser.add_argument("course", help="id курса или имя YAML файла без расширения")
+    parser.add_argument("group", help="номер группы")
+    parser.add_argument("lab", help="лабораторная работа, например ЛР1 или 1")
+    parser.add_argument("--concurrency", type=int, default=None, help="число одновременных запросов к GitHub")
+    args = parser.parse_args()
+
+    import main
+    from fastapi import HTTPException
+
+    main.courses.load()
+    course = main.courses.by_stem(args.course) or main.courses.get(args.course)
+    if course is None:
+        print(f"Курс {args.course} не найден", file=sys.stderr)
+        return 1
+
+    try:
+        report = main.grade_group(main.local_sheets, main.sync, main.github_client, course, args.group,
+                                  main.normalize_lab_id(args.lab), main.parse_lab_id(args.lab),
+                                  concurrency=args.concurrency or main.GROUP_GRADING_CONCURRENCY,
+                                  backend=main.GITHUB_CI_BACKEND)
+    except HTTPException as e:
+        print(e.detail, file=sys.stderr)
+        return 1
+    finally:
+        main.sync.stop()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if main.sync.size():
+        print(f"Не записано в таблицу: {main.sync.size()} (сохранено в локальном хранилище)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
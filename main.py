@@ -1,21 +1,63 @@
-from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi import FastAPI, Request, Response, HTTPException, Depends, BackgroundTasks, Query, Header
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 import os
 import yaml
-import gspread
-import requests
-from oauth2client.service_account import ServiceAccountCredentials
 from pydantic import BaseModel, Field
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File
 from dotenv import load_dotenv
 from itsdangerous import TimestampSigner, BadSignature
-import re
+from contextlib import asynccontextmanager
+import json
+import time
+import anyio.to_thread
+from fastapi.concurrency import run_in_threadpool
+
+from services.courses import Course, CourseRegistry, lab_number, validate_course
+from services.sheets import SheetsClient
+from services.sheets_scheduler import SharedQuota, SheetsScheduler, with_priority
+from services.sheet_index import SheetIndex
+from services.local_store import LocalStore, LocalSheets, SyncEngine
+from services.sheet_cache import SnapshotCache
+from services.row_allocator import free_row
+from services.github import GitHubClient
+from services.grading import fetch_ci_status, write_grade, grade_response, grade_group, GradeStore
+from services.webhooks import CI_EVENTS, verify_signature, resolve_repository
+from services.jobs import JobQueue
+from services.dedup import SingleFlight, IdempotencyStore, IdempotencyConflict
+from services.invalidation import InvalidationBus, COURSE, ROSTER_ROW, GROUP_SHEET, cell_key
+from services.results import query_results
+from services.export import course_rows, stream_csv, stream_xlsx
+from services.http_cache import ResponseCache, version_of
+from services import metrics
+from services.tracing import TRACER, exporter_from_env, parse_baggage
+from redis import RedisError
 
 load_dotenv()
-app = FastAPI()
+
+COURSES_DIR = "courses"
+courses = CourseRegistry(COURSES_DIR)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    courses.load()
+    roster.start()
+    admins.start()
+    sync.start()
+    bus.start()
+    TRACER.start()
+    yield
+    roster.stop()
+    admins.stop()
+    sync.stop()
+    bus.stop()
+    TRACER.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -24,15 +66,92 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         status_code=422,
         content={"detail": exc.errors(), "body": exc.body}
     )
-COURSES_DIR = "courses"
 CREDENTIALS_FILE = "credentials.json"
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+sheets_scheduler = SheetsScheduler(read_per_minute=float(os.getenv("SHEETS_READS_PER_MINUTE", "60")),
+                                   write_per_minute=float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60")),
+                                   quota=SharedQuota(REDIS_URL))
+sheets_client = SheetsClient(CREDENTIALS_FILE, scheduler=sheets_scheduler)
 CODES_SHEET = "users"
 ADMINS_SHEET = "admins"
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+GITHUB_CI_BACKEND = os.getenv("GITHUB_CI_BACKEND", "graphql")
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+GROUP_GRADING_CONCURRENCY = int(os.getenv("GROUP_GRADING_CONCURRENCY", "8"))
 ADMIN_LOGIN = os.getenv("ADMIN_LOGIN")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key")
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
+ROSTER_TTL = float(os.getenv("ROSTER_TTL", "60"))
+
+sync = SyncEngine(LocalStore(os.getenv("LOCAL_STORE_PATH", "local_store.sqlite3")), sheets_client,
+                  push_interval=float(os.getenv("SHEETS_FLUSH_INTERVAL", "1.0")),
+                  pull_interval=float(os.getenv("SHEETS_PULL_INTERVAL", "60")),
+                  snapshots=SnapshotCache(REDIS_URL, ttl=float(os.getenv("SHEETS_SNAPSHOT_TTL", "300"))))
+local_sheets = LocalSheets(sync)
+roster = SheetIndex(local_sheets, SPREADSHEET_ID, CODES_SHEET,
+                    keys=("tg_chat_id", "code", "github"), casefold=("github",), ttl=ROSTER_TTL)
+admins = SheetIndex(local_sheets, SPREADSHEET_ID, ADMINS_SHEET,
+                    keys=("tg_chat_id", "code"), ttl=ROSTER_TTL)
+github_client = GitHubClient(GITHUB_TOKEN, max_concurrency=int(os.getenv("GITHUB_MAX_CONCURRENCY", "16")))
+grades = GradeStore(REDIS_URL, ttl=int(os.getenv("GRADE_STORE_TTL", str(24 * 3600))))
+jobs = JobQueue(REDIS_URL)
+catalog_cache = ResponseCache(max_age=int(os.getenv("CATALOG_MAX_AGE", "30")))
+bus = InvalidationBus(REDIS_URL)
+in_flight = SingleFlight()
+idempotency = IdempotencyStore(REDIS_URL, ttl=int(os.getenv("IDEMPOTENCY_TTL", "600")))
+sheet_indexes = {(SPREADSHEET_ID, CODES_SHEET): roster, (SPREADSHEET_ID, ADMINS_SHEET): admins}
+
+
+def course_changed(filename: str) -> None:
+    """Файл курса изменен: сбросить кеши здесь и в остальных процессах"""
+    courses.invalidate()
+    catalog_cache.invalidate()
+    bus.publish(COURSE, filename)
+
+
+def announce_write(spreadsheet_id: str, title: str, cells: list[tuple[int, int, str]]) -> None:
+    """Рассылает записи бэкенда в листы: по событию на ячейку, чтобы версии сравнивались поячеечно"""
+    kind = ROSTER_ROW if (spreadsheet_id, title) in sheet_indexes else GROUP_SHEET
+    bus.publish_many(kind, [(cell_key(spreadsheet_id, title, row, col),
+                             {"spreadsheet": spreadsheet_id, "title": title, "row": row, "col": col,
+                              "value": value, "store": sync.store.identity})
+                            for row, col, value in cells])
+
+
+def apply_remote_write(key: str, data: dict, event: dict) -> None:
+    cell = (data["row"], data["col"], data["value"])
+    if data.get("store") != sync.store.identity:
+        sync.store.apply(data["spreadsheet"], data["title"], [cell])
+    index = sheet_indexes.get((data["spreadsheet"], data["title"]))
+    if index is not None:
+        index.update_cells([cell])
+
+
+def apply_remote_course(key: str, data: dict, event: dict) -> None:
+    courses.invalidate()
+    catalog_cache.invalidate()
+
+
+def resync() -> None:
+    """После переподключения к шине: события за время разрыва могли потеряться"""
+    courses.invalidate()
+    catalog_cache.invalidate()
+    for index in sheet_indexes.values():
+        try:
+            index.refresh()
+        except Exception as e:
+            print(f"Не удалось обновить лист {index.title}: {e}")
+
+
+sync.listeners.append(announce_write)
+bus.on(COURSE, apply_remote_course)
+bus.on(ROSTER_ROW, apply_remote_write)
+bus.on(GROUP_SHEET, apply_remote_write)
+bus.on_resync(resync)
+TRACER.exporter = exporter_from_env(os.getenv("TRACING_EXPORTER"),
+                                    os.getenv("TRACING_JSONL_PATH", "traces.jsonl"),
+                                    os.getenv("TRACING_OTLP_ENDPOINT", "http://otel-collector:4318"))
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,6 +162,91 @@ app.add_middleware(
 )
 signer = TimestampSigner(SECRET_KEY)
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.HTTP_IN_PROGRESS.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = route.path if route is not None else "unmatched"
+        metrics.HTTP_IN_PROGRESS.inc(-1)
+        metrics.HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method=request.method, route=path)
+        metrics.HTTP_REQUESTS.inc(method=request.method, route=path, status=status)
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    """Корневой спан запроса; контекст приходит от бота в заголовках traceparent и baggage"""
+    user = {k: v for k, v in parse_baggage(request.headers.get("baggage")).items() if k == "chat_id"}
+    with TRACER.trace(f"{request.method} {request.url.path}", traceparent=request.headers.get("traceparent"),
+                      method=request.method, **user) as span:
+        response = await call_next(request)
+        if span is not None:
+            route = request.scope.get("route")
+            if route is not None:
+                span.name = f"{request.method} {route.path}"
+                span.set(route=route.path, **request.path_params)
+            span.set(status=response.status_code)
+            response.headers["traceparent"] = span.traceparent
+        return response
+
+
+@metrics.REGISTRY.collector
+def collect_queue_metrics() -> None:
+    stats = sheets_scheduler.stats()
+    for priority, depth in stats["queued_by_priority"].items():
+        metrics.SHEETS_QUEUE_DEPTH.set(depth, priority=priority)
+    metrics.SHEETS_PENDING_WRITES.set(sync.size())
+    try:
+        metrics.JOB_QUEUE_DEPTH.set(jobs.depth())
+    except RedisError:
+        pass
+
+
+@app.get("/metrics")
+async def get_metrics():
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    metrics.THREADPOOL_BUSY.set(limiter.borrowed_tokens)
+    metrics.THREADPOOL_SIZE.set(limiter.total_tokens)
+    body = await run_in_threadpool(metrics.REGISTRY.render)
+    return Response(body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def get_sheets() -> LocalSheets:
+    return local_sheets
+
+
+def get_github() -> GitHubClient:
+    return github_client
+
+
+def get_configured_course(course_id: str) -> Course:
+    """Курс с прошедшей проверку конфигурацией (course.settings); иначе 404 или 400"""
+    course = courses.get(course_id)
+    if course is None:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if not course.valid:
+        raise HTTPException(status_code=400, detail=f"Некорректная конфигурация курса: {course.error}")
+    return course
+
+
+def require_admin(chat_id: int) -> dict:
+    """Пускает только чаты, привязанные к строке листа admins"""
+    try:
+        _, rec = admins.lookup("tg_chat_id", chat_id)
+    except Exception:
+        rec = None
+    if rec is None:
+        raise HTTPException(403, "access denied")
+    return rec
+
+
 class AuthRequest(BaseModel):
     login: str
     password: str
@@ -97,72 +301,63 @@ def logout(response: Response):
 
 
 @app.get("/courses")
-def get_courses():
-    courses = []
-    for index, filename in enumerate(sorted(os.listdir(COURSES_DIR)), start=1):
-        file_path = os.path.join(COURSES_DIR, filename)
-        if filename.endswith(".yaml") and os.path.isfile(file_path):
-            with open(file_path, "r", encoding="utf-8") as file:
-                try:
-                    data = yaml.safe_load(file)
-                except yaml.YAMLError as e:
-                    print(f"Ошибка при разборе YAML в {filename}: {e}")
-                    continue
-
-                if not isinstance(data, dict) or "course" not in data:
-                    print(f"Пропускаем файл {filename}: неверная структура")
-                    continue
-
-                course_info = data["course"]
-                courses.append({
-                    "id": str(index),
-                    "name": course_info.get("name", "Unknown"),
-                    "semester": course_info.get("semester", "Unknown"),
-                    "logo": course_info.get("logo", "/assets/default.png"),
-                    "email": course_info.get("email", ""),
-                })
-    return courses
+def get_courses(request: Request):
+    all_courses = courses.all()
+
+    def build():
+        result = []
+        for course in all_courses:
+            if not course.valid:
+                continue
+
+            course_info = course.info
+            result.append({
+                "id": course.id,
+                "name": course_info.get("name", "Unknown"),
+                "semester": course_info.get("semester", "Unknown"),
+                "logo": course_info.get("logo", "/assets/default.png"),
+                "email": course_info.get("email", ""),
+            })
+        return result
+
+    version = version_of([(course.id, course.filename, course.mtime) for course in all_courses])
+    return catalog_cache.respond(request, "courses", version, build)
 
 
 def parse_lab_id(lab_id: str) -> int:
-    match = re.search(r"\d+", lab_id)
-    if not match:
+    number = lab_number(lab_id)
+    if number is None:
         raise HTTPException(status_code=400, detail="Некорректный lab_id")
-    return int(match.group(0))
+    return number
 
 @app.get("/courses/{course_id}")
-def get_course(course_id: str):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+def get_course(course_id: str, request: Request):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(status_code=404, detail="Course not found")
-
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        return {
-            "id": course_id,
-            "config": filename,
-            "name": course_info.get("name", "Unknown"),
-            "semester": course_info.get("semester", "Unknown"),
-            "email": course_info.get("email", "Unknown"),
-            "github-organization": course_info.get("github", {}).get("organization", "Unknown"),
-            "google-spreadsheet": course_info.get("google", {}).get("spreadsheet", "Unknown"),
-        }
+    filename = course.filename
+
+    course_info = course.info
+    return catalog_cache.respond(request, f"courses/{course_id}", version_of(course.filename, course.mtime), lambda: {
+        "id": course_id,
+        "config": filename,
+        "name": course_info.get("name", "Unknown"),
+        "semester": course_info.get("semester", "Unknown"),
+        "email": course_info.get("email", "Unknown"),
+        "github-organization": course_info.get("github", {}).get("organization", "Unknown"),
+        "google-spreadsheet": course_info.get("google", {}).get("spreadsheet", "Unknown"),
+    })
 
 @app.delete("/courses/{course_id}")
 def delete_course(course_id: str):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(status_code=404, detail="Курс не найден")
 
-    file_path = os.path.join(COURSES_DIR, filename)
+    file_path = course.path
     if os.path.exists(file_path):
         os.remove(file_path)
+        course_changed(course.filename)
         return {"message": "Курс успешно удален"}
     else:
         raise HTTPException(status_code=404, detail="Файл курса не найден")
@@ -175,13 +370,12 @@ class EditCourseRequest(BaseModel):
 @app.get("/courses/{course_id}/edit")
 def edit_course_get(course_id: str):
     """Получить YAML содержимое курса для редактирования"""
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(status_code=404, detail="Курс не найден")
+    filename = course.filename
 
-    file_path = os.path.join(COURSES_DIR, filename)
+    file_path = course.path
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Файл курса не найден")
 
@@ -194,153 +388,89 @@ def edit_course_get(course_id: str):
 @app.put("/courses/{course_id}/edit")
 def edit_course_put(course_id: str, data: EditCourseRequest):
     """Сохранить изменения в YAML файле курса"""
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(status_code=404, detail="Курс не найден")
 
-    file_path = os.path.join(COURSES_DIR, filename)
-
+    file_path = course.path
 
     try:
-        yaml.safe_load(data.content)
+        parsed = yaml.safe_load(data.content)
     except yaml.YAMLError as e:
         raise HTTPException(status_code=400, detail=f"Ошибка в YAML формате: {str(e)}")
+    try:
+        validate_course(parsed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Конфигурация курса не прошла проверку: {e}")
 
     with open(file_path, "w", encoding="utf-8") as file:
         file.write(data.content)
+    course_changed(course.filename)
 
     return {"message": "Изменения успешно сохранены"}
 
 
 @app.get("/courses/{course_id}/groups")
-def get_course_groups(course_id: str):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=404, detail="Course not found")
-
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-        info_sheet = course_info.get("google", {}).get("info-sheet")
-
-    if not spreadsheet_id:
-        raise HTTPException(status_code=400, detail="Spreadsheet ID not found in course config")
-
-
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client = gspread.authorize(creds)
+def get_course_groups(course_id: str, request: Request, sheets: LocalSheets = Depends(get_sheets)):
+    course = get_configured_course(course_id)
+    google = course.settings.google
 
     try:
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        all_sheets = [sheet.title for sheet in spreadsheet.worksheets() 
-                      if sheet.title not in [info_sheet, "users"]]
-        
-        course_filename = [f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")][int(course_id) - 1]
-        course_name = course_filename.replace(".yaml", "")
-        course_sheets = []
-        for sheet_name in all_sheets:
-            if "_" in sheet_name:
-                group_part, course_part = sheet_name.split("_", 1)
-                if course_part == course_name:
-                    course_sheets.append(group_part)
-        
-        return course_sheets
+        titles = sheets.worksheet_titles(google.spreadsheet)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sheets: {str(e)}")
 
+    def build():
+        all_sheets = [title for title in titles if title not in [google.info_sheet, "users"]]
+        return [group for group in map(course.group_of_sheet, all_sheets) if group is not None]
 
-@app.get("/courses/{course_id}/groups/{group_id}/labs")
-def get_course_labs(course_id: str, group_id: str):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=404, detail="Course not found")
-
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-
-    if not spreadsheet_id:
-        raise HTTPException(status_code=400, detail="Missing spreadsheet ID in config")
+    version = version_of(course.filename, course.mtime, titles)
+    return catalog_cache.respond(request, f"courses/{course_id}/groups", version, build)
 
 
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client = gspread.authorize(creds)
+@app.get("/courses/{course_id}/groups/{group_id}/labs")
+def get_course_labs(course_id: str, group_id: str, request: Request, sheets: LocalSheets = Depends(get_sheets)):
+    course = get_configured_course(course_id)
 
     try:
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        
-        course_name = filename.replace(".yaml", "")
-        sheet_name = f"{group_id}_{course_name}"
-        sheet = spreadsheet.worksheet(sheet_name)
+        sheet = sheets.worksheet(course.settings.google.spreadsheet, course.group_sheet(group_id))
 
-        headers = sheet.row_values(1)[3:]
+        headers = sheets.layouts.layout(sheet).headers[3:]
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Group not found in spreadsheet: {str(e)}")
 
-    return [lab for lab in headers if lab.startswith("ЛР")]
+    # Список ЛР зависит только от строки заголовков листа
+    return catalog_cache.respond(request, f"courses/{course_id}/groups/{group_id}/labs",
+                                 version_of(course.filename, course.mtime, headers),
+                                 lambda: [lab for lab in headers if lab.startswith("ЛР")])
 
 
 @app.post("/courses/{course_id}/groups/{group_id}/register")
-def register_student(course_id: str, group_id: str, student: StudentRegistration):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=404, detail="Course not found")
-
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-        student_col = course_info.get("google", {}).get("student-name-column", 2)
-
-    if not spreadsheet_id:
-        raise HTTPException(status_code=400, detail="Spreadsheet ID not found in course config")
-
-
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client = gspread.authorize(creds)
+@with_priority("registration")
+def register_student(course_id: str, group_id: str, student: StudentRegistration,
+                     sheets: LocalSheets = Depends(get_sheets), github: GitHubClient = Depends(get_github)):
+    course = get_configured_course(course_id)
+    spreadsheet_id = course.settings.google.spreadsheet
+    student_col = course.settings.google.student_name_column
 
     try:
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        sheet = spreadsheet.worksheet(group_id)
+        sheet = sheets.worksheet(spreadsheet_id, group_id)
     except Exception:
         raise HTTPException(status_code=404, detail="Group not found in spreadsheet")
 
     full_name = f"{student.surname} {student.name} {student.patronymic}".strip()
 
-
-    student_list = sheet.col_values(student_col)[2:]
-
-    if full_name not in student_list:
+    row_idx = sheets.layouts.find_row(sheet, student_col, full_name, first_row=3)
+    if row_idx is None:
         raise HTTPException(status_code=406, detail={"message": "Студент не найден"})
 
-    row_idx = student_list.index(full_name) + 3
-
-
-    header_row = sheet.row_values(1)
-    try:
-        github_col_idx = header_row.index("GitHub") + 1
-    except ValueError:
+    github_col_idx = sheets.layouts.layout(sheet).github_col
+    if github_col_idx is None:
         raise HTTPException(status_code=400, detail="Столбец 'GitHub' не найден в таблице")
 
 
     try:
-        github_response = requests.get(f"https://api.github.com/users/{student.github}")
+        github_response = github.get(f"/users/{student.github}", timeout=course.requests_timeout)
         if github_response.status_code != 200:
             raise HTTPException(status_code=404, detail={"message": "Пользователь GitHub не найден"})
     except Exception:
@@ -349,7 +479,7 @@ def register_student(course_id: str, group_id: str, student: StudentRegistration
     existing_github = sheet.cell(row_idx, github_col_idx).value
 
     if not existing_github:
-        sheet.update_cell(row_idx, github_col_idx, student.github)
+        sync.update_cell(sheet, row_idx, github_col_idx, student.github)
         return {"status": "registered", "message": "Аккаунт GitHub успешно задан"}
 
     if existing_github == student.github:
@@ -376,133 +506,206 @@ class GradeRequest(BaseModel):
 class ChatRegistrationRequest(BaseModel):
     chat_id: int
 
+
+def deduplicated(key: tuple, idempotency_key: str | None, response: Response, run) -> dict:
+    """Одна обработка на одинаковые запросы.
+
+    Одновременные запросы с тем же `key` ждут первый и получают его ответ;
+    повтор с тем же заголовком Idempotency-Key получает сохраненный ответ.
+    `run()` возвращает (HTTP-статус, тело).
+    """
+    def execute() -> tuple[int, dict]:
+        try:
+            return in_flight.do(key, run)
+        except HTTPException as e:
+            return e.status_code, {"detail": e.detail}
+
+    if idempotency_key:
+        try:
+            status, body, replayed = idempotency.run(idempotency_key, "/".join(map(str, key)), execute)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        if replayed:
+            response.headers["Idempotent-Replayed"] = "true"
+    else:
+        status, body = execute()
+    if status >= 400:
+        raise HTTPException(status_code=status, detail=body["detail"])
+    response.status_code = status
+    return body
+
+
 @app.post("/courses/{course_id}/groups/{group_id}/labs/{lab_id}/grade")
-def grade_lab(course_id: str, group_id: str, lab_id: str, request: GradeRequest):
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=404, detail="Course not found")
+def grade_lab(course_id: str, group_id: str, lab_id: str, request: GradeRequest, response: Response,
+              idempotency_key: str | None = Header(None, max_length=200),
+              sheets: LocalSheets = Depends(get_sheets), github: GitHubClient = Depends(get_github)):
+    """Ставит проверку в очередь и сразу возвращает job_id; статус — GET /jobs/{job_id}"""
+    course = get_configured_course(course_id)
+    lab_key = normalize_lab_id(lab_id)
+    key = ("grade", course.stem, group_id, lab_key, request.github.lower())
+
+    def run() -> tuple[int, dict]:
+        precomputed = webhook_grade(course.stem, lab_key, request.github)
+        if precomputed is not None and precomputed["written"]:
+            return 200, grade_response(precomputed["ci"])
+
+        payload = {"course_id": course_id, "group_id": group_id, "lab_id": lab_id, "username": request.github}
+        try:
+            job_id = jobs.enqueue("grade", payload, traceparent=TRACER.traceparent(), dedup_key="/".join(key[1:]))
+        except RedisError as e:
+            print(f"Очередь задач недоступна, проверка выполняется в запросе: {e}")
+            return 200, run_grade(**payload, sheets=sheets, github=github)
+        return 202, {"status": "queued", "job_id": job_id, "message": "Проверка поставлена в очередь ⏳"}
+
+    return deduplicated(key, idempotency_key, response, run)
 
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        org = course_info.get("github", {}).get("organization")
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-        student_col = course_info.get("google", {}).get("student-name-column", 2)
-        lab_offset = course_info.get("google", {}).get("lab-column-offset", 1)
-
-    labs = course_info.get("labs", {})
-    normalized_lab_id = normalize_lab_id(lab_id)
-    lab_config = labs.get(normalized_lab_id, {})
-    repo_prefix = lab_config.get("github-prefix")
 
-    if not all([org, spreadsheet_id, repo_prefix]):
+def webhook_grade(course_stem: str, lab_key: str, username: str) -> dict | None:
+    """Результат CI, полученный по проверенному вебхуку.
+
+    Без GITHUB_WEBHOOK_SECRET вебхуки не принимаются и никто не сбросит
+    сохраненный результат после нового push, поэтому ему не доверяем.
+    """
+    if not GITHUB_WEBHOOK_SECRET:
+        return None
+    return grades.get(course_stem, lab_key, username)
+
+
+@with_priority("grade")
+def run_grade(course_id: str, group_id: str, lab_id: str, username: str,
+              sheets: LocalSheets = local_sheets, github: GitHubClient = github_client) -> dict:
+    course = get_configured_course(course_id)
+    settings = course.settings
+    org = settings.github.organization
+    spreadsheet_id = settings.google.spreadsheet
+    lab_offset = settings.google.lab_column_offset
+
+    normalized_lab_id = normalize_lab_id(lab_id)
+    lab = settings.lab(normalized_lab_id)
+    if lab is None:
         raise HTTPException(status_code=400, detail="Missing course configuration")
 
-    username = request.github
-    repo_name = f"{repo_prefix}-{username}"
-    headers = {
-        "Authorization": f"Bearer {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github+json"
-    }
+    repo_name = f"{lab[2].github_prefix}-{username}"
 
+    precomputed = webhook_grade(course.stem, normalized_lab_id, username)
+    if precomputed is not None and precomputed["written"]:
+        return grade_response(precomputed["ci"])
 
-    workflows_url = f"https://api.github.com/repos/{org}/{repo_name}/contents/.github/workflows"
-    workflows_resp = requests.get(workflows_url, headers=headers)
-    
-    if workflows_resp.status_code != 200:
-        final_result = "✓"
-        result_string = "CI не настроен - автоматически засчитано"
-        summary = ["✅ CI не настроен - работа принята автоматически"]
+    if precomputed is not None:
+        ci = precomputed["ci"]
     else:
-        commits_url = f"https://api.github.com/repos/{org}/{repo_name}/commits"
-        commits_resp = requests.get(commits_url, headers=headers)
-        if commits_resp.status_code != 200 or not commits_resp.json():
-            raise HTTPException(status_code=404, detail="Нет коммитов в репозитории")
-
-        latest_sha = commits_resp.json()[0]["sha"]
-
-        check_url = f"https://api.github.com/repos/{org}/{repo_name}/commits/{latest_sha}/check-runs"
-        check_resp = requests.get(check_url, headers=headers)
-        if check_resp.status_code != 200:
-            raise HTTPException(status_code=404, detail="Проверки CI не найдены")
-
-        check_runs = check_resp.json().get("check_runs", [])
-        if not check_runs:
-            return {"status": "pending", "message": "Нет активных CI-проверок ⏳"}
-
-        summary = []
-        passed_count = 0
-
-        for check in check_runs:
-            name = check.get("name", "Unnamed check")
-            conclusion = check.get("conclusion")
-            html_url = check.get("html_url")
-            if conclusion == "success":
-                emoji = "✅"
-                passed_count += 1
-            elif conclusion == "failure":
-                emoji = "❌"
-            else:
-                emoji = "⏳"
-            summary.append(f"{emoji} {name} — {html_url}")
-
-        total_checks = len(check_runs)
-        result_string = f"{passed_count}/{total_checks} тестов пройдено"
-
-        final_result = "✓" if passed_count == total_checks else "✗"
-
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    client = gspread.authorize(creds)
+        ci = fetch_ci_status(github, org, repo_name, course.requests_timeout, backend=GITHUB_CI_BACKEND)
+    if ci["status"] == "pending":
+        return {"status": ci["status"], "message": ci["message"]}
 
-    try:
-        course_name = filename.replace(".yaml", "")
-        sheet_name = f"{group_id}_{course_name}"
-        sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-    except Exception:
-        raise HTTPException(status_code=404, detail="Группа не найдена в Google Таблице")
+    write_grade(sheets, sync, spreadsheet_id, f"{group_id}_{course.stem}", username,
+                parse_lab_id(lab_id), lab_offset, ci["result"])
+    if precomputed is not None:
+        # Результат пришел из вебхука — отмечаем, что он уже записан; свои проверки не сохраняем
+        grades.put(course.stem, normalized_lab_id, username, ci, written=True)
 
-    header_row = sheet.row_values(1)
-    
-    id_values = sheet.col_values(1)[1:]
-    
+    return grade_response(ci)
+
+
+JOB_HANDLERS = {"grade": run_grade}
+
+
+def run_job(job: dict) -> None:
+    """Выполняет задачу из очереди и сохраняет результат или ошибку"""
+    handler = JOB_HANDLERS.get(job["kind"])
     try:
-        github_col_idx = header_row.index("GitHub") + 1
-    except ValueError:
-        raise HTTPException(status_code=400, detail="Столбец 'GitHub' не найден")
-    
-    github_values = sheet.col_values(github_col_idx)[1:]
-    if username not in github_values:
-        raise HTTPException(status_code=404, detail="GitHub логин не найден в таблице. Зарегистрируйтесь.")
+        if handler is None:
+            raise HTTPException(status_code=400, detail=f"Неизвестный тип задачи: {job['kind']}")
+        with TRACER.trace(f"job.{job['kind']}", traceparent=job.get("traceparent"), kind="consumer",
+                          job_id=job["id"], **job["payload"]):
+            result = handler(**job["payload"])
+    except HTTPException as e:
+        jobs.fail(job["id"], e.status_code, str(e.detail))
+        return
+    except Exception as e:
+        print(f"Ошибка выполнения задачи {job['id']}: {e}")
+        jobs.fail(job["id"], 500, "Внутренняя ошибка при проверке")
+        return
+    jobs.complete(job["id"], result)
 
-    lab_number = parse_lab_id(lab_id)
-    row_idx = github_values.index(username) + 2
-    
-    headers = sheet.row_values(1)
-    lab_header = f"ЛР{lab_number}"
-    
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
     try:
-        lab_col = headers.index(lab_header) + 1
-        print(f"[DEBUG] Lab {lab_id} (header '{lab_header}') for {username}: row {row_idx}, col {lab_col}")
-    except ValueError:
-        print(f"[DEBUG] Lab header '{lab_header}' not found in headers: {headers}")
-        lab_col = github_col_idx + lab_offset + lab_number
-        print(f"[DEBUG] Using fallback: row {row_idx}, col {lab_col}")
-    
-    sheet.update_cell(row_idx, lab_col, final_result)
+        job = jobs.get(job_id)
+    except RedisError:
+        raise HTTPException(status_code=503, detail="Очередь задач недоступна")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    fields = ("id", "kind", "status", "result", "error", "created_at", "started_at", "finished_at")
+    return {field: job[field] for field in fields if field in job}
+
+
+@with_priority("grade")
+def precompute_grade(course_id: str, lab_key: str, username: str) -> None:
+    """Пересчитывает CI по вебхуку и, если студент есть в реестре, ставит оценку в очередь записи"""
+    course = courses.get(course_id)
+    if course is None or not course.valid:
+        return
+    settings = course.settings
+    org = settings.github.organization
+    spreadsheet_id = settings.google.spreadsheet
+    lab_offset = settings.google.lab_column_offset
+    repo_name = f"{settings.labs[lab_key].github_prefix}-{username}"
 
-    return {
-        "status": "updated",
-        "result": final_result,
-        "message": f"{'✅ Все проверки пройдены' if final_result == '✓' else '❌ Обнаружены ошибки'}",
-        "passed": result_string,
-        "checks": summary
-    }
+    try:
+        ci = fetch_ci_status(github_client, org, repo_name, course.requests_timeout, backend=GITHUB_CI_BACKEND)
+    except HTTPException as e:
+        print(f"Вебхук: не удалось получить CI для {org}/{repo_name}: {e.detail}")
+        return
+    if ci["status"] == "pending" or ci.get("running"):
+        return
+
+    grades.put(course.stem, lab_key, username, ci)
+    try:
+        _, rec = roster.lookup("github", username)
+    except Exception:
+        rec = None
+    if rec is None or not rec.get("group"):
+        return
+    try:
+        write_grade(local_sheets, sync, spreadsheet_id, f"{rec['group']}_{course.stem}", username,
+                    parse_lab_id(lab_key), lab_offset, ci["result"])
+    except HTTPException as e:
+        print(f"Вебхук: оценка {username} за {lab_key} не записана: {e.detail}")
+        return
+    grades.put(course.stem, lab_key, username, ci, written=True)
+
+
+@app.post("/github/webhook")
+async def github_webhook(request: Request, background_tasks: BackgroundTasks):
+    if not GITHUB_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Вебхуки не настроены")
+    body = await request.body()
+    if not verify_signature(GITHUB_WEBHOOK_SECRET, body, request.headers.get("X-Hub-Signature-256")):
+        raise HTTPException(status_code=401, detail="Неверная подпись")
+
+    event = request.headers.get("X-GitHub-Event", "")
+    if event == "ping":
+        return {"status": "pong"}
+    if event != "push" and event not in CI_EVENTS:
+        return {"status": "ignored"}
 
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректное тело запроса")
+    resolved = resolve_repository(courses, (payload.get("repository") or {}).get("full_name", ""))
+    if resolved is None:
+        return {"status": "ignored"}
+    course, lab_key, username = resolved
 
+    # Новый push или перезапуск проверок делает сохраненный результат устаревшим
+    grades.invalidate(course.stem, lab_key, username)
+    if event in CI_EVENTS and payload.get("action") == "completed":
+        background_tasks.add_task(precompute_grade, course.id, lab_key, username)
+        return {"status": "scheduled"}
+    return {"status": "invalidated"}
 
 
 @app.post("/courses/upload")
@@ -516,12 +719,17 @@ async def upload_course(file: UploadFile = File(...)):
 
     content = await file.read()
     try:
-        yaml.safe_load(content)
+        parsed = yaml.safe_load(content)
     except yaml.YAMLError as e:
         raise HTTPException(status_code=400, detail="Некорректный YAML файл")
+    try:
+        validate_course(parsed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Конфигурация курса не прошла проверку: {e}")
 
     with open(file_location, "wb") as f:
         f.write(content)
+    course_changed(file.filename)
 
     return {"detail": "Курс успешно загружен"}
 
@@ -539,23 +747,15 @@ class AdminCodeLogin(BaseModel):
     code: str
 
 @app.post("/auth/code/login")
-def code_login(body: CodeLogin):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
+@with_priority("registration")
+def code_login(body: CodeLogin, sheets: LocalSheets = Depends(get_sheets)):
+    ws = sheets.worksheet(SPREADSHEET_ID, CODES_SHEET)
 
-    header = [h.strip() for h in ws.row_values(1)]
-    try:
-        chat_col_idx = header.index("tg_chat_id") + 1
-    except ValueError:
+    chat_col_idx = roster.column("tg_chat_id")
+    if chat_col_idx is None:
         raise HTTPException(500, "column tg_chat_id not found")
 
-    records = ws.get_all_records()
-    row_i, rec = next(
-        ((i, r) for i, r in enumerate(records, start=2)
-         if str(r["code"]).strip() == body.code),
-        (None, None),
-    )
+    row_i, rec = roster.lookup("code", body.code, refresh_on_miss=True)
     if rec is None:
         raise HTTPException(401, "invalid code")
 
@@ -566,7 +766,8 @@ def code_login(body: CodeLogin):
     is_new_chat_id = not code_owner
     
     if is_new_chat_id:
-        ws.update_cell(row_i, chat_col_idx, str(body.chat_id))
+        sync.update_cell(ws, row_i, chat_col_idx, body.chat_id)
+        roster.update(row_i, "tg_chat_id", body.chat_id)
 
     github_value = str(rec.get("github", "")).strip()
     
@@ -578,27 +779,20 @@ def code_login(body: CodeLogin):
     }
 
 @app.post("/auth/github/update")
-def update_github(body: GitHubUpdate):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
+@with_priority("registration")
+def update_github(body: GitHubUpdate, sheets: LocalSheets = Depends(get_sheets)):
+    ws = sheets.worksheet(SPREADSHEET_ID, CODES_SHEET)
 
-    header = [h.strip() for h in ws.row_values(1)]
-    try:
-        github_col_idx = header.index("github") + 1
-    except ValueError:
+    github_col_idx = roster.column("github")
+    if github_col_idx is None:
         raise HTTPException(500, "column github not found")
 
-    records = ws.get_all_records()
-    row_i, rec = next(
-        ((i, r) for i, r in enumerate(records, start=2)
-         if str(r.get("tg_chat_id")) == str(body.chat_id)),
-        (None, None),
-    )
+    row_i, rec = roster.lookup("tg_chat_id", body.chat_id)
     if rec is None:
         raise HTTPException(404, "user not found")
 
-    ws.update_cell(row_i, github_col_idx, body.github)
+    sync.update_cell(ws, row_i, github_col_idx, body.github)
+    roster.update(row_i, "github", body.github)
 
     return {
         "ok": True,
@@ -606,23 +800,15 @@ def update_github(body: GitHubUpdate):
     }
 
 @app.post("/auth/admin/code/login")
-def admin_code_login(body: AdminCodeLogin):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
+@with_priority("registration")
+def admin_code_login(body: AdminCodeLogin, sheets: LocalSheets = Depends(get_sheets)):
+    ws = sheets.worksheet(SPREADSHEET_ID, ADMINS_SHEET)
 
-    header = [h.strip() for h in ws.row_values(1)]
-    try:
-        chat_col_idx = header.index("tg_chat_id") + 1
-    except ValueError:
+    chat_col_idx = admins.column("tg_chat_id")
+    if chat_col_idx is None:
         raise HTTPException(500, "column tg_chat_id not found in admins sheet")
 
-    records = ws.get_all_records()
-    row_i, rec = next(
-        ((i, r) for i, r in enumerate(records, start=2)
-         if str(r["code"]).strip() == body.code),
-        (None, None),
-    )
+    row_i, rec = admins.lookup("code", body.code, refresh_on_miss=True)
     if rec is None:
         raise HTTPException(401, "invalid admin code")
 
@@ -631,7 +817,8 @@ def admin_code_login(body: AdminCodeLogin):
         raise HTTPException(401, "admin code bound to another chat")
 
     if not code_owner:
-        ws.update_cell(row_i, chat_col_idx, str(body.chat_id))
+        sync.update_cell(ws, row_i, chat_col_idx, body.chat_id)
+        admins.update(row_i, "tg_chat_id", body.chat_id)
 
     return {
         "ok": True,
@@ -640,68 +827,29 @@ def admin_code_login(body: AdminCodeLogin):
     }
 
 @app.get("/admin/courses")
-def get_admin_courses(chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-    except Exception:
-        raise HTTPException(403, "access denied")
+def get_admin_courses(admin: dict = Depends(require_admin)):
+    result = []
+    for course in courses.all():
+        if not course.valid:
+            continue
 
-    courses = []
-    for index, filename in enumerate(sorted(os.listdir(COURSES_DIR)), start=1):
-        file_path = os.path.join(COURSES_DIR, filename)
-        if filename.endswith(".yaml") and os.path.isfile(file_path):
-            with open(file_path, "r", encoding="utf-8") as file:
-                try:
-                    data = yaml.safe_load(file)
-                except yaml.YAMLError as e:
-                    continue
-
-                if not isinstance(data, dict) or "course" not in data:
-                    continue
-
-                course_info = data["course"]
-                courses.append({
-                    "id": str(index),
-                    "filename": filename,
-                    "name": course_info.get("name", "Unknown"),
-                    "semester": course_info.get("semester", "Unknown"),
-                })
-    return courses
+        course_info = course.info
+        result.append({
+            "id": course.id,
+            "filename": course.filename,
+            "name": course_info.get("name", "Unknown"),
+            "semester": course_info.get("semester", "Unknown"),
+        })
+    return result
 
 @app.get("/admin/courses/{course_id}/yaml")
-def get_course_yaml(course_id: str, chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-    except Exception:
-        raise HTTPException(403, "access denied")
-
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+def get_course_yaml(course_id: str, admin: dict = Depends(require_admin)):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(404, detail="Course not found")
+    filename = course.filename
 
-    file_path = os.path.join(COURSES_DIR, filename)
+    file_path = course.path
     if not os.path.exists(file_path):
         raise HTTPException(404, detail="Course file not found")
 
@@ -711,183 +859,134 @@ def get_course_yaml(course_id: str, chat_id: int):
     return {"filename": filename, "content": content}
 
 @app.delete("/admin/courses/{course_id}")
-def delete_course_admin(course_id: str, chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-    except Exception:
-        raise HTTPException(403, "access denied")
-
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
+def delete_course_admin(course_id: str, admin: dict = Depends(require_admin)):
+    course = courses.get(course_id)
+    if course is None:
         raise HTTPException(status_code=404, detail="Курс не найден")
+    filename = course.filename
 
-    file_path = os.path.join(COURSES_DIR, filename)
+    file_path = course.path
     if os.path.exists(file_path):
         os.remove(file_path)
+        course_changed(filename)
         return {"message": f"Курс {filename} успешно удален"}
     else:
         raise HTTPException(status_code=404, detail="Файл курса не найден")
 
 @app.get("/admin/check-chat/{chat_id}")
-def check_admin_chat(chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-        
-        return {"is_admin": True, "admin_name": rec.get("name", "администратор")}
-    except Exception:
-        raise HTTPException(403, "access denied")
+def check_admin_chat(admin: dict = Depends(require_admin)):
+    return {"is_admin": True, "admin_name": admin.get("name", "администратор")}
 
 @app.post("/auth/admin/logout")
 def admin_logout(body: AdminCodeLogin):
     return {"message": "Выход выполнен"}
 
 @app.get("/admin/courses/{course_id}/groups")
-def get_course_groups_admin(course_id: str, chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-    except Exception:
-        raise HTTPException(403, "access denied")
+@with_priority("admin")
+def get_course_groups_admin(course_id: str, admin: dict = Depends(require_admin), sheets: LocalSheets = Depends(get_sheets)):
+    course = get_configured_course(course_id)
 
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
     try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(404, detail="Course not found")
+        return group_sheets(sheets, course)
+    except Exception as e:
+        raise HTTPException(500, detail=f"Failed to fetch groups: {str(e)}")
 
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-        info_sheet = course_info.get("google", {}).get("info-sheet")
 
-    if not spreadsheet_id:
-        raise HTTPException(400, detail="Spreadsheet ID not found in course config")
+def group_sheets(sheets: LocalSheets, course: Course) -> list[dict]:
+    """Листы групп курса вида {group}_{course}: [{"group_id", "sheet_name"}]"""
+    google = course.settings.google
+    all_sheets = [title for title in sheets.worksheet_titles(google.spreadsheet)
+                  if title not in [google.info_sheet, "users", "admins"]]
 
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    course_creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    course_client = gspread.authorize(course_creds)
+    course_groups = []
+    for sheet_name in all_sheets:
+        group_id = course.group_of_sheet(sheet_name)
+        if group_id is not None:
+            course_groups.append({
+                "group_id": group_id,
+                "sheet_name": sheet_name
+            })
+    return course_groups
 
-    try:
-        spreadsheet = course_client.open_by_key(spreadsheet_id)
-        all_sheets = [sheet.title for sheet in spreadsheet.worksheets() 
-                      if sheet.title not in [info_sheet, "users", "admins"]]
-        
-        course_filename = filename.replace(".yaml", "")
-        course_groups = []
-        for sheet_name in all_sheets:
-            if "_" in sheet_name:
-                group_part, course_part = sheet_name.split("_", 1)
-                if course_part == course_filename:
-                    course_groups.append({
-                        "group_id": group_part,
-                        "sheet_name": sheet_name
-                    })
-        
-        return course_groups
-    except Exception as e:
-        raise HTTPException(500, detail=f"Failed to fetch groups: {str(e)}")
 
-@app.get("/admin/courses/{course_id}/groups/{group_id}/results")
-def get_group_results_admin(course_id: str, group_id: str, chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    try:
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(ADMINS_SHEET)
-        
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
-        if rec is None:
-            raise HTTPException(403, "access denied - not an admin")
-    except Exception:
-        raise HTTPException(403, "access denied")
+EXPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv; charset=utf-8"),
+    "xlsx": (stream_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
 
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(404, detail="Course not found")
 
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
+@app.get("/admin/courses/{course_id}/export")
+@with_priority("admin")
+def export_course_admin(course_id: str, format: str = "csv", admin: dict = Depends(require_admin),
+                        sheets: LocalSheets = Depends(get_sheets)):
+    """Результаты всех групп курса одним файлом (csv или xlsx), отдается потоком"""
+    course = get_configured_course(course_id)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, detail=f"Неизвестный формат: {format}, доступны: {', '.join(EXPORT_FORMATS)}")
 
-    if not spreadsheet_id:
-        raise HTTPException(400, detail="Spreadsheet ID not found")
+    settings = course.settings
+    try:
+        groups = group_sheets(sheets, course)
+        # Листы, которых еще нет в локальном хранилище, читаются одним values_batch_get
+        worksheets = sheets.worksheets(settings.google.spreadsheet, [group["sheet_name"] for group in groups])
+    except Exception as e:
+        raise HTTPException(500, detail=f"Failed to fetch groups: {str(e)}")
+
+    rows = course_rows([(group["group_id"], ws) for group, ws in zip(groups, worksheets)], sheets.layouts,
+                       list(settings.labs), settings.google.lab_column_offset)
+    stream, media_type = EXPORT_FORMATS[format]
+    filename = f"{course.stem}.{format}"
+    return StreamingResponse(stream(rows), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    course_creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE, scope)
-    course_client = gspread.authorize(course_creds)
+@app.get("/admin/courses/{course_id}/groups/{group_id}/results")
+@with_priority("admin")
+def get_group_results_admin(course_id: str, group_id: str, columns: str | None = None,
+                            filters: list[str] = Query([], alias="filter"), cursor: str | None = None,
+                            limit: int | None = Query(None, ge=1, le=500),
+                            admin: dict = Depends(require_admin), sheets: LocalSheets = Depends(get_sheets)):
+    """Результаты группы, постранично — если передан limit.
+
+    columns — список столбцов через запятую ("ФИО,GitHub,ЛР*"), filter —
+    условия "Столбец=значение" или "Столбец!=значение", cursor — значение
+    next_cursor из предыдущего ответа. Без limit возвращаются все строки.
+    """
+    course = get_configured_course(course_id)
 
     try:
-        course_name = filename.replace(".yaml", "")
-        sheet_name = f"{group_id}_{course_name}"
-        sheet = course_client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-        
-        all_data = sheet.get_all_values()
-        if not all_data:
-            return {"headers": [], "rows": []}
-        
-        headers = all_data[0]
-        rows = all_data[1:]
-        
-        return {
-            "headers": headers,
-            "rows": rows,
-            "course_name": course_info.get("name", "Unknown"),
-            "group_id": group_id
-        }
+        sheet = sheets.worksheet(course.settings.google.spreadsheet, course.group_sheet(group_id))
     except Exception as e:
         raise HTTPException(404, detail=f"Group results not found: {str(e)}")
 
+    page = query_results(sheet, columns, filters, cursor, limit)
+    return {
+        **page,
+        "course_name": course.settings.name,
+        "group_id": group_id
+    }
+
+@app.post("/admin/courses/{course_id}/groups/{group_id}/labs/{lab_id}/grade")
+@with_priority("grade")
+def grade_group_admin(course_id: str, group_id: str, lab_id: str, admin: dict = Depends(require_admin),
+                      sheets: LocalSheets = Depends(get_sheets), github: GitHubClient = Depends(get_github)):
+    """Перепроверяет ЛР у всех студентов группы"""
+    course = get_configured_course(course_id)
+    return grade_group(sheets, sync, github, course, group_id, normalize_lab_id(lab_id), parse_lab_id(lab_id),
+                       concurrency=GROUP_GRADING_CONCURRENCY, backend=GITHUB_CI_BACKEND)
+
+@app.get("/admin/sheets/queue")
+def sheets_queue_admin(admin: dict = Depends(require_admin)):
+    """Состояние планировщика запросов к Google Sheets"""
+    return {**sheets_scheduler.stats(), "pending_writes": sync.size()}
+
+@app.get("/admin/sheets/conflicts")
+def sheets_conflicts_admin(limit: int = 100, admin: dict = Depends(require_admin)):
+    """Последние конфликты синхронизации: ячейки, измененные и бэкендом, и в таблице"""
+    return sync.store.conflicts(limit)
+
 @app.get("/labs/by-chat/{chat_id}")
 def labs_for_chat(chat_id: int):
-    creds  = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws     = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
-
-    rec = next(
-        (r for r in ws.get_all_records()
-         if str(r.get("tg_chat_id")) == str(chat_id)),
-        None,
-    )
+    _, rec = roster.lookup("tg_chat_id", chat_id)
     if rec is None:
         raise HTTPException(404, "student not found")
 
@@ -898,42 +997,31 @@ def labs_for_chat(chat_id: int):
     result = []
     
     for course_id in allowed_course_ids:
-        try:
-            with open(f"courses/{course_id}.yaml", encoding="utf-8") as f:
-                course_yaml = yaml.safe_load(f)
-
-            course_block = course_yaml.get("course", {})
-            labs_dict    = course_block.get("labs", {})
-
-            for key, cfg in labs_dict.items():
-                if "groups" in cfg and group not in cfg["groups"]:
-                    continue
-
-                result.append(
-                    {
-                        "key":        key,
-                        "title":      cfg.get("short-name", key),
-                        "deadline":   cfg.get("deadline"),
-                        "repo_prefix": cfg["github-prefix"],
-                        "course_name": course_block.get("name", course_id),
-                    }
-                )
-        except FileNotFoundError:
+        course = courses.by_stem(course_id)
+        if course is None or not course.valid:
             continue
 
+        settings = course.settings
+        for key, lab in settings.labs.items():
+            lab_groups = getattr(lab, "groups", None)
+            if lab_groups is not None and group not in lab_groups:
+                continue
+
+            result.append(
+                {
+                    "key":        key,
+                    "title":      lab.short_name or key,
+                    "deadline":   getattr(lab, "deadline", None),
+                    "repo_prefix": lab.github_prefix,
+                    "course_name": settings.name,
+                }
+            )
+
     return {"labs": result}
 
 @app.get("/courses/by-chat/{chat_id}")
-def courses_for_chat(chat_id: int):
-    creds  = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws     = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
-
-    rec = next(
-        (r for r in ws.get_all_records()
-         if str(r.get("tg_chat_id")) == str(chat_id)),
-        None,
-    )
+def courses_for_chat(chat_id: int, sheets: LocalSheets = Depends(get_sheets)):
+    _, rec = roster.lookup("tg_chat_id", chat_id)
     if rec is None:
         raise HTTPException(404, "student not found")
 
@@ -941,65 +1029,48 @@ def courses_for_chat(chat_id: int):
     course_ids_str = rec.get("course_id", "")
     allowed_course_ids = [cid.strip() for cid in course_ids_str.split(",") if cid.strip()]
     
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    
     result = []
-    for i, filename in enumerate(files):
-        course_filename = filename.replace(".yaml", "")
-        if allowed_course_ids and course_filename not in allowed_course_ids:
+    for course in courses.all():
+        if allowed_course_ids and course.stem not in allowed_course_ids:
+            continue
+        if not course.valid:
             continue
-            
-        file_path = os.path.join(COURSES_DIR, filename)
-        with open(file_path, "r", encoding="utf-8") as file:
-            data = yaml.safe_load(file)
-            course_info = data.get("course", {})
-            
-            spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
-            if spreadsheet_id:
-                try:
-                    course_client = gspread.authorize(creds)
-                    spreadsheet = course_client.open_by_key(spreadsheet_id)
-                except (PermissionError, Exception) as e:
-                    print(f"Ошибка доступа к Google Sheets для курса {filename}: {e}")
-                    continue
-                
-                worksheet_names = [ws.title for ws in spreadsheet.worksheets()]
-                info_sheet = course_info.get("google", {}).get("info-sheet", "График")
-                
-                course_name = filename.replace(".yaml", "")
-                
-                available_groups = []
-                for sheet_name in worksheet_names:
-                    if sheet_name not in [info_sheet, "users"] and "_" in sheet_name:
-                        group_part, course_part = sheet_name.split("_", 1)
-                        if course_part == course_name:
-                            available_groups.append(group_part)
-                
-                if student_group in available_groups:
-                    result.append({
-                        "id": str(i + 1),
-                        "name": course_info.get("name", "Unnamed Course"),
-                        "semester": course_info.get("semester", ""),
-                        "logo": course_info.get("logo", "/assets/default.png"),
-                        "email": course_info.get("email", "")
-                    })
+
+        settings = course.settings
+        try:
+            worksheet_names = sheets.worksheet_titles(settings.google.spreadsheet)
+        except (PermissionError, Exception) as e:
+            print(f"Ошибка доступа к Google Sheets для курса {course.filename}: {e}")
+            continue
+
+        info_sheet = settings.google.info_sheet or "График"
+        available_groups = {course.group_of_sheet(sheet_name) for sheet_name in worksheet_names
+                            if sheet_name not in [info_sheet, "users"]}
+
+        if student_group in available_groups:
+            result.append({
+                "id": course.id,
+                "name": settings.name,
+                "semester": settings.semester or "",
+                "logo": settings.logo or "/assets/default.png",
+                "email": settings.email or ""
+            })
     
     return result
 
 @app.post("/courses/{course_id}/groups/{group_id}/register-by-chat")
-def register_student_by_chat(course_id: str, group_id: str, request: ChatRegistrationRequest):
-    chat_id = request.chat_id
-    
+@with_priority("registration")
+def register_student_by_chat(course_id: str, group_id: str, request: ChatRegistrationRequest, response: Response,
+                             idempotency_key: str | None = Header(None, max_length=200),
+                             sheets: LocalSheets = Depends(get_sheets)):
+    key = ("register", course_id, group_id, request.chat_id)
+    return deduplicated(key, idempotency_key, response,
+                        lambda: (200, register_by_chat(course_id, group_id, request.chat_id, sheets)))
+
+
+def register_by_chat(course_id: str, group_id: str, chat_id: int, sheets: LocalSheets) -> dict:
     try:
-        creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-        client = gspread.authorize(creds)
-        ws = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
-
-        rec = next(
-            (r for r in ws.get_all_records()
-             if str(r.get("tg_chat_id")) == str(chat_id)),
-            None,
-        )
+        _, rec = roster.lookup("tg_chat_id", chat_id)
         if rec is None:
             raise HTTPException(404, "Student not found")
 
@@ -1028,87 +1099,52 @@ def register_student_by_chat(course_id: str, group_id: str, request: ChatRegistr
         "github": github
     }
     
-    files = sorted([f for f in os.listdir(COURSES_DIR) if f.endswith(".yaml")])
-    try:
-        filename = files[int(course_id) - 1]
-    except (IndexError, ValueError):
-        raise HTTPException(status_code=404, detail="Course not found")
-
-    file_path = os.path.join(COURSES_DIR, filename)
-    with open(file_path, "r", encoding="utf-8") as file:
-        data = yaml.safe_load(file)
-        course_info = data.get("course", {})
-        spreadsheet_id = course_info.get("google", {}).get("spreadsheet")
+    course = get_configured_course(course_id)
+    sheet_name = course.group_sheet(group_id)
 
-    if not spreadsheet_id:
-        raise HTTPException(status_code=400, detail="Spreadsheet ID not found")
-
-    course_client = gspread.authorize(creds)
-    course_spreadsheet = course_client.open_by_key(spreadsheet_id)
-    
-    course_name = filename.replace(".yaml", "")
-    sheet_name = f"{group_id}_{course_name}"
-    
     try:
-        group_ws = course_spreadsheet.worksheet(sheet_name)
+        group_ws = sheets.worksheet(course.settings.google.spreadsheet, sheet_name)
     except:
         raise HTTPException(status_code=404, detail=f"Group sheet {sheet_name} not found")
 
-    all_records = group_ws.get_all_records()
-    
-    existing_student = None
-    for i, record in enumerate(all_records):
-        student_col_value = str(record.get("Студент", "")).strip()
-        if student_col_value.lower() == student_name.lower():
-            existing_student = (i + 3, record)
-            break
-
-    if existing_student:
-        row_num, existing_record = existing_student
-        existing_github = str(existing_record.get("GitHub", "")).strip()
-        
-        if existing_github and existing_github != github:
-            return {"status": "conflict", "message": "Student registered with different GitHub"}
-        elif not existing_github:
-            group_ws.update_cell(row_num, 3, github)
-        
-        group_ws.update_cell(row_num, 1, str(chat_id))
-        
-        return {"status": "updated" if not existing_github else "already_registered", "github": github}
-    else:
+    owner = student_name.strip().lower()
+    with sheets.sync.exclusive():
         all_data = group_ws.get_all_values()
-        next_row = None
-        
-        for i in range(2, len(all_data) + 10):
-            try:
-                row_data = group_ws.row_values(i)
-                if not row_data or all(not cell.strip() for cell in row_data if cell):
-                    next_row = i
+        header = [h.strip() for h in all_data[0]] if all_data else []
+        student_idx = header.index("Студент") if "Студент" in header else None
+        github_idx = header.index("GitHub") if "GitHub" in header else None
+
+        existing_student = None
+        if student_idx is not None:
+            for row_num, row_data in enumerate(all_data[1:], start=2):
+                if student_idx < len(row_data) and row_data[student_idx].strip().lower() == owner:
+                    existing_student = (row_num, row_data)
                     break
-            except:
-                next_row = i
-                break
-        
-        if next_row is None:
-            next_row = len(all_records) + 2
-            
-        group_ws.update_cell(next_row, 1, str(chat_id))
-        group_ws.update_cell(next_row, 2, student_name)
-        group_ws.update_cell(next_row, 3, github)
-        
+
+        if existing_student:
+            row_num, row_data = existing_student
+            existing_github = ""
+            if github_idx is not None and github_idx < len(row_data):
+                existing_github = row_data[github_idx].strip()
+
+            if existing_github and existing_github != github:
+                return {"status": "conflict", "message": "Student registered with different GitHub"}
+
+            cells = [(row_num, 1, chat_id)]
+            if not existing_github:
+                cells.append((row_num, 3, github))
+            sync.update_cells(group_ws, cells)
+
+            return {"status": "updated" if not existing_github else "already_registered", "github": github}
+
+        next_row = free_row(all_data)
+        sync.update_cells(group_ws, [(next_row, 1, chat_id), (next_row, 2, student_name), (next_row, 3, github)])
+
         return {"status": "registered", "github": github}
 
 @app.get("/student-group/{chat_id}")
 def get_student_group(chat_id: int):
-    creds = ServiceAccountCredentials.from_json_keyfile_name(CREDENTIALS_FILE)
-    client = gspread.authorize(creds)
-    ws = client.open_by_key(SPREADSHEET_ID).worksheet(CODES_SHEET)
-
-    rec = next(
-        (r for r in ws.get_all_records()
-         if str(r.get("tg_chat_id")) == str(chat_id)),
-        None,
-    )
+    _, rec = roster.lookup("tg_chat_id", chat_id)
     if rec is None:
         raise HTTPException(404, "Student not found")
 
@@ -0,0 +1,248 @@
+import functools
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, replace
+
+import yaml
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, ValidationError, field_validator
+
+_LAB_NUMBER_RE = re.compile(r"\d+")
+# libyaml разбирает файлы курсов в разы быстрее чистого Python; без него — обычный SafeLoader
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+@functools.lru_cache(maxsize=4096)
+def lab_number(lab_id: str) -> int | None:
+    """Номер ЛР из идентификатора вида "ЛР1", "lab-1" или "1" """
+    match = _LAB_NUMBER_RE.search(lab_id)
+    return int(match.group(0)) if match else None
+
+
+class _Section(BaseModel):
+    # Неизвестные ключи сохраняются: в YAML курсов много полей, которые бэкенд не читает
+    model_config = ConfigDict(extra="allow", populate_by_name=True, frozen=True)
+
+
+class LabConfig(_Section):
+    github_prefix: str = Field(alias="github-prefix", min_length=1)
+    short_name: str | None = Field(None, alias="short-name")
+
+
+class GitHubConfig(_Section):
+    organization: str = Field(min_length=1)
+    teachers: list[str] = []
+
+
+class GoogleConfig(_Section):
+    spreadsheet: str = Field(min_length=1)
+    info_sheet: str | None = Field(None, alias="info-sheet")
+    task_id_column: int = Field(0, alias="task-id-column", ge=0)
+    student_name_column: int = Field(2, alias="student-name-column", ge=1)
+    lab_column_offset: int = Field(1, alias="lab-column-offset")
+
+
+class CourseConfig(_Section):
+    """Раздел `course` YAML файла с заранее построенными индексами ЛР"""
+    name: str = Field(min_length=1)
+    semester: str | None = None
+    logo: str | None = None
+    email: str | None = None
+    github: GitHubConfig
+    google: GoogleConfig
+    labs: dict[str, LabConfig] = {}
+
+    _by_number: dict[int, str] = PrivateAttr(default_factory=dict)
+    _prefixes: list[tuple[str, str]] = PrivateAttr(default_factory=list)
+
+    @field_validator("labs")
+    @classmethod
+    def _check_labs(cls, labs: dict[str, LabConfig]) -> dict[str, LabConfig]:
+        numbers = {}
+        for key in labs:
+            number = lab_number(key)
+            if number is None:
+                raise ValueError(f"в названии ЛР {key!r} нет номера")
+            if number in numbers:
+                raise ValueError(f"ЛР {numbers[number]!r} и {key!r} имеют один номер")
+            numbers[number] = key
+        return labs
+
+    def model_post_init(self, context) -> None:
+        self._by_number = {lab_number(key): key for key in self.labs}
+        # Самый длинный префикс проверяется первым: mlb-task1 и mlb-task10
+        self._prefixes = sorted(((f"{lab.github_prefix}-".lower(), key) for key, lab in self.labs.items()),
+                                key=lambda item: len(item[0]), reverse=True)
+
+    def lab(self, lab_id: str) -> tuple[str, int, LabConfig] | None:
+        """(ключ, номер, настройки) ЛР по идентификатору из запроса: "ЛР1", "1" и т.п."""
+        key = lab_id if lab_id in self.labs else self._by_number.get(lab_number(lab_id))
+        if key is None:
+            return None
+        return key, lab_number(key), self.labs[key]
+
+    def lab_by_repository(self, repo_name: str) -> tuple[str, str] | None:
+        """(ключ ЛР, GitHub-логин) для репозитория `<github-prefix>-<login>`"""
+        lowered = repo_name.lower()
+        for prefix, key in self._prefixes:
+            if lowered.startswith(prefix) and len(repo_name) > len(prefix):
+                return key, repo_name[len(prefix):]
+        return None
+
+
+class MiscConfig(_Section):
+    requests_timeout: float | None = Field(None, alias="requests-timeout", gt=0)
+
+
+class CourseFile(_Section):
+    course: CourseConfig
+    misc: MiscConfig = MiscConfig()
+
+
+def validate_course(data) -> CourseFile:
+    """Проверяет разобранный YAML курса по схеме; ошибки — ValueError с понятным текстом"""
+    if not isinstance(data, dict):
+        raise ValueError("файл курса должен быть словарем с разделом course")
+    try:
+        return CourseFile.model_validate(data)
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors())
+        raise ValueError(errors)
+
+
+@dataclass(frozen=True)
+class Course:
+    """Разобранный YAML файл курса и его проверенная конфигурация"""
+    id: str
+    filename: str
+    path: str
+    mtime: float
+    data: dict | None
+    config: CourseFile | None = None
+    error: str | None = None
+
+    @property
+    def stem(self) -> str:
+        return self.filename[:-len(".yaml")]
+
+    @property
+    def valid(self) -> bool:
+        return self.config is not None
+
+    @property
+    def settings(self) -> CourseConfig | None:
+        return self.config.course if self.config is not None else None
+
+    def group_sheet(self, group_id: str) -> str:
+        """Имя листа группы: {group}_{course}"""
+        return f"{group_id}_{self.stem}"
+
+    def group_of_sheet(self, title: str) -> str | None:
+        """Группа по имени листа или None, если лист не относится к курсу"""
+        group_id, sep, stem = title.partition("_")
+        return group_id if sep and stem == self.stem else None
+
+    @property
+    def info(self) -> dict:
+        if not isinstance(self.data, dict):
+            return {}
+        return self.data.get("course") or {}
+
+    @property
+    def requests_timeout(self) -> float | None:
+        """Таймаут внешних запросов из `misc.requests-timeout`"""
+        return self.config.misc.requests_timeout if self.config is not None else None
+
+
+def _parse(path: str, filename: str):
+    with open(path, "r", encoding="utf-8") as file:
+        try:
+            return yaml.load(file, Loader=_YAML_LOADER)
+        except yaml.YAMLError as e:
+            print(f"Ошибка при разборе YAML в {filename}: {e}")
+            return None
+
+
+def _compile(course_id: str, filename: str, path: str, mtime: float, data) -> Course:
+    try:
+        config = validate_course(data)
+    except ValueError as e:
+        print(f"Курс {filename} не прошел проверку: {e}")
+        return Course(course_id, filename, path, mtime, data, error=str(e))
+    return Course(course_id, filename, path, mtime, data, config)
+
+
+class CourseRegistry:
+    """Курсы из COURSES_DIR, разобранные один раз и проиндексированные по id и имени файла.
+
+    Каталог проверяется не чаще раза в `check_interval` секунд, заново
+    читаются только файлы с изменившимся mtime.
+    """
+
+    def __init__(self, directory: str, check_interval: float = 2.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._by_id: dict[str, Course] = {}
+        self._by_stem: dict[str, Course] = {}
+        self._ordered: list[Course] = []
+
+    def load(self) -> None:
+        self.refresh(force=True)
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+
+    def refresh(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if not force and time.monotonic() - self._checked_at < self.check_interval:
+                return
+            self._rescan()
+            self._checked_at = time.monotonic()
+
+    def _rescan(self) -> None:
+        try:
+            filenames = sorted(f for f in os.listdir(self.directory) if f.endswith(".yaml"))
+        except FileNotFoundError:
+            filenames = []
+
+        ordered = []
+        for index, filename in enumerate(filenames, start=1):
+            path = os.path.join(self.directory, filename)
+            try:
+                mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if not os.path.isfile(path):
+                continue
+
+            course_id = str(index)
+            cached = self._by_stem.get(filename[:-len(".yaml")])
+            if cached is not None and cached.mtime == mtime:
+                course = cached if cached.id == course_id else replace(cached, id=course_id)
+            else:
+                course = _compile(course_id, filename, path, mtime, _parse(path, filename))
+            ordered.append(course)
+
+        self._ordered = ordered
+        self._by_id = {c.id: c for c in ordered}
+        self._by_stem = {c.stem: c for c in ordered}
+
+    def all(self) -> list[Course]:
+        self.refresh()
+        return self._ordered
+
+    def get(self, course_id: str) -> Course | None:
+        self.refresh()
+        try:
+            return self._by_id.get(str(int(course_id)))
+        except (TypeError, ValueError):
+            return None
+
+    def by_stem(self, stem: str) -> Course | None:
+        self.refresh()
+        return self._by_stem.get(stem)
@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from typing import Callable, Hashable
+
+import redis
+from redis import RedisError
+
+from services import metrics
+from services.redis_circuit import RedisCircuit
+
+Result = tuple[int, dict]
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """Объединяет одновременные одинаковые вызовы внутри процесса.
+
+    Первый вызов с ключом выполняет функцию, остальные с тем же ключом ждут
+    его и получают тот же результат или то же исключение. После завершения
+    ключ освобождается, следующий вызов выполняется заново.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], object]):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            metrics.CACHE_REQUESTS.inc(cache="single_flight", result="shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.CACHE_REQUESTS.inc(cache="single_flight", result="leader")
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyStore:
+    """Ответы на запросы с заголовком Idempotency-Key, общие для всех процессов, в Redis.
+
+    Первый запрос с ключом помечает его как выполняемый (SET NX), выполняет
+    обработку и сохраняет `(статус, тело)` на `ttl` секунд. Повтор с тем же
+    ключом получает сохраненный ответ, а пока первый еще выполняется — ждет
+    его не дольше `wait` секунд. Ответы 5xx не сохраняются, чтобы повтор мог
+    выполниться заново. Ключ привязан к отпечатку запроса: тот же ключ с
+    другими параметрами отклоняется. Без Redis обработка просто выполняется.
+    """
+
+    def __init__(self, url: str, ttl: int = 600, lock_timeout: int = 300, wait: float = 30,
+                 poll_interval: float = 0.1, prefix: str = "idempotency", retry_after: float = 5.0):
+        self.redis = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2)
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.circuit = RedisCircuit("Хранилище ключей идемпотентности", retry_after)
+
+    def run(self, key: str, fingerprint: str, func: Callable[[], Result]) -> tuple[int, dict, bool]:
+        """(статус, тело, взят ли ответ из сохраненных)"""
+        if not self.circuit.available:
+            return (*func(), False)
+        redis_key = f"{self.prefix}:{key}"
+        deadline = time.monotonic() + self.wait
+        while True:
+            try:
+                claimed = self.redis.set(redis_key, json.dumps({"state": "pending", "fingerprint": fingerprint}),
+                                         nx=True, ex=self.lock_timeout)
+                entry = None if claimed else self.redis.get(redis_key)
+            except RedisError as e:
+                self.circuit.failed(e)
+                return (*func(), False)
+            if claimed:
+                break
+            if entry is None:
+                continue
+            entry = json.loads(entry)
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(422, "Idempotency-Key уже использован для другого запроса")
+            if entry["state"] == "done":
+                metrics.CACHE_REQUESTS.inc(cache="idempotency", result="hit")
+                return entry["status"], entry["body"], True
+            if time.monotonic() >= deadline:
+                raise IdempotencyConflict(409, "Запрос с этим Idempotency-Key еще выполняется")
+            time.sleep(self.poll_interval)
+
+        metrics.CACHE_REQUESTS.inc(cache="idempotency", result="miss")
+        try:
+            status, body = func()
+        except BaseException:
+            self._forget(redis_key)
+            raise
+        if status >= 500:
+            self._forget(redis_key)
+            return status, body, False
+        try:
+            self.redis.set(redis_key, json.dumps({"state": "done", "fingerprint": fingerprint, "status": status,
+                                                  "body": body}, ensure_ascii=False, default=str), ex=self.ttl)
+        except RedisError as e:
+            self.circuit.failed(e)
+        return status, body, False
+
+    def _forget(self, redis_key: str) -> None:
+        try:
+            self.redis.delete(redis_key)
+        except RedisError as e:
+            self.circuit.failed(e)
@@ -0,0 +1,136 @@
+import csv
+import io
+import re
+import zipfile
+from typing import Iterable, Iterator
+from xml.sax.saxutils import escape
+
+from services.courses import lab_number
+from services.local_store import LocalWorksheet
+from services.sheet_layout import LayoutCache
+_NUMBER_RE = re.compile(r"^-?\d+(\.\d+)?$")
+_ILLEGAL_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def course_rows(groups: list[tuple[str, LocalWorksheet]], layouts: LayoutCache, lab_keys: list[str],
+                lab_offset: int) -> Iterator[list[str]]:
+    """Строки выгрузки курса: заголовок, затем студенты всех групп по одному листу за раз.
+
+    Столбцы приводятся к виду Группа, Студент, GitHub, ЛР... в порядке ЛР из
+    конфигурации курса и находятся по раскладке листа из `layouts` — так же,
+    как при записи оценок.
+    """
+    yield ["Группа", "Студент", "GitHub", *lab_keys]
+    for group_id, sheet in groups:
+        values = sheet.get_all_values()
+        if not values:
+            continue
+        layout = layouts.layout(sheet)
+        lab_idx = []
+        for key in lab_keys:
+            number = lab_number(key)
+            if number in layout.labs or layout.github_col is not None:
+                lab_idx.append(layout.lab_column(number, lab_offset) - 1)
+            else:
+                lab_idx.append(None)
+        student_idx = layout.student_col - 1 if layout.student_col is not None else None
+        github_idx = layout.github_col - 1 if layout.github_col is not None else None
+
+        def cell(row: list[str], idx: int | None) -> str:
+            return row[idx].strip() if idx is not None and idx < len(row) else ""
+
+        for row in values[1:]:
+            student, github = cell(row, student_idx), cell(row, github_idx)
+            if not student and not github:
+                continue
+            yield [group_id, student, github, *(cell(row, idx) for idx in lab_idx)]
+
+
+def stream_csv(rows: Iterable[list[str]]) -> Iterator[bytes]:
+    """CSV в UTF-8 с BOM (чтобы Excel распознал кодировку), по строке за раз"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    yield "\ufeff".encode()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+class _Chunks:
+    """Файлоподобный приемник для zipfile: накапливает записанное до следующей выдачи"""
+
+    def __init__(self):
+        self.chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+
+def _xlsx_cell(value: str) -> str:
+    if _NUMBER_RE.match(value):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_ILLEGAL_XML_RE.sub("", value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(rows: Iterable[list[str]], sheet_name: str = "Результаты") -> Iterator[bytes]:
+    """XLSX из одного листа, записываемый потоком: строки сразу сжимаются и
+    отдаются клиенту, в памяти держится только текущий фрагмент архива"""
+    sink = _Chunks()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC.items():
+            archive.writestr(name, content)
+        archive.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        yield sink.drain()
+
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+            for row in rows:
+                sheet.write(("<row>" + "".join(_xlsx_cell(str(value)) for value in row) + "</row>").encode())
+                chunk = sink.drain()
+                if chunk:
+                    yield chunk
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
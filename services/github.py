@@ -0,0 +1,165 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services import metrics
+from services.tracing import TRACER
+
+API_URL = "https://api.github.com"
+
+_OPERATIONS = (
+    (re.compile(r"^/users/[^/]+$"), "users"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/contents/"), "contents"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/commits/[^/]+/check-runs$"), "check_runs"),
+    (re.compile(r"^/repos/[^/]+/[^/]+/commits$"), "commits"),
+)
+
+
+def _operation(url: str) -> str:
+    path = url[len(API_URL):] if url.startswith(API_URL) else url
+    for pattern, name in _OPERATIONS:
+        if pattern.match(path):
+            return name
+    return "other"
+
+
+class ConditionalCache:
+    """LRU-кеш ответов GitHub для условных запросов.
+
+    Хранит последний ответ с ETag/Last-Modified, чтобы повторный запрос ушел
+    с `If-None-Match`: ответ 304 не расходует лимит GitHub API.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, requests.Response] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> requests.Response | None:
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: tuple, response: requests.Response) -> None:
+        response.content  # тело читается сразу, чтобы ответ можно было отдавать повторно
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit: bool) -> None:
+        metrics.CACHE_REQUESTS.inc(cache="github_etag", result="hit" if hit else "miss")
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class GitHubClient:
+    """Общий HTTP-клиент для api.github.com.
+
+    Keep-alive соединения берутся из пула сессии, идемпотентные GET
+    повторяются с экспоненциальной задержкой и джиттером, число
+    одновременных запросов ограничено `max_concurrency`.
+    """
+
+    def __init__(self, token: str | None, pool_size: int = 32, max_concurrency: int = 16,
+                 retries: int = 3, default_timeout: float = 10, cache_size: int = 2048):
+        self.token = token
+        self.default_timeout = default_timeout
+        self.cache = ConditionalCache(cache_size)
+        self._token_key = hashlib.sha256((token or "").encode()).hexdigest()[:16]
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.3,
+            backoff_jitter=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry))
+        self.session.headers.update({"Accept": "application/vnd.github+json"})
+        if token:
+            self.session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def url(self, path: str) -> str:
+        return path if path.startswith("https://") else f"{API_URL}{path}"
+
+    def _send(self, operation: str, method: str, url: str, timeout: float, **kwargs) -> requests.Response:
+        if not self._slots.acquire(timeout=timeout):
+            metrics.GITHUB_REQUESTS.inc(operation=operation, status="saturated")
+            raise requests.exceptions.Timeout("Превышен лимит одновременных запросов к GitHub")
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with TRACER.span(f"github.{operation}", kind="client", method=method,
+                             path=urlparse(url).path) as span:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+                status = response.status_code
+                if span is not None:
+                    span.set(status=status, not_modified=status == 304)
+        finally:
+            self._slots.release()
+            metrics.GITHUB_REQUEST_DURATION.observe(time.perf_counter() - started, operation=operation)
+            metrics.GITHUB_REQUESTS.inc(operation=operation, status=status)
+
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None:
+            resource = response.headers.get("X-RateLimit-Resource", "core")
+            metrics.GITHUB_RATE_LIMIT_REMAINING.set(float(remaining), resource=resource)
+        return response
+
+    def get(self, path: str, timeout: float | None = None, params: dict | None = None) -> requests.Response:
+        url = self.url(path)
+        key = (url, tuple(sorted((params or {}).items())), self._token_key)
+        cached = self.cache.get(key)
+
+        headers = {}
+        if cached is not None:
+            if cached.headers.get("ETag"):
+                headers["If-None-Match"] = cached.headers["ETag"]
+            if cached.headers.get("Last-Modified"):
+                headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+
+        timeout = timeout or self.default_timeout
+        response = self._send(_operation(url), "GET", url, timeout, params=params, headers=headers)
+
+        if response.status_code == 304 and cached is not None:
+            self.cache.record(hit=True)
+            return cached
+        self.cache.record(hit=False)
+        if response.status_code == 200 and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            self.cache.put(key, response)
+        return response
+
+    def graphql(self, query: str, variables: dict, timeout: float | None = None) -> dict:
+        """Выполняет запрос к GraphQL API; ошибки HTTP и GraphQL поднимаются как RequestException"""
+        timeout = timeout or self.default_timeout
+        response = self._send("graphql", "POST", f"{API_URL}/graphql", timeout,
+                              json={"query": query, "variables": variables})
+
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("errors") and not payload.get("data"):
+            raise requests.RequestException(f"GraphQL: {payload['errors']}")
+        return payload
@@ -0,0 +1,277 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import redis
+import requests
+from fastapi import HTTPException
+from redis import RedisError
+
+from services import metrics
+from services.courses import Course
+from services.github import GitHubClient
+from services.local_store import LocalSheets, SyncEngine
+from services.redis_circuit import RedisCircuit
+from services.sheet_layout import SheetLayout
+from services.tracing import TRACER
+
+NO_CI = {
+    "status": "completed",
+    "result": "✓",
+    "passed": "CI не настроен - автоматически засчитано",
+    "checks": ["✅ CI не настроен - работа принята автоматически"],
+}
+
+PENDING = {"status": "pending", "message": "Нет активных CI-проверок ⏳"}
+
+CI_STATUS_QUERY = """
+query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) {
+    workflows: object(expression: "HEAD:.github/workflows") { __typename }
+    defaultBranchRef {
+      target {
+        ... on Commit {
+          oid
+          checkSuites(first: 20) {
+            nodes {
+              checkRuns(first: 50) { nodes { name conclusion permalink } }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def summarize_checks(check_runs: list[dict]) -> dict:
+    """Сводка по проверкам вида {"name", "conclusion", "html_url"}"""
+    if not check_runs:
+        return dict(PENDING)
+
+    summary = []
+    passed_count = 0
+    running_count = 0
+
+    for check in check_runs:
+        name = check.get("name") or "Unnamed check"
+        conclusion = check.get("conclusion")
+        html_url = check.get("html_url")
+        if conclusion == "success":
+            emoji = "✅"
+            passed_count += 1
+        elif conclusion == "failure":
+            emoji = "❌"
+        else:
+            emoji = "⏳"
+            running_count += int(conclusion is None)
+        summary.append(f"{emoji} {name} — {html_url}")
+
+    total_checks = len(check_runs)
+    return {
+        "status": "completed",
+        "result": "✓" if passed_count == total_checks else "✗",
+        "passed": f"{passed_count}/{total_checks} тестов пройдено",
+        "checks": summary,
+        "running": running_count,
+    }
+
+
+def _get(github: GitHubClient, path: str, timeout: float | None):
+    try:
+        return github.get(path, timeout=timeout)
+    except requests.RequestException:
+        raise HTTPException(status_code=504, detail="GitHub не отвечает, попробуйте позже")
+
+
+def fetch_ci_rest(github: GitHubClient, org: str, repo_name: str, timeout: float | None = None) -> dict:
+    """Состояние CI через REST: каталог workflows, последний коммит, его check-runs"""
+    workflows_resp = _get(github, f"/repos/{org}/{repo_name}/contents/.github/workflows", timeout)
+    if workflows_resp.status_code != 200:
+        return dict(NO_CI)
+
+    commits_resp = _get(github, f"/repos/{org}/{repo_name}/commits", timeout)
+    if commits_resp.status_code != 200 or not commits_resp.json():
+        raise HTTPException(status_code=404, detail="Нет коммитов в репозитории")
+
+    latest_sha = commits_resp.json()[0]["sha"]
+
+    check_resp = _get(github, f"/repos/{org}/{repo_name}/commits/{latest_sha}/check-runs", timeout)
+    if check_resp.status_code != 200:
+        raise HTTPException(status_code=404, detail="Проверки CI не найдены")
+
+    return summarize_checks(check_resp.json().get("check_runs", []))
+
+
+def fetch_ci_graphql(github: GitHubClient, org: str, repo_name: str, timeout: float | None = None) -> dict:
+    """То же состояние CI, что и fetch_ci_rest, одним GraphQL-запросом"""
+    payload = github.graphql(CI_STATUS_QUERY, {"owner": org, "name": repo_name}, timeout=timeout)
+    repository = (payload.get("data") or {}).get("repository")
+    if not repository or not repository.get("workflows"):
+        return dict(NO_CI)
+
+    commit = (repository.get("defaultBranchRef") or {}).get("target")
+    if not commit:
+        raise HTTPException(status_code=404, detail="Нет коммитов в репозитории")
+
+    check_runs = []
+    for suite in (commit.get("checkSuites") or {}).get("nodes") or []:
+        for run in ((suite or {}).get("checkRuns") or {}).get("nodes") or []:
+            check_runs.append({
+                "name": run.get("name"),
+                "conclusion": (run.get("conclusion") or "").lower() or None,
+                "html_url": run.get("permalink"),
+            })
+    return summarize_checks(check_runs)
+
+
+def fetch_ci_status(github: GitHubClient, org: str, repo_name: str, timeout: float | None = None,
+                    backend: str = "graphql") -> dict:
+    """Состояние CI репозитория; при сбое GraphQL запрос повторяется через REST"""
+    if backend == "graphql" and github.token:
+        try:
+            return fetch_ci_graphql(github, org, repo_name, timeout)
+        except (requests.RequestException, ValueError) as e:
+            print(f"GraphQL недоступен для {org}/{repo_name}, используется REST: {e}")
+    return fetch_ci_rest(github, org, repo_name, timeout)
+
+
+def grade_response(ci: dict) -> dict:
+    return {
+        "status": "updated",
+        "result": ci["result"],
+        "message": f"{'✅ Все проверки пройдены' if ci['result'] == '✓' else '❌ Обнаружены ошибки'}",
+        "passed": ci["passed"],
+        "checks": ci["checks"],
+    }
+
+
+def write_grade(sheets: LocalSheets, writes: SyncEngine, spreadsheet_id: str, sheet_name: str,
+                username: str, lab_number: int, lab_offset: int, final_result: str) -> None:
+    """Ставит в очередь запись результата в ячейку ЛР{n} строки студента"""
+    try:
+        sheet = sheets.worksheet(spreadsheet_id, sheet_name)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Группа не найдена в Google Таблице")
+
+    layout = sheets.layouts.layout(sheet)
+    if layout.github_col is None:
+        raise HTTPException(status_code=400, detail="Столбец 'GitHub' не найден")
+
+    row_idx = sheets.layouts.find_row(sheet, layout.github_col, username)
+    if row_idx is None:
+        raise HTTPException(status_code=404, detail="GitHub логин не найден в таблице. Зарегистрируйтесь.")
+
+    writes.update_cell(sheet, row_idx, _lab_column(layout, lab_number, lab_offset), final_result)
+
+
+def _lab_column(layout: SheetLayout, lab_number: int, lab_offset: int) -> int:
+    if lab_number not in layout.labs:
+        metrics.LAB_COLUMN_FALLBACKS.inc()
+    return layout.lab_column(lab_number, lab_offset)
+
+
+def grade_group(sheets: LocalSheets, writes: SyncEngine, github: GitHubClient, course: Course,
+                group_id: str, lab_key: str, lab_number: int, concurrency: int = 8,
+                backend: str = "graphql") -> dict:
+    """Проверяет ЛР у всей группы: одно чтение листа, параллельные запросы CI
+    (не больше `concurrency` одновременно) и одна пакетная запись результатов"""
+    settings = course.settings
+    if settings is None or lab_key not in settings.labs:
+        raise HTTPException(status_code=400, detail="Missing course configuration")
+    org = settings.github.organization
+    spreadsheet_id = settings.google.spreadsheet
+    lab_offset = settings.google.lab_column_offset
+    repo_prefix = settings.labs[lab_key].github_prefix
+
+    try:
+        sheet = sheets.worksheet(spreadsheet_id, f"{group_id}_{course.stem}")
+    except Exception:
+        raise HTTPException(status_code=404, detail="Группа не найдена в Google Таблице")
+
+    layout = sheets.layouts.layout(sheet)
+    if layout.github_col is None:
+        raise HTTPException(status_code=400, detail="Столбец 'GitHub' не найден")
+    github_col_idx = layout.github_col
+    lab_col = _lab_column(layout, lab_number, lab_offset)
+
+    values = sheet.get_all_values()
+
+    students = []
+    for row_idx, row in enumerate(values[1:], start=2):
+        username = row[github_col_idx - 1].strip() if len(row) >= github_col_idx else ""
+        if username:
+            students.append((row_idx, username))
+
+    def check(username: str) -> dict:
+        try:
+            return fetch_ci_status(github, org, f"{repo_prefix}-{username}", course.requests_timeout, backend)
+        except HTTPException as e:
+            return {"status": "error", "message": e.detail}
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        statuses = list(pool.map(TRACER.propagate(check), [username for _, username in students]))
+
+    cells = []
+    report = {"graded": {}, "pending": [], "errors": {}}
+    for (row_idx, username), ci in zip(students, statuses):
+        if ci["status"] == "completed":
+            cells.append((row_idx, lab_col, ci["result"]))
+            report["graded"][username] = ci["result"]
+        elif ci["status"] == "pending":
+            report["pending"].append(username)
+        else:
+            report["errors"][username] = ci["message"]
+
+    if cells:
+        writes.update_cells(sheet, cells)
+
+    return {"status": "completed", "lab": lab_key, "group_id": group_id, "students": len(students), **report}
+
+
+class GradeStore:
+    """Последние известные результаты CI по (курс, ЛР, GitHub-логин), общие для всех процессов, в Redis.
+
+    Заполняется только вебхуками GitHub по завершении CI и сбрасывается при
+    новом push или запуске проверок; результаты ручных и групповых проверок
+    сюда не попадают, иначе повторная проверка не увидела бы исправлений.
+    `written` отмечает, что результат уже поставлен в очередь записи в таблицу.
+    Без Redis хранилище пусто и оценки считаются заново.
+    """
+
+    def __init__(self, url: str, ttl: int = 24 * 3600, prefix: str = "grades", retry_after: float = 5.0):
+        self.redis = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.circuit = RedisCircuit("Хранилище результатов CI", retry_after)
+
+    def _key(self, course: str, lab: str, github: str) -> str:
+        return f"{self.prefix}:{course}:{lab}:{github.lower()}"
+
+    def get(self, course: str, lab: str, github: str) -> dict | None:
+        entry = None
+        if self.circuit.available:
+            try:
+                entry = self.redis.get(self._key(course, lab, github))
+            except RedisError as e:
+                self.circuit.failed(e)
+        metrics.CACHE_REQUESTS.inc(cache="grade_store", result="miss" if entry is None else "hit")
+        return json.loads(entry) if entry is not None else None
+
+    def put(self, course: str, lab: str, github: str, ci: dict, written: bool = False) -> None:
+        if not self.circuit.available:
+            return
+        entry = json.dumps({"ci": ci, "written": written, "updated_at": time.time()}, ensure_ascii=False)
+        try:
+            self.redis.set(self._key(course, lab, github), entry, ex=self.ttl)
+        except RedisError as e:
+            self.circuit.failed(e)
+
+    def invalidate(self, course: str, lab: str, github: str) -> None:
+        if not self.circuit.available:
+            return
+        try:
+            self.redis.delete(self._key(course, lab, github))
+        except RedisError as e:
+            self.circuit.failed(e)
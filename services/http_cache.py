@@ -0,0 +1,66 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from services import metrics
+
+
+def version_of(*parts) -> str:
+    """Короткий отпечаток значений, от которых зависит ответ (mtime файлов, заголовки листа и т.п.)"""
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False, default=str).encode()).hexdigest()[:20]
+
+
+class ResponseCache:
+    """Кеш готовых JSON-ответов каталога с ETag.
+
+    Запись хранится под ключом маршрута вместе с версией данных; ETag
+    вычисляется из ключа и версии, поэтому при совпадении If-None-Match
+    ответ 304 отдается без построения тела. Устаревшая версия просто
+    перезаписывается, `invalidate` сбрасывает кеш после изменения курсов.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_age: int = 30):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries: OrderedDict[str, tuple[str, str, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(key: str, version: str) -> str:
+        return '"' + hashlib.sha1(f"{key}\n{version}".encode()).hexdigest() + '"'
+
+    def _headers(self, etag: str) -> dict:
+        return {"ETag": etag, "Cache-Control": f"public, max-age={self.max_age}, must-revalidate"}
+
+    def respond(self, request: Request, key: str, version: str, build) -> Response:
+        """Ответ на GET: 304 по If-None-Match, тело из кеша или новое тело из `build()`"""
+        etag = self.etag(key, version)
+        if etag in (tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")):
+            metrics.CACHE_REQUESTS.inc(cache="catalog", result="not_modified")
+            return Response(status_code=304, headers=self._headers(etag))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                body = entry[2]
+            else:
+                body = None
+        if body is None:
+            metrics.CACHE_REQUESTS.inc(cache="catalog", result="miss")
+            body = json.dumps(build(), ensure_ascii=False).encode()
+            with self._lock:
+                self._entries[key] = (version, etag, body)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        else:
+            metrics.CACHE_REQUESTS.inc(cache="catalog", result="hit")
+        return Response(body, media_type="application/json", headers=self._headers(etag))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
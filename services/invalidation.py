@@ -0,0 +1,166 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable
+
+import redis
+from redis import RedisError
+
+from services import metrics
+from services.redis_circuit import RedisCircuit
+
+# Резервирует в общем счетчике номера для пачки событий и рассылает их одним запросом к Redis
+_PUBLISH = """
+local first = redis.call('INCRBY', KEYS[1], #ARGV - 1) - #ARGV + 2
+for i = 2, #ARGV do
+  redis.call('PUBLISH', ARGV[1], (first + i - 2) .. ' ' .. ARGV[i])
+end
+return first
+"""
+
+# Типы событий
+COURSE = "course"            # YAML курса добавлен, изменен или удален; ключ — имя файла
+ROSTER_ROW = "roster_row"    # ячейка строки листа users/admins; ключ — "таблица/лист/строка/столбец"
+GROUP_SHEET = "group_sheet"  # ячейка листа группы; ключ — "таблица/лист/строка/столбец"
+
+
+def cell_key(spreadsheet_id: str, title: str, row: int, col: int) -> str:
+    return f"{spreadsheet_id}/{title}/{row}/{col}"
+
+
+class InvalidationBus:
+    """Шина инвалидации кешей между процессами бэкенда через Redis pub/sub.
+
+    Процесс, изменивший данные, сам обновляет свои кеши и публикует событие
+    `(тип, ключ, данные)`; остальные процессы получают его в фоновом потоке и
+    вызывают обработчики, зарегистрированные через `on`. Каждое событие несет
+    номер из общего счетчика в Redis: для каждого ключа запоминается последний
+    примененный номер, поэтому событие, пришедшее позже более нового, и
+    повторная доставка пропускаются. Pub/sub не хранит сообщения, так что после
+    переподключения вызываются обработчики `on_resync` — события за время
+    разрыва могли потеряться.
+    """
+
+    def __init__(self, url: str, channel: str = "invalidation", max_versions: int = 100_000,
+                 retry_after: float = 5.0):
+        self.redis = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2,
+                                          health_check_interval=30)
+        self.channel = channel
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._publish = self.redis.register_script(_PUBLISH)
+        self._handlers: dict[str, list[Callable[[str, dict, dict], None]]] = {}
+        self._resync: list[Callable[[], None]] = []
+        self._versions: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self.max_versions = max_versions
+        self.circuit = RedisCircuit("Шина инвалидации", retry_after)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def on(self, kind: str, handler: Callable[[str, dict, dict], None]) -> None:
+        """`handler(key, data, event)` вызывается для событий типа `kind` из других процессов"""
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def on_resync(self, handler: Callable[[], None]) -> None:
+        self._resync.append(handler)
+
+    def _remember(self, kind: str, key: str, version: int) -> bool:
+        """Запоминает версию ключа; False, если уже известна такая же или более новая"""
+        with self._lock:
+            if version <= self._versions.get((kind, key), 0):
+                return False
+            self._versions[(kind, key)] = version
+            self._versions.move_to_end((kind, key))
+            while len(self._versions) > self.max_versions:
+                self._versions.popitem(last=False)
+            return True
+
+    def publish(self, kind: str, key: str, **data) -> int | None:
+        return self.publish_many(kind, [(key, data)])
+
+    def publish_many(self, kind: str, events: list[tuple[str, dict]]) -> int | None:
+        """Рассылает события `(ключ, данные)` и возвращает номер первого.
+
+        Без Redis возвращает None: остальные процессы догонят по TTL своих
+        кешей, а повторные попытки не задерживают запросы `retry_after` секунд.
+        """
+        if not events or not self.circuit.available:
+            return None
+        messages = [json.dumps({"kind": kind, "key": key, "origin": self.origin, "data": data},
+                               ensure_ascii=False, default=str) for key, data in events]
+        try:
+            first = int(self._publish(keys=[f"{self.channel}:version"], args=[self.channel, *messages]))
+        except RedisError as e:
+            self.circuit.failed(e)
+            return None
+        for version, (key, _) in enumerate(events, start=first):
+            self._remember(kind, key, version)
+        metrics.INVALIDATION_EVENTS.inc(len(events), kind=kind, result="published")
+        return first
+
+    def dispatch(self, message: str) -> bool:
+        """Применяет полученное сообщение; False — свое, устаревшее или нераспознанное событие"""
+        try:
+            version, _, body = message.partition(" ")
+            version = int(version)
+            event = json.loads(body)
+            kind, key = event["kind"], event["key"]
+        except (ValueError, KeyError, TypeError):
+            print(f"Некорректное событие инвалидации: {message[:200]}")
+            return False
+        if event.get("origin") == self.origin:
+            return False
+        if not self._remember(kind, key, version):
+            metrics.INVALIDATION_EVENTS.inc(kind=kind, result="stale")
+            return False
+        event["version"] = version
+        for handler in self._handlers.get(kind, []):
+            try:
+                handler(key, event.get("data") or {}, event)
+            except Exception as e:
+                print(f"Ошибка обработки события {kind} {key}: {e}")
+        metrics.INVALIDATION_EVENTS.inc(kind=kind, result="applied")
+        return True
+
+    def _listen(self) -> None:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            for handler in self._resync:
+                handler()
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is not None and message["type"] == "message":
+                    self.dispatch(message["data"])
+        finally:
+            pubsub.close()
+
+    def _run(self) -> None:
+        delay = 1.0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self._listen()
+            except RedisError as e:
+                print(f"Шина инвалидации: соединение с Redis потеряно: {e}")
+            except Exception as e:
+                print(f"Шина инвалидации: {e}")
+            delay = 1.0 if time.monotonic() - started > 30 else min(delay * 2, 30.0)
+            self._stop.wait(delay)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,102 @@
+import json
+import time
+import uuid
+
+import redis
+
+
+class JobQueue:
+    """Очередь задач проверки в Redis.
+
+    Задача — хеш `job:<id>` со статусом queued/running/done/failed и результатом
+    в JSON. Идентификаторы ждут в списке `queue`; воркер атомарно переносит
+    идентификатор в список `<queue>:processing`, поэтому задачи упавшего
+    воркера возвращаются в очередь через `requeue_stale`.
+    """
+
+    def __init__(self, url: str, queue: str = "grading", result_ttl: int = 24 * 3600):
+        self.redis = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2)
+        self.queue = queue
+        self.processing = f"{queue}:processing"
+        self.result_ttl = result_ttl
+
+    def _key(self, job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def enqueue(self, kind: str, payload: dict, traceparent: str | None = None, dedup_key: str | None = None) -> str:
+        """`traceparent` связывает выполнение задачи в воркере с трассой запроса, который ее поставил.
+
+        С `dedup_key` новая задача не ставится, пока задача с тем же ключом
+        ждет в очереди или выполняется: возвращается ее идентификатор.
+        """
+        job_id = uuid.uuid4().hex
+        if dedup_key:
+            inflight = f"{self.queue}:inflight:{dedup_key}"
+            existing = self.redis.set(inflight, job_id, nx=True, get=True, ex=self.result_ttl)
+            if existing is not None:
+                if self.redis.hget(self._key(existing), "status") in ("queued", "running"):
+                    return existing
+                self.redis.set(inflight, job_id, ex=self.result_ttl)
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "status": "queued",
+            "created_at": time.time(),
+        }
+        if traceparent:
+            job["traceparent"] = traceparent
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(job_id), mapping=job)
+        pipe.expire(self._key(job_id), self.result_ttl)
+        pipe.lpush(self.queue, job_id)
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id: str) -> dict | None:
+        job = self.redis.hgetall(self._key(job_id))
+        if not job:
+            return None
+        for field in ("payload", "result", "error"):
+            if field in job:
+                job[field] = json.loads(job[field])
+        return job
+
+    def depth(self) -> int:
+        return self.redis.llen(self.queue)
+
+    def next(self, timeout: int = 5) -> dict | None:
+        """Забирает следующую задачу, блокируясь не дольше `timeout` секунд"""
+        job_id = self.redis.blmove(self.queue, self.processing, timeout, "RIGHT", "LEFT")
+        if job_id is None:
+            return None
+        self.redis.hset(self._key(job_id), mapping={"status": "running", "started_at": time.time()})
+        return self.get(job_id)
+
+    def _finish(self, job_id: str, fields: dict) -> None:
+        pipe = self.redis.pipeline()
+        pipe.hset(self._key(job_id), mapping={**fields, "finished_at": time.time()})
+        pipe.expire(self._key(job_id), self.result_ttl)
+        pipe.lrem(self.processing, 1, job_id)
+        pipe.execute()
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, {"status": "done", "result": json.dumps(result, ensure_ascii=False)})
+
+    def fail(self, job_id: str, status_code: int, detail: str) -> None:
+        error = {"status_code": status_code, "detail": detail}
+        self._finish(job_id, {"status": "failed", "error": json.dumps(error, ensure_ascii=False)})
+
+    def requeue_stale(self, max_runtime: float) -> int:
+        """Возвращает в очередь задачи, которые выполняются дольше `max_runtime` секунд"""
+        requeued = 0
+        for job_id in self.redis.lrange(self.processing, 0, -1):
+            started_at, created_at = self.redis.hmget(self._key(job_id), "started_at", "created_at")
+            if time.time() - float(started_at or created_at or 0) > max_runtime:
+                pipe = self.redis.pipeline()
+                pipe.lrem(self.processing, 1, job_id)
+                pipe.hset(self._key(job_id), "status", "queued")
+                pipe.rpush(self.queue, job_id)
+                pipe.execute()
+                requeued += 1
+        return requeued
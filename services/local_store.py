@@ -0,0 +1,566 @@
+import contextlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable
+
+import gspread
+from gspread.cell import Cell
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+from services import metrics
+from services.sheet_cache import SnapshotCache
+from services.sheet_layout import LayoutCache
+from services.sheets import SheetsClient
+from services.sheets_scheduler import PRIORITIES, SheetsScheduler
+from services.tracing import TRACER
+
+PRIORITY_NAMES = {value: name for name, value in PRIORITIES.items()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cells (
+    spreadsheet TEXT NOT NULL,
+    title TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    base TEXT NOT NULL,
+    dirty INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 2,
+    PRIMARY KEY (spreadsheet, title, row, col)
+);
+CREATE INDEX IF NOT EXISTS cells_dirty ON cells (dirty) WHERE dirty = 1;
+CREATE TABLE IF NOT EXISTS worksheets (
+    spreadsheet TEXT NOT NULL,
+    title TEXT NOT NULL,
+    pulled_at REAL NOT NULL,
+    PRIMARY KEY (spreadsheet, title)
+);
+CREATE TABLE IF NOT EXISTS header_versions (
+    spreadsheet TEXT NOT NULL,
+    title TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (spreadsheet, title)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    spreadsheet TEXT NOT NULL,
+    title TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    col INTEGER NOT NULL,
+    local TEXT NOT NULL,
+    remote TEXT NOT NULL,
+    base TEXT NOT NULL,
+    detected_at REAL NOT NULL
+);
+"""
+
+
+class LocalStore:
+    """Ячейки листов Google Sheets в локальной SQLite базе.
+
+    Для каждой ячейки хранится локальное значение `value` и `base` — значение
+    в таблице на момент последней синхронизации; `dirty` отмечает ячейки,
+    которые еще нужно отправить, а `priority` — класс приоритета записи
+    (PRIORITIES), в котором ее отправлять. Пустые синхронизированные ячейки
+    не хранятся.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # Процессы с одинаковым identity работают с одним файлом базы
+        self.identity = f"{socket.gethostname()}:{os.path.abspath(path)}"
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Транзакция BEGIN IMMEDIATE: пока она открыта, другие процессы с этим файлом
+        базы не могут писать, а другие потоки процесса ждут. Вложенный вызов в том же
+        потоке выполняется внутри внешней транзакции."""
+        with self._lock:
+            if self._conn.in_transaction:
+                yield
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def cells(self, spreadsheet: str, title: str, rows: tuple[int, int] | None = None,
+              cols: list[int] | None = None) -> dict[tuple[int, int], str]:
+        """Непустые ячейки листа; `rows` (первая, последняя) и `cols` ограничивают диапазон"""
+        sql = "SELECT row, col, value FROM cells WHERE spreadsheet = ? AND title = ? AND value != ''"
+        params: list = [spreadsheet, title]
+        if rows is not None:
+            sql += " AND row BETWEEN ? AND ?"
+            params.extend(rows)
+        if cols is not None:
+            sql += f" AND col IN ({', '.join('?' * len(cols))})"
+            params.extend(cols)
+        return {(row, col): value for row, col, value in self._query(sql, tuple(params))}
+
+    def value(self, spreadsheet: str, title: str, row: int, col: int) -> str:
+        rows = self._query("SELECT value FROM cells WHERE spreadsheet = ? AND title = ? AND row = ? AND col = ?",
+                           (spreadsheet, title, row, col))
+        return rows[0][0] if rows else ""
+
+    def pulled_at(self, spreadsheet: str, title: str) -> float | None:
+        rows = self._query("SELECT pulled_at FROM worksheets WHERE spreadsheet = ? AND title = ?", (spreadsheet, title))
+        return rows[0][0] if rows else None
+
+    def tracked(self) -> list[tuple[str, str, float]]:
+        return self._query("SELECT spreadsheet, title, pulled_at FROM worksheets")
+
+    def header_version(self, spreadsheet: str, title: str) -> int:
+        """Счетчик изменений первой строки листа: по нему кеши раскладки листа узнают о правке заголовков"""
+        rows = self._query("SELECT version FROM header_versions WHERE spreadsheet = ? AND title = ?",
+                           (spreadsheet, title))
+        return rows[0][0] if rows else 0
+
+    def _bump_header(self, spreadsheet: str, title: str, rows) -> None:
+        if any(row == 1 for row in rows):
+            self._conn.execute(
+                "INSERT INTO header_versions (spreadsheet, title, version) VALUES (?, ?, 1) "
+                "ON CONFLICT (spreadsheet, title) DO UPDATE SET version = version + 1", (spreadsheet, title))
+
+    def write(self, spreadsheet: str, title: str, cells: list[tuple[int, int, str]],
+              priority: int = PRIORITIES["default"]) -> None:
+        """Локальная запись; ячейка, уже ждущая отправки, сохраняет более высокий из двух приоритетов"""
+        now = time.time()
+        with self.transaction():
+            self._conn.executemany(
+                "INSERT INTO cells (spreadsheet, title, row, col, value, base, dirty, updated_at, priority) "
+                "VALUES (?, ?, ?, ?, ?, '', 1, ?, ?) "
+                "ON CONFLICT (spreadsheet, title, row, col) DO UPDATE SET "
+                "value = excluded.value, dirty = (excluded.value != base), updated_at = excluded.updated_at, "
+                "priority = CASE WHEN dirty = 1 THEN MIN(priority, excluded.priority) ELSE excluded.priority END",
+                [(spreadsheet, title, row, col, value, now, priority) for row, col, value in cells],
+            )
+            self._bump_header(spreadsheet, title, (row for row, _, _ in cells))
+
+    def apply(self, spreadsheet: str, title: str, cells: list[tuple[int, int, str]]) -> None:
+        """Значения, записанные другим процессом со своим хранилищем, принимаются как синхронизированные.
+
+        Листы, которые здесь еще не читались, и несинхронизированные локальные
+        ячейки не меняются.
+        """
+        now = time.time()
+        with self.transaction():
+            if self._conn.execute("SELECT 1 FROM worksheets WHERE spreadsheet = ? AND title = ?",
+                                  (spreadsheet, title)).fetchone() is not None:
+                self._conn.executemany(
+                    "INSERT INTO cells (spreadsheet, title, row, col, value, base, dirty, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0, ?) "
+                    "ON CONFLICT (spreadsheet, title, row, col) DO UPDATE SET "
+                    "value = excluded.value, base = excluded.base, updated_at = excluded.updated_at "
+                    "WHERE dirty = 0",
+                    [(spreadsheet, title, row, col, value, value, now) for row, col, value in cells],
+                )
+                self._bump_header(spreadsheet, title, (row for row, _, _ in cells))
+
+    def pending_value(self, spreadsheet: str, title: str, row: int, col: int) -> str | None:
+        rows = self._query("SELECT value FROM cells WHERE spreadsheet = ? AND title = ? AND row = ? AND col = ? "
+                           "AND dirty = 1", (spreadsheet, title, row, col))
+        return rows[0][0] if rows else None
+
+    def dirty(self) -> list[tuple[str, int, list[tuple[str, int, int, str]]]]:
+        """Несинхронизированные ячейки по таблицам: [(таблица, высший приоритет, ячейки)],
+        таблицы с более срочными записями — первыми"""
+        batch: dict[str, list[tuple[str, int, int, str]]] = {}
+        priorities: dict[str, int] = {}
+        for spreadsheet, title, row, col, value, priority in self._query(
+                "SELECT spreadsheet, title, row, col, value, priority FROM cells WHERE dirty = 1"):
+            batch.setdefault(spreadsheet, []).append((title, row, col, value))
+            priorities[spreadsheet] = min(priority, priorities.get(spreadsheet, priority))
+        return sorted(((spreadsheet, priorities[spreadsheet], cells) for spreadsheet, cells in batch.items()),
+                      key=lambda item: item[1])
+
+    def dirty_count(self) -> int:
+        return self._query("SELECT COUNT(*) FROM cells WHERE dirty = 1")[0][0]
+
+    def mark_pushed(self, spreadsheet: str, cells: list[tuple[str, int, int, str]]) -> None:
+        """Отправленные значения становятся базовыми, если с тех пор не менялись"""
+        with self.transaction():
+            self._conn.executemany(
+                "UPDATE cells SET base = value, dirty = 0 "
+                "WHERE spreadsheet = ? AND title = ? AND row = ? AND col = ? AND value = ?",
+                [(spreadsheet, title, row, col, value) for title, row, col, value in cells],
+            )
+
+    def merge(self, spreadsheet: str, title: str, values: list[list[str]], pulled_at: float | None = None) -> int:
+        """Сливает прочитанный из таблицы лист с локальными ячейками.
+
+        Несинхронизированная локальная ячейка, которую в таблице тоже изменили,
+        считается конфликтом: он записывается в `conflicts`, побеждает значение
+        из таблицы. `pulled_at` — когда лист был прочитан из таблицы (для
+        снимка из общего кеша — когда его читали): синхронизированные ячейки,
+        измененные здесь позже, лист прочитан до них, и они не откатываются.
+        Возвращает число конфликтов.
+        """
+        remote = {}
+        for row_i, row in enumerate(values, start=1):
+            for col_i, value in enumerate(row, start=1):
+                if value != "":
+                    remote[(row_i, col_i)] = value
+
+        now = time.time()
+        with self.transaction():
+            local = {(row, col): (value, base, dirty, updated_at)
+                     for row, col, value, base, dirty, updated_at in self._conn.execute(
+                         "SELECT row, col, value, base, dirty, updated_at FROM cells "
+                         "WHERE spreadsheet = ? AND title = ?", (spreadsheet, title))}
+
+            upserts, deletes, conflicts = [], [], []
+            for cell in remote.keys() | local.keys():
+                remote_value = remote.get(cell, "")
+                value, base, dirty, updated_at = local.get(cell, ("", "", 0, 0.0))
+                if dirty:
+                    if remote_value == base:
+                        continue
+                    if remote_value != value:
+                        conflicts.append((spreadsheet, title, *cell, value, remote_value, base, now))
+                elif remote_value == value == base:
+                    continue
+                elif pulled_at is not None and updated_at > pulled_at:
+                    continue
+                if remote_value:
+                    upserts.append((spreadsheet, title, *cell, remote_value, remote_value, now))
+                else:
+                    deletes.append((spreadsheet, title, *cell))
+
+            self._conn.executemany(
+                "INSERT INTO cells (spreadsheet, title, row, col, value, base, dirty, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?) "
+                "ON CONFLICT (spreadsheet, title, row, col) DO UPDATE SET "
+                "value = excluded.value, base = excluded.base, dirty = 0, updated_at = excluded.updated_at",
+                upserts,
+            )
+            self._conn.executemany(
+                "DELETE FROM cells WHERE spreadsheet = ? AND title = ? AND row = ? AND col = ?", deletes)
+            self._bump_header(spreadsheet, title, (cell[2] for cell in upserts + deletes))
+            self._conn.executemany(
+                "INSERT INTO conflicts (spreadsheet, title, row, col, local, remote, base, detected_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", conflicts)
+            self._conn.execute(
+                "INSERT INTO worksheets (spreadsheet, title, pulled_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (spreadsheet, title) DO UPDATE SET pulled_at = excluded.pulled_at",
+                (spreadsheet, title, pulled_at or now))
+        return len(conflicts)
+
+    def forget(self, spreadsheet: str, title: str) -> None:
+        """Лист удален из таблицы: перестать синхронизировать его"""
+        with self._lock:
+            self._conn.execute("DELETE FROM worksheets WHERE spreadsheet = ? AND title = ?", (spreadsheet, title))
+            self._conn.execute("DELETE FROM cells WHERE spreadsheet = ? AND title = ?", (spreadsheet, title))
+            self._bump_header(spreadsheet, title, (1,))
+
+    def lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Берет или продлевает аренду `name` на `ttl` секунд; False, если ее держит другой владелец.
+
+        Аренда живет в файле базы, поэтому ее видят все процессы, работающие с этим хранилищем.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at < ?", (name, owner, now + ttl, now))
+            return self._conn.execute("SELECT owner FROM leases WHERE name = ?", (name,)).fetchone()[0] == owner
+
+    def release(self, name: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def conflicts(self, limit: int = 100) -> list[dict]:
+        rows = self._query("SELECT spreadsheet, title, row, col, local, remote, base, detected_at FROM conflicts "
+                           "ORDER BY id DESC LIMIT ?", (limit,))
+        fields = ("spreadsheet", "title", "row", "col", "local", "remote", "base", "detected_at")
+        return [dict(zip(fields, row)) for row in rows]
+
+
+class LocalWorksheet:
+    """Лист из локального хранилища с тем же API чтения, что у gspread.Worksheet"""
+
+    def __init__(self, store: LocalStore, spreadsheet_id: str, title: str):
+        self.store = store
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+
+    def get_all_values(self) -> list[list[str]]:
+        cells = self.store.cells(self.spreadsheet_id, self.title)
+        if not cells:
+            return []
+        rows = max(row for row, _ in cells)
+        cols = max(col for _, col in cells)
+        values = [[""] * cols for _ in range(rows)]
+        for (row, col), value in cells.items():
+            values[row - 1][col - 1] = value
+        return values
+
+    def row_values(self, row: int) -> list[str]:
+        cells = {col: value for (_, col), value in
+                 self.store.cells(self.spreadsheet_id, self.title, rows=(row, row)).items()}
+        return [cells.get(col, "") for col in range(1, max(cells, default=0) + 1)]
+
+    def col_values(self, col: int) -> list[str]:
+        cells = {row: value for (row, _), value in
+                 self.store.cells(self.spreadsheet_id, self.title, cols=[col]).items()}
+        return [cells.get(row, "") for row in range(1, max(cells, default=0) + 1)]
+
+    def get_columns(self, cols: list[int], first_row: int = 1) -> list[tuple[int, list[str]]]:
+        """Значения столбцов `cols` начиная со строки `first_row`: [(номер строки, значения)].
+        Строки, в которых все эти столбцы пусты, пропускаются."""
+        if not cols:
+            return []
+        cells = self.store.cells(self.spreadsheet_id, self.title, rows=(first_row, 2 ** 31), cols=cols)
+        rows = sorted({row for row, _ in cells})
+        return [(row, [cells.get((row, col), "") for col in cols]) for row in rows]
+
+    def cell(self, row: int, col: int) -> Cell:
+        return Cell(row, col, self.store.value(self.spreadsheet_id, self.title, row, col) or None)
+
+
+class SyncEngine:
+    """Синхронизация локального хранилища с Google Sheets.
+
+    Записи бэкенда сразу попадают в SQLite и раз в `push_interval` секунд
+    уходят в таблицы одним `values_batch_update` на таблицу; таблицы с
+    записями оценок отправляются раньше регистраций и правок из админки, и
+    запрос идет в планировщик с высшим приоритетом своих ячеек. Отправляет их
+    только процесс, держащий аренду `flush` в хранилище: процессы с общим
+    файлом базы иначе отправляли бы одни и те же ячейки. Раз в
+    `pull_interval` секунд отслеживаемые листы перечитываются, чтобы подхватить
+    правки преподавателей. Интерфейс записи совпадает с прежней очередью записей.
+    Слушатели `listeners` получают каждую запись бэкенда: (таблица, лист, ячейки).
+    С `snapshots` листы читаются через общий для процессов кеш в Redis, и
+    лист, нужный нескольким процессам сразу, читается из таблицы один раз.
+    """
+
+    def __init__(self, store: LocalStore, sheets: SheetsClient,
+                 push_interval: float = 1.0, pull_interval: float = 60.0, batch_size: int = 50,
+                 snapshots: SnapshotCache | None = None, lease_ttl: float = 30.0):
+        self.store = store
+        self.sheets = sheets
+        self.snapshots = snapshots
+        self.push_interval = push_interval
+        self.pull_interval = pull_interval
+        self.batch_size = batch_size
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._flush_lock = threading.Lock()
+        self._pull_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.listeners: list[Callable[[str, str, list[tuple[int, int, str]]], None]] = []
+
+    def _read(self, spreadsheet_id: str, titles: list[str]) -> dict[str, list[list[str]]]:
+        if len(titles) == 1:
+            return {titles[0]: self.sheets.worksheet(spreadsheet_id, titles[0]).get_all_values()}
+        response = self.sheets.spreadsheet(spreadsheet_id).values_batch_get(
+            [absolute_range_name(title) for title in titles])
+        return {title: value_range.get("values", [])
+                for title, value_range in zip(titles, response.get("valueRanges", []))}
+
+    def _fetch(self, spreadsheet_id: str, titles: list[str],
+               max_age: float | None) -> dict[str, tuple[float, list[list[str]]]]:
+        """{лист: (когда прочитан, значения)}; без общего кеша — прямо из таблицы"""
+        if self.snapshots is None:
+            fetched_at = time.time()
+            return {title: (fetched_at, values) for title, values in self._read(spreadsheet_id, titles).items()}
+        return self.snapshots.fetch(spreadsheet_id, titles, lambda missing: self._read(spreadsheet_id, missing),
+                                    max_age=max_age)
+
+    def pull(self, spreadsheet_id: str, title: str, max_age: float | None = None) -> None:
+        """Перечитывает лист; `max_age` — допустимый возраст снимка из общего кеша"""
+        with self._guard:
+            lock = self._pull_locks.setdefault((spreadsheet_id, title), threading.Lock())
+        with lock, TRACER.span("local_store.pull", spreadsheet=spreadsheet_id, title=title) as span:
+            pulled_at, values = self._fetch(spreadsheet_id, [title], max_age)[title]
+            conflicts = self.store.merge(spreadsheet_id, title, values, pulled_at)
+            if span is not None:
+                span.set(rows=len(values), conflicts=conflicts)
+        if conflicts:
+            print(f"Конфликтов при синхронизации листа {title}: {conflicts}, приняты значения из таблицы")
+
+    def pull_many(self, spreadsheet_id: str, titles: list[str], max_age: float | None = None) -> None:
+        """Перечитывает несколько листов одной таблицы пакетами по `batch_size` в одном values_batch_get"""
+        for i in range(0, len(titles), self.batch_size):
+            chunk = titles[i:i + self.batch_size]
+            with TRACER.span("local_store.pull_many", spreadsheet=spreadsheet_id, sheets=len(chunk)):
+                conflicts = 0
+                for title, (pulled_at, values) in self._fetch(spreadsheet_id, chunk, max_age).items():
+                    conflicts += self.store.merge(spreadsheet_id, title, values, pulled_at)
+            if conflicts:
+                print(f"Конфликтов при синхронизации листов {', '.join(chunk)}: {conflicts}, приняты значения из таблицы")
+
+    def _stale(self, spreadsheet_id: str, title: str, max_age: float | None) -> bool:
+        pulled_at = self.store.pulled_at(spreadsheet_id, title)
+        return pulled_at is None or (max_age is not None and time.time() - pulled_at >= max_age)
+
+    def worksheets(self, spreadsheet_id: str, titles: list[str], max_age: float | None = None) -> list[LocalWorksheet]:
+        """Как `worksheet`, но устаревшие листы читаются из таблицы одним пакетным запросом"""
+        stale = [title for title in titles if self._stale(spreadsheet_id, title, max_age)]
+        for title in titles:
+            metrics.CACHE_REQUESTS.inc(cache="local_store", result="miss" if title in stale else "hit")
+        if stale:
+            self.pull_many(spreadsheet_id, stale, max_age)
+        return [LocalWorksheet(self.store, spreadsheet_id, title) for title in titles]
+
+    def worksheet(self, spreadsheet_id: str, title: str, max_age: float | None = None) -> LocalWorksheet:
+        """Лист из хранилища; при первом обращении или если он старше `max_age` — читается из таблицы"""
+        if self._stale(spreadsheet_id, title, max_age):
+            metrics.CACHE_REQUESTS.inc(cache="local_store", result="miss")
+            self.pull(spreadsheet_id, title, max_age)
+        else:
+            metrics.CACHE_REQUESTS.inc(cache="local_store", result="hit")
+        return LocalWorksheet(self.store, spreadsheet_id, title)
+
+    def update_cell(self, ws, row: int, col: int, value) -> None:
+        self.update_cells(ws, [(row, col, value)])
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Критическая секция «прочитать листы — решить — записать», общая для всех
+        процессов с этим файлом хранилища (транзакция BEGIN IMMEDIATE).
+
+        Записи внутри видны остальным только после выхода; тогда же они
+        отправляются в таблицу и рассылаются слушателям.
+        """
+        if getattr(self._local, "pending", None) is not None:
+            yield
+            return
+        pending = self._local.pending = []
+        try:
+            with self.store.transaction():
+                yield
+        finally:
+            self._local.pending = None
+        for ws, cells in pending:
+            self._written(ws, cells)
+
+    def update_cells(self, ws, cells: list[tuple[int, int, object]]) -> None:
+        cells = [(row, col, str(value)) for row, col, value in cells]
+        priority = PRIORITIES.get(SheetsScheduler.current_priority(), PRIORITIES["default"])
+        self.store.write(ws.spreadsheet_id, ws.title, cells, priority)
+        pending = getattr(self._local, "pending", None)
+        if pending is not None:
+            pending.append((ws, cells))
+        else:
+            self._written(ws, cells)
+
+    def _written(self, ws, cells: list[tuple[int, int, str]]) -> None:
+        if self._thread is None:
+            self.flush()
+        else:
+            self._wakeup.set()
+        for listener in self.listeners:
+            try:
+                listener(ws.spreadsheet_id, ws.title, cells)
+            except Exception as e:
+                print(f"Ошибка уведомления о записи в лист {ws.title}: {e}")
+
+    def pending_value(self, ws, row: int, col: int) -> str | None:
+        return self.store.pending_value(ws.spreadsheet_id, ws.title, row, col)
+
+    def size(self) -> int:
+        return self.store.dirty_count()
+
+    def flush(self) -> None:
+        """Отправляет несинхронизированные ячейки, если аренду записи держит этот процесс"""
+        with self._flush_lock:
+            for spreadsheet_id, priority, cells in self.store.dirty():
+                # Аренда продлевается перед каждой таблицей: запись может долго ждать квоту
+                if not self.store.lease("flush", self.owner, self.lease_ttl):
+                    return
+                data = [{"range": absolute_range_name(title, rowcol_to_a1(row, col)), "values": [[value]]}
+                        for title, row, col, value in cells]
+                try:
+                    with SheetsScheduler.priority(PRIORITY_NAMES.get(priority, "default")):
+                        self.sheets.spreadsheet(spreadsheet_id).values_batch_update(
+                            {"valueInputOption": "USER_ENTERED", "data": data}
+                        )
+                except Exception as e:
+                    print(f"Ошибка пакетной записи в таблицу {spreadsheet_id}: {e}")
+                    continue
+                self.store.mark_pushed(spreadsheet_id, cells)
+                if self.snapshots is not None:
+                    self.snapshots.bump(spreadsheet_id, sorted({title for title, _, _, _ in cells}))
+
+    def pull_stale(self) -> None:
+        for spreadsheet_id, title, pulled_at in self.store.tracked():
+            if time.time() - pulled_at < self.pull_interval:
+                continue
+            try:
+                self.pull(spreadsheet_id, title, self.pull_interval)
+            except gspread.WorksheetNotFound:
+                print(f"Лист {title} удален из таблицы, синхронизация прекращена")
+                self.store.forget(spreadsheet_id, title)
+            except Exception as e:
+                print(f"Не удалось синхронизировать лист {title}: {e}")
+
+    def _run(self) -> None:
+        next_pull = time.monotonic()
+        while not self._stop.is_set():
+            self._wakeup.wait(self.push_interval)
+            self._wakeup.clear()
+            self.flush()
+            if time.monotonic() >= next_pull:
+                self.pull_stale()
+                next_pull = time.monotonic() + min(self.pull_interval, 10)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self.store.release("flush", self.owner)
+
+
+class LocalSheets:
+    """Замена SheetsClient для обработчиков: листы читаются из локального хранилища,
+    раскладки листов (столбцы по заголовкам, строки по значениям) кешируются в `layouts`"""
+
+    def __init__(self, sync: SyncEngine):
+        self.sync = sync
+        self.layouts = LayoutCache()
+
+    def worksheet(self, key: str, title: str, max_age: float | None = None) -> LocalWorksheet:
+        return self.sync.worksheet(key, title, max_age=max_age)
+
+    def worksheets(self, key: str, titles: list[str], max_age: float | None = None) -> list[LocalWorksheet]:
+        return self.sync.worksheets(key, titles, max_age=max_age)
+
+    def worksheet_titles(self, key: str) -> list[str]:
+        return self.sync.sheets.worksheet_titles(key)
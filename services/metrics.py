@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * len(self.buckets), 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        for key, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса; `collectors` вызываются перед выдачей, чтобы
+    обновить датчики, значения которых читаются из других объектов"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []
+
+    def add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        self._collectors.append(func)
+        return func
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Ошибка сбора метрик в {getattr(collect, '__name__', collect)}: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.add(Histogram(
+    "http_request_duration_seconds", "Время обработки запроса к бэкенду", ("method", "route")))
+HTTP_REQUESTS = REGISTRY.add(Counter(
+    "http_requests_total", "Запросы к бэкенду", ("method", "route", "status")))
+HTTP_IN_PROGRESS = REGISTRY.add(Gauge(
+    "http_requests_in_progress", "Запросы, обрабатываемые в данный момент"))
+
+SHEETS_REQUEST_DURATION = REGISTRY.add(Histogram(
+    "sheets_request_duration_seconds", "Время запроса к Google Sheets API без ожидания в планировщике", ("operation",)))
+SHEETS_REQUESTS = REGISTRY.add(Counter(
+    "sheets_requests_total", "Запросы к Google Sheets API", ("operation", "status")))
+SHEETS_SCHEDULER_WAIT = REGISTRY.add(Histogram(
+    "sheets_scheduler_wait_seconds", "Ожидание квоты в планировщике запросов к Sheets", ("priority",)))
+SHEETS_QUEUE_DEPTH = REGISTRY.add(Gauge(
+    "sheets_scheduler_queue_depth", "Запросы к Sheets, ожидающие квоты", ("priority",)))
+SHEETS_PENDING_WRITES = REGISTRY.add(Gauge(
+    "sheets_pending_writes", "Ячейки, еще не отправленные в Google Sheets"))
+
+GITHUB_REQUEST_DURATION = REGISTRY.add(Histogram(
+    "github_request_duration_seconds", "Время запроса к GitHub API", ("operation",)))
+GITHUB_REQUESTS = REGISTRY.add(Counter(
+    "github_requests_total", "Запросы к GitHub API", ("operation", "status")))
+GITHUB_RATE_LIMIT_REMAINING = REGISTRY.add(Gauge(
+    "github_rate_limit_remaining", "Остаток лимита GitHub API из заголовка X-RateLimit-Remaining", ("resource",)))
+
+CACHE_REQUESTS = REGISTRY.add(Counter(
+    "cache_requests_total", "Обращения к кешам по результату", ("cache", "result")))
+INVALIDATION_EVENTS = REGISTRY.add(Counter(
+    "invalidation_events_total", "События шины инвалидации: опубликованные, примененные, устаревшие",
+    ("kind", "result")))
+LAB_COLUMN_FALLBACKS = REGISTRY.add(Counter(
+    "lab_column_fallbacks_total",
+    "Оценки, записанные в столбец ЛР по смещению от GitHub: заголовка ЛР{n} на листе группы нет"))
+
+THREADPOOL_BUSY = REGISTRY.add(Gauge(
+    "threadpool_busy_threads", "Занятые потоки пула синхронных обработчиков"))
+THREADPOOL_SIZE = REGISTRY.add(Gauge(
+    "threadpool_max_threads", "Размер пула синхронных обработчиков"))
+JOB_QUEUE_DEPTH = REGISTRY.add(Gauge(
+    "grading_job_queue_depth", "Задачи проверки, ожидающие воркера"))
@@ -0,0 +1,23 @@
+import time
+
+
+class RedisCircuit:
+    """Отключает обращения к Redis на `retry_after` секунд после ошибки.
+
+    Все, что хранится в Redis, — кеши и координация между процессами, без
+    которых бэкенд продолжает работать. Пока цепь разомкнута, вызывающий код
+    сразу идет запасным путем, а не ждет таймаута соединения в каждом запросе.
+    """
+
+    def __init__(self, name: str, retry_after: float = 5.0):
+        self.name = name
+        self.retry_after = retry_after
+        self._down_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def failed(self, e: Exception) -> None:
+        self._down_until = time.monotonic() + self.retry_after
+        print(f"{self.name}: Redis недоступен, повтор через {self.retry_after:g} с: {e}")
@@ -0,0 +1,87 @@
+from fastapi import HTTPException
+
+from services.local_store import LocalWorksheet
+
+
+def select_columns(headers: list[str], spec: str | None) -> list[int]:
+    """Номера столбцов (с 1) по списку вида "ФИО,GitHub,ЛР*".
+
+    Имена сравниваются без учета регистра, `*` в конце — совпадение по
+    префиксу. Без `spec` выбираются все столбцы с непустым заголовком.
+    """
+    if not spec:
+        return [i for i, header in enumerate(headers, start=1) if header.strip()]
+    folded = [header.strip().casefold() for header in headers]
+    selected, unknown = [], []
+    for name in (part.strip() for part in spec.split(",")):
+        if not name:
+            continue
+        key = name.casefold()
+        if key.endswith("*"):
+            matches = [i for i, header in enumerate(folded, start=1) if header and header.startswith(key[:-1])]
+        else:
+            matches = [i for i, header in enumerate(folded, start=1) if header == key]
+        if not matches:
+            unknown.append(name)
+        selected.extend(i for i in matches if i not in selected)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные столбцы: {', '.join(unknown)}")
+    return selected
+
+
+def parse_filters(headers: list[str], filters: list[str]) -> list[tuple[int, bool, str]]:
+    """Условия вида "Столбец=значение" и "Столбец!=значение" -> [(столбец, равно?, значение)].
+
+    Значения сравниваются без учета регистра; "ЛР1!=" оставляет строки с непустым ЛР1.
+    """
+    folded = [header.strip().casefold() for header in headers]
+    parsed = []
+    for item in filters:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise HTTPException(status_code=400, detail=f"Некорректный фильтр: {item}")
+        negate = name.endswith("!")
+        name = name[:-1] if negate else name
+        try:
+            col = folded.index(name.strip().casefold()) + 1
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Неизвестный столбец в фильтре: {name.strip()}")
+        parsed.append((col, not negate, value.strip().casefold()))
+    return parsed
+
+
+def query_results(sheet: LocalWorksheet, columns: str | None = None, filters: list[str] | None = None,
+                  cursor: str | None = None, limit: int | None = None) -> dict:
+    """Страница результатов группы: только выбранные столбцы и строки, прошедшие фильтры.
+
+    Курсор — номер строки листа, с которой начинается следующая страница;
+    без `limit` возвращаются все строки начиная с курсора.
+    Строки, в которых все выбранные столбцы пусты, не возвращаются.
+    """
+    headers = sheet.row_values(1)
+    cols = select_columns(headers, columns)
+    conditions = parse_filters(headers, filters or [])
+    try:
+        first_row = max(int(cursor), 2) if cursor else 2
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+    read_cols = cols + [col for col, _, _ in conditions if col not in cols]
+    rows, next_cursor = [], None
+    for row, values in sheet.get_columns(read_cols, first_row):
+        cells = dict(zip(read_cols, values))
+        if not any(cells[col] for col in cols):
+            continue
+        if not all((cells[col].strip().casefold() == value) == equals for col, equals, value in conditions):
+            continue
+        if limit is not None and len(rows) == limit:
+            next_cursor = str(row)
+            break
+        rows.append({"row": row, "values": [cells[col] for col in cols]})
+
+    return {
+        "headers": [headers[col - 1] for col in cols],
+        "rows": [item["values"] for item in rows],
+        "row_numbers": [item["row"] for item in rows],
+        "next_cursor": next_cursor,
+    }
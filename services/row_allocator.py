@@ -0,0 +1,15 @@
+def _is_empty(row: list[str]) -> bool:
+    return all(not cell.strip() for cell in row)
+
+
+def free_row(values: list[list[str]], first_row: int = 2) -> int:
+    """Первая пустая строка листа начиная с `first_row` по уже прочитанным значениям.
+
+    Решение принимается без построчных запросов. Чтение, выбор строки и запись
+    в нее нужно выполнять внутри одного `SyncEngine.exclusive()`: тогда
+    регистрации из разных процессов с общим хранилищем не займут одну строку.
+    """
+    row_i = first_row
+    while row_i <= len(values) and not _is_empty(values[row_i - 1]):
+        row_i += 1
+    return row_i
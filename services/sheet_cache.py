@@ -0,0 +1,172 @@
+import json
+import time
+import uuid
+import zlib
+from typing import Callable
+
+import redis
+from redis import RedisError
+
+from services import metrics
+from services.redis_circuit import RedisCircuit
+
+# Ревизия листа и снимок этой ревизии за один запрос
+_GET = """
+local result = {}
+for i, key in ipairs(KEYS) do
+  local revision = redis.call('GET', key) or '0'
+  result[#result + 1] = revision
+  result[#result + 1] = redis.call('GET', ARGV[i] .. revision) or false
+end
+return result
+"""
+
+# Снимает блокировку, только если она все еще наша
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+Values = list[list[str]]
+
+
+class SnapshotCache:
+    """Общий для процессов второй уровень кеша листов: сжатые снимки в Redis.
+
+    Снимок лежит под ключом `<prefix>:snapshot:<таблица>:<лист>:<ревизия>`,
+    ревизия увеличивается после каждой записи бэкенда в лист (`bump`), поэтому
+    снимок, прочитанный до записи, больше не находится. Промах разбирает
+    тот, кто первым взял блокировку листа; остальные процессы ждут появления
+    снимка не дольше `wait` секунд и только потом читают таблицу сами.
+    Ошибки Redis не мешают работе: лист читается напрямую, а Redis не
+    опрашивается `retry_after` секунд.
+    """
+
+    def __init__(self, url: str, ttl: float = 300, lock_timeout: float = 30, wait: float = 10,
+                 poll_interval: float = 0.05, prefix: str = "sheets", retry_after: float = 5.0):
+        self.redis = redis.Redis.from_url(url, socket_connect_timeout=2, socket_timeout=5)
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.circuit = RedisCircuit("Кеш снимков листов", retry_after)
+        self._get = self.redis.register_script(_GET)
+        self._release = self.redis.register_script(_RELEASE)
+
+    def _key(self, kind: str, spreadsheet_id: str, title: str) -> str:
+        return f"{self.prefix}:{kind}:{spreadsheet_id}:{title}"
+
+    def get(self, spreadsheet_id: str, titles: list[str],
+            max_age: float | None = None) -> tuple[dict[str, tuple[float, Values]], dict[str, str]]:
+        """Снимки текущих ревизий не старше `max_age`: ({лист: (прочитан в, значения)}, {лист: ревизия})"""
+        reply = self._get(keys=[self._key("revision", spreadsheet_id, title) for title in titles],
+                          args=[self._key("snapshot", spreadsheet_id, title) + ":" for title in titles])
+        found, revisions = {}, {}
+        for title, revision, blob in zip(titles, reply[0::2], reply[1::2]):
+            revisions[title] = revision.decode()
+            if not blob:
+                continue
+            snapshot = json.loads(zlib.decompress(blob))
+            if max_age is None or time.time() - snapshot["fetched_at"] < max_age:
+                found[title] = (snapshot["fetched_at"], snapshot["values"])
+        return found, revisions
+
+    def put(self, spreadsheet_id: str, snapshots: dict[str, tuple[str, float, Values]]) -> None:
+        """Сохраняет снимки {лист: (ревизия, прочитан в, значения)}"""
+        pipe = self.redis.pipeline(transaction=False)
+        for title, (revision, fetched_at, values) in snapshots.items():
+            blob = zlib.compress(json.dumps({"fetched_at": fetched_at, "values": values},
+                                            ensure_ascii=False).encode())
+            pipe.set(f"{self._key('snapshot', spreadsheet_id, title)}:{revision}", blob, ex=int(self.ttl))
+        pipe.execute()
+
+    def bump(self, spreadsheet_id: str, titles: list[str]) -> None:
+        """Лист изменен бэкендом: снимки прежних ревизий больше не выдаются"""
+        if not self.circuit.available:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for title in titles:
+                pipe.incr(self._key("revision", spreadsheet_id, title))
+            pipe.execute()
+        except RedisError as e:
+            self.circuit.failed(e)
+
+    def fetch(self, spreadsheet_id: str, titles: list[str], load: Callable[[list[str]], dict[str, Values]],
+              max_age: float | None = None) -> dict[str, tuple[float, Values]]:
+        """Листы из снимков, а недостающие — через `load(листы)` с защитой от одновременного чтения.
+
+        Возвращает {лист: (время чтения из таблицы, значения)}.
+        """
+        if not self.circuit.available:
+            return self._load(load, titles)
+        try:
+            found, revisions = self.get(spreadsheet_id, titles, max_age)
+        except RedisError as e:
+            self.circuit.failed(e)
+            return self._load(load, titles)
+        for title in found:
+            metrics.CACHE_REQUESTS.inc(cache="sheet_snapshot", result="hit")
+
+        missing = [title for title in titles if title not in found]
+        token = uuid.uuid4().hex
+        owned, waiting = [], []
+        try:
+            for title in missing:
+                locked = self.redis.set(self._key("lock", spreadsheet_id, title), token,
+                                        nx=True, px=int(self.lock_timeout * 1000))
+                (owned if locked else waiting).append(title)
+        except RedisError as e:
+            self.circuit.failed(e)
+            return {**found, **self._load(load, missing)}
+
+        try:
+            if owned:
+                metrics.CACHE_REQUESTS.inc(len(owned), cache="sheet_snapshot", result="miss")
+                loaded = self._load(load, owned)
+                found.update(loaded)
+                try:
+                    self.put(spreadsheet_id, {title: (revisions[title], *loaded[title]) for title in loaded})
+                except RedisError as e:
+                    self.circuit.failed(e)
+            if waiting:
+                found.update(self._await(spreadsheet_id, waiting, load, max_age))
+        finally:
+            self._unlock(spreadsheet_id, owned, token)
+        return found
+
+    def _await(self, spreadsheet_id: str, titles: list[str], load, max_age: float | None) -> dict:
+        """Ждет снимки, которые читает другой процесс; по истечении `wait` читает сам"""
+        deadline = time.monotonic() + self.wait
+        result = {}
+        while titles and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            try:
+                found, _ = self.get(spreadsheet_id, titles, max_age)
+            except RedisError as e:
+                self.circuit.failed(e)
+                break
+            result.update(found)
+            titles = [title for title in titles if title not in found]
+        metrics.CACHE_REQUESTS.inc(len(result), cache="sheet_snapshot", result="waited")
+        if titles:
+            metrics.CACHE_REQUESTS.inc(len(titles), cache="sheet_snapshot", result="timeout")
+            result.update(self._load(load, titles))
+        return result
+
+    def _unlock(self, spreadsheet_id: str, titles: list[str], token: str) -> None:
+        try:
+            for title in titles:
+                self._release(keys=[self._key("lock", spreadsheet_id, title)], args=[token])
+        except RedisError as e:
+            self.circuit.failed(e)
+
+    @staticmethod
+    def _load(load, titles: list[str]) -> dict[str, tuple[float, Values]]:
+        if not titles:
+            return {}
+        fetched_at = time.time()
+        return {title: (fetched_at, values) for title, values in load(titles).items()}
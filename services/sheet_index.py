@@ -0,0 +1,147 @@
+import threading
+import time
+
+from services.local_store import LocalSheets
+
+
+def _key(value) -> str:
+    return str(value if value is not None else "").strip()
+
+
+class SheetIndex:
+    """Снимок листа с хеш-индексами по выбранным колонкам.
+
+    Лист целиком читается одним `get_all_values()` из локального хранилища и
+    обновляется в фоне раз в `ttl` секунд. Собственные записи бэкенда применяются к снимку через
+    `update()`, поэтому перечитывать лист после них не нужно.
+    """
+
+    def __init__(self, sheets: LocalSheets, spreadsheet_id: str, title: str,
+                 keys: tuple[str, ...], ttl: float = 60, casefold: tuple[str, ...] = (),
+                 min_refresh_interval: float = 5):
+        self.sheets = sheets
+        self.spreadsheet_id = spreadsheet_id
+        self.title = title
+        self.keys = keys
+        self.casefold = casefold
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.header: list[str] = []
+        self._records: dict[int, dict] = {}
+        self._indexes: dict[str, dict[str, int]] = {k: {} for k in keys}
+        self._loaded_at = 0.0
+        self._overlay: dict[tuple[int, str], tuple[float, str]] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _normalize(self, column: str, value) -> str:
+        value = _key(value)
+        return value.lower() if column in self.casefold else value
+
+    def refresh(self, max_age: float | None = None) -> None:
+        values = self.sheets.worksheet(self.spreadsheet_id, self.title, max_age=max_age).get_all_values()
+        header = [h.strip() for h in values[0]] if values else []
+
+        records = {}
+        for row_i, row in enumerate(values[1:], start=2):
+            records[row_i] = {h: (row[i] if i < len(row) else "") for i, h in enumerate(header) if h}
+
+        with self._lock:
+            # Недавние локальные записи могли еще не попасть в прочитанные данные
+            cutoff = time.monotonic() - 2 * self.ttl
+            self._overlay = {k: v for k, v in self._overlay.items() if v[0] >= cutoff}
+            for (row_i, column), (_, value) in self._overlay.items():
+                if row_i in records:
+                    records[row_i][column] = value
+
+            indexes = {k: {} for k in self.keys}
+            for row_i, rec in records.items():
+                for column in self.keys:
+                    value = self._normalize(column, rec.get(column))
+                    if value:
+                        indexes[column].setdefault(value, row_i)
+
+            self.header = header
+            self._records = records
+            self._indexes = indexes
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at and (self._thread is not None or time.monotonic() - self._loaded_at < self.ttl):
+            return
+        with self._lock:
+            if not self._loaded_at or time.monotonic() - self._loaded_at >= self.ttl:
+                self.refresh()
+
+    def column(self, name: str) -> int | None:
+        self._ensure_fresh()
+        try:
+            return self.header.index(name) + 1
+        except ValueError:
+            return None
+
+    def lookup(self, column: str, value, refresh_on_miss: bool = False) -> tuple[int | None, dict | None]:
+        """Ищет строку по значению индексируемой колонки.
+
+        С `refresh_on_miss` при промахе лист перечитывается из таблицы (не чаще
+        раза в `min_refresh_interval` секунд) — так находятся строки, только что
+        добавленные преподавателем.
+        """
+        self._ensure_fresh()
+        row_i, rec = self._get(column, value)
+        if rec is None and refresh_on_miss and time.monotonic() - self._loaded_at >= self.min_refresh_interval:
+            self.refresh(max_age=self.min_refresh_interval)
+            row_i, rec = self._get(column, value)
+        return row_i, rec
+
+    def _get(self, column: str, value) -> tuple[int | None, dict | None]:
+        with self._lock:
+            row_i = self._indexes[column].get(self._normalize(column, value))
+            if row_i is None:
+                return None, None
+            return row_i, dict(self._records[row_i])
+
+    def update(self, row_i: int, column: str, value) -> None:
+        """Применяет к снимку запись, уже отправленную в таблицу"""
+        with self._lock:
+            rec = self._records.get(row_i)
+            if rec is None:
+                return
+            if column in self._indexes:
+                index = self._indexes[column]
+                old = self._normalize(column, rec.get(column))
+                if old and index.get(old) == row_i:
+                    del index[old]
+                new = self._normalize(column, value)
+                if new:
+                    index.setdefault(new, row_i)
+            rec[column] = _key(value)
+            self._overlay[(row_i, column)] = (time.monotonic(), rec[column])
+
+    def update_cells(self, cells: list[tuple[int, int, str]]) -> None:
+        """Как `update`, но ячейки заданы номерами столбцов (записи других процессов)"""
+        with self._lock:
+            header = list(self.header)
+        for row_i, col, value in cells:
+            if 0 < col <= len(header) and header[col - 1]:
+                self.update(row_i, header[col - 1], value)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Не удалось обновить лист {self.title}: {e}")
+            self._stop.wait(self.ttl)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"sheet-index-{self.title}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread = None
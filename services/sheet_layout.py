@@ -0,0 +1,105 @@
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from services.local_store import LocalWorksheet
+
+STUDENT_HEADERS = ("студент", "фио")
+_LAB_HEADER_RE = re.compile(r"^ЛР(\d+)$")
+
+
+@dataclass
+class SheetLayout:
+    """Раскладка листа группы: столбцы по заголовкам первой строки и найденные строки по значениям"""
+    header_version: int
+    headers: list[str]
+    github_col: int | None
+    student_col: int | None
+    labs: dict[int, int]
+    rows: dict[int, dict[str, list[int]]] = field(default_factory=dict)
+
+    def column(self, name: str) -> int | None:
+        try:
+            return self.headers.index(name) + 1
+        except ValueError:
+            return None
+
+    def lab_column(self, lab_number: int, lab_offset: int) -> int:
+        """Столбец ЛР{n} по заголовку, а если его нет — по смещению от столбца GitHub"""
+        col = self.labs.get(lab_number)
+        if col is None:
+            col = (self.github_col or 0) + lab_offset + lab_number
+        return col
+
+
+def _build(version: int, headers: list[str]) -> SheetLayout:
+    folded = [header.strip().casefold() for header in headers]
+    labs = {}
+    for col, header in enumerate(headers, start=1):
+        match = _LAB_HEADER_RE.match(header)
+        if match:
+            labs.setdefault(int(match.group(1)), col)
+    student_col = next((i for i, header in enumerate(folded, start=1) if header in STUDENT_HEADERS), None)
+    github_col = headers.index("GitHub") + 1 if "GitHub" in headers else None
+    return SheetLayout(version, headers, github_col, student_col, labs)
+
+
+def _first(index: dict[str, list[int]], value: str, first_row: int) -> int | None:
+    return next((row for row in index.get(value, ()) if row >= first_row), None)
+
+
+class LayoutCache:
+    """Раскладки листов по (таблица, лист) поверх локального хранилища.
+
+    Раскладка проверяется по счетчику изменений первой строки листа в
+    хранилище (один запрос по первичному ключу) и перестраивается, если
+    заголовки правили. Строки находятся по индексу значение -> строка;
+    найденная строка перепроверяется чтением одной ячейки, а при промахе или
+    несовпадении индекс столбца перечитывается.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._layouts: dict[tuple[str, str], SheetLayout] = {}
+        self._lock = threading.Lock()
+
+    def layout(self, ws: "LocalWorksheet") -> SheetLayout:
+        key = (ws.spreadsheet_id, ws.title)
+        version = ws.store.header_version(*key)
+        with self._lock:
+            layout = self._layouts.get(key)
+        if layout is not None and layout.header_version == version:
+            return layout
+        layout = _build(version, ws.row_values(1))
+        with self._lock:
+            if len(self._layouts) >= self.max_entries and key not in self._layouts:
+                self._layouts.pop(next(iter(self._layouts)))
+            self._layouts[key] = layout
+        return layout
+
+    def find_row(self, ws: "LocalWorksheet", col: int, value: str, first_row: int = 2) -> int | None:
+        """Первая строка начиная с `first_row`, где в столбце `col` записано `value` (без пробелов по краям).
+
+        Версия заголовков здесь не проверяется: найденную строку и так подтверждает чтение ячейки.
+        """
+        with self._lock:
+            layout = self._layouts.get((ws.spreadsheet_id, ws.title))
+        if layout is None:
+            layout = self.layout(ws)
+        value = value.strip()
+        index = layout.rows.get(col)
+        if index is not None:
+            row = _first(index, value, first_row)
+            if row is not None and ws.store.value(ws.spreadsheet_id, ws.title, row, col).strip() == value:
+                return row
+        index = {}
+        for row, (cell,) in ws.get_columns([col], 2):
+            index.setdefault(cell.strip(), []).append(row)
+        layout.rows[col] = index
+        return _first(index, value, first_row)
+
+    def invalidate(self, spreadsheet_id: str, title: str) -> None:
+        with self._lock:
+            self._layouts.pop((spreadsheet_id, title), None)
@@ -0,0 +1,110 @@
+import datetime
+import threading
+import time
+
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from requests.adapters import HTTPAdapter
+
+from services import metrics
+from services.sheets_scheduler import ScheduledHTTPClient, SheetsScheduler
+
+SCOPE = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+
+
+class SheetsClient:
+    """Общий для процесса клиент Google Sheets.
+
+    Учетные данные читаются и авторизуются один раз, токен обновляется заранее,
+    до истечения срока. Дескрипторы Spreadsheet/Worksheet кешируются по ключу
+    таблицы и названию листа, HTTP-соединения переиспользуются через пул.
+    Все запросы проходят через `scheduler` (квоты, повторы, приоритеты).
+    """
+
+    def __init__(self, credentials_file: str, refresh_margin: float = 300,
+                 pool_size: int = 32, handle_ttl: float = 300, scheduler: SheetsScheduler | None = None):
+        self.credentials_file = credentials_file
+        self.scheduler = scheduler or SheetsScheduler()
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.pool_size = pool_size
+        self.handle_ttl = handle_ttl
+        self._lock = threading.RLock()
+        self._client: gspread.Client | None = None
+        self._spreadsheets: dict[str, tuple[float, gspread.Spreadsheet]] = {}
+        self._worksheets: dict[tuple[str, str], tuple[float, gspread.Worksheet]] = {}
+        self._titles: dict[str, tuple[float, list[str]]] = {}
+
+    def _authorize(self) -> gspread.Client:
+        creds = ServiceAccountCredentials.from_json_keyfile_name(self.credentials_file, SCOPE)
+        client = gspread.authorize(creds, http_client=ScheduledHTTPClient)
+        client.http_client.scheduler = self.scheduler
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.pool_size)
+        client.http_client.session.mount("https://", adapter)
+        return client
+
+    def _ensure_token(self, client: gspread.Client) -> None:
+        auth = client.http_client.auth
+        expiry = getattr(auth, "expiry", None)
+        if auth.token and expiry and expiry - datetime.datetime.utcnow() > self.refresh_margin:
+            return
+        client.http_client.login()
+
+    def refresh_token(self) -> gspread.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = self._authorize()
+            self._ensure_token(self._client)
+            return self._client
+
+    @property
+    def client(self) -> gspread.Client:
+        return self.refresh_token()
+
+    def _cached(self, cache: dict, key):
+        entry = cache.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            metrics.CACHE_REQUESTS.inc(cache="sheets_handles", result="hit")
+            return entry[1]
+        metrics.CACHE_REQUESTS.inc(cache="sheets_handles", result="miss")
+        return None
+
+    def spreadsheet(self, key: str) -> gspread.Spreadsheet:
+        spreadsheet = self._cached(self._spreadsheets, key)
+        if spreadsheet is None:
+            spreadsheet = self.client.open_by_key(key)
+            self._spreadsheets[key] = (time.monotonic() + self.handle_ttl, spreadsheet)
+        else:
+            self.refresh_token()
+        return spreadsheet
+
+    def worksheet(self, key: str, title: str) -> gspread.Worksheet:
+        worksheet = self._cached(self._worksheets, (key, title))
+        if worksheet is None:
+            worksheet = self.spreadsheet(key).worksheet(title)
+            self._worksheets[(key, title)] = (time.monotonic() + self.handle_ttl, worksheet)
+        else:
+            self.refresh_token()
+        return worksheet
+
+    def worksheet_titles(self, key: str) -> list[str]:
+        titles = self._cached(self._titles, key)
+        if titles is None:
+            worksheets = self.spreadsheet(key).worksheets()
+            expires = time.monotonic() + self.handle_ttl
+            for ws in worksheets:
+                self._worksheets[(key, ws.title)] = (expires, ws)
+            titles = [ws.title for ws in worksheets]
+            self._titles[key] = (expires, titles)
+        return titles
+
+    def invalidate(self, key: str | None = None) -> None:
+        with self._lock:
+            if key is None:
+                self._spreadsheets.clear()
+                self._worksheets.clear()
+                self._titles.clear()
+                return
+            self._spreadsheets.pop(key, None)
+            self._titles.pop(key, None)
+            for cache_key in [k for k in self._worksheets if k[0] == key]:
+                self._worksheets.pop(cache_key, None)
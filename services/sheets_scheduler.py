@@ -0,0 +1,314 @@
+import contextlib
+import contextvars
+import functools
+import itertools
+import random
+import re
+import threading
+import time
+
+import redis
+from gspread.exceptions import APIError
+from gspread.http_client import HTTPClient
+from redis import RedisError
+
+from services import metrics
+from services.redis_circuit import RedisCircuit
+from services.tracing import TRACER
+
+# Меньшее значение — более высокий приоритет
+PRIORITIES = {"grade": 0, "registration": 1, "default": 2, "admin": 3}
+
+RETRY_STATUSES = {429, 500, 503}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("sheets_priority", default="default")
+_SPREADSHEET_RE = re.compile(r"/spreadsheets/([a-zA-Z0-9_-]+)")
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> bool:
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    def drain(self) -> None:
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+
+# Корзина токенов в Redis: пополняет по времени сервера и берет токен либо возвращает, сколько ждать.
+# ARGV: емкость, токенов в секунду, 1 — обнулить корзину (ответ 429)
+_TAKE = """
+local capacity, rate = tonumber(ARGV[1]), tonumber(ARGV[2])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local wait = 0
+if ARGV[3] == '1' then
+  tokens = math.min(tokens, 0)
+elseif tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class SharedQuota:
+    """Корзины токенов в Redis, общие для всех процессов бэкенда и воркеров.
+
+    Квота Google считается на сервисный аккаунт, а не на процесс, поэтому
+    без общей корзины N процессов вместе делали бы в N раз больше запросов.
+    Если Redis недоступен, `take` возвращает None и планировщик на
+    `retry_after` секунд возвращается к корзинам своего процесса.
+    """
+
+    def __init__(self, url: str, prefix: str = "sheets:quota", retry_after: float = 5.0):
+        self.redis = redis.Redis.from_url(url, decode_responses=True, socket_connect_timeout=2, socket_timeout=2)
+        self.prefix = prefix
+        self.circuit = RedisCircuit("Общая квота Google Sheets", retry_after)
+        self._take = self.redis.register_script(_TAKE)
+
+    def _call(self, spreadsheet_id: str, kind: str, per_minute: float, drain: bool) -> float | None:
+        if not self.circuit.available:
+            return None
+        try:
+            return float(self._take(keys=[f"{self.prefix}:{spreadsheet_id}:{kind}"],
+                                    args=[per_minute, per_minute / 60, int(drain)]))
+        except RedisError as e:
+            self.circuit.failed(e)
+            return None
+
+    def take(self, spreadsheet_id: str, kind: str, per_minute: float) -> float | None:
+        """0 — токен получен, иначе сколько секунд ждать; None — Redis недоступен"""
+        return self._call(spreadsheet_id, kind, per_minute, drain=False)
+
+    def drain(self, spreadsheet_id: str, kind: str, per_minute: float) -> None:
+        self._call(spreadsheet_id, kind, per_minute, drain=True)
+
+
+class SheetsScheduler:
+    """Планировщик всех запросов к Google Sheets API.
+
+    На каждую таблицу заведены отдельные корзины токенов для чтения и записи
+    (по умолчанию 60 запросов в минуту — квота Google на пользователя). Когда
+    токенов нет, запросы ждут в очереди и выходят в порядке приоритета:
+    запись оценок, регистрации, прочее, чтение из админки. Ответы 429/5xx
+    повторяются с экспоненциальной задержкой, а 429 дополнительно обнуляет
+    корзину, чтобы притормозить остальные запросы к этой таблице. С `quota`
+    токены берутся из общих для процессов корзин в Redis, а корзины процесса
+    используются, только пока Redis недоступен.
+    """
+
+    def __init__(self, read_per_minute: float = 60, write_per_minute: float = 60,
+                 max_retries: int = 5, backoff_base: float = 1.0, backoff_max: float = 32.0,
+                 quota: SharedQuota | None = None):
+        self.quota = quota
+        self.read_per_minute = read_per_minute
+        self.write_per_minute = write_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._waiting: dict[tuple[str, str], list[tuple[int, int]]] = {}
+        self._seq = itertools.count()
+        self._counters = {"requests": 0, "throttled": 0, "retries": 0, "rate_limited": 0}
+
+    @staticmethod
+    @contextlib.contextmanager
+    def priority(name: str):
+        """Задает класс приоритета для запросов к таблицам внутри блока"""
+        token = _priority.set(name)
+        try:
+            yield
+        finally:
+            _priority.reset(token)
+
+    @staticmethod
+    def current_priority() -> str:
+        return _priority.get()
+
+    def _bucket(self, key: tuple[str, str]) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self._per_minute(key[1]))
+        return bucket
+
+    def _per_minute(self, kind: str) -> float:
+        return self.read_per_minute if kind == "read" else self.write_per_minute
+
+    def _take(self, key: tuple[str, str], bucket: TokenBucket) -> float:
+        """0 — токен получен, иначе сколько секунд ждать следующего.
+
+        Вызывается без `_cond`: запрос к общей квоте в Redis не должен
+        задерживать запросы к другим таблицам и другого вида.
+        """
+        if self.quota is not None:
+            wait = self.quota.take(*key, self._per_minute(key[1]))
+            if wait is not None:
+                return wait
+        with self._cond:
+            return 0.0 if bucket.take() else bucket.wait_time()
+
+    def acquire(self, spreadsheet_id: str, kind: str) -> None:
+        with metrics.SHEETS_SCHEDULER_WAIT.time(priority=_priority.get()):
+            self._acquire(spreadsheet_id, kind)
+
+    def _acquire(self, spreadsheet_id: str, kind: str) -> None:
+        key = (spreadsheet_id, kind)
+        ticket = (PRIORITIES.get(_priority.get(), PRIORITIES["default"]), next(self._seq))
+        with self._cond:
+            self._counters["requests"] += 1
+            bucket = self._bucket(key)
+            waiting = self._waiting.setdefault(key, [])
+            waiting.append(ticket)
+        throttled = False
+        try:
+            while True:
+                with self._cond:
+                    while min(waiting) != ticket:
+                        throttled = True
+                        self._cond.wait(timeout=1.0)
+                # Токен берет только первый в очереди этой корзины, уже без блокировки планировщика
+                wait = self._take(key, bucket)
+                if wait == 0:
+                    return
+                throttled = True
+                with self._cond:
+                    self._cond.wait(timeout=max(wait, 0.05))
+        finally:
+            with self._cond:
+                self._counters["throttled"] += int(throttled)
+                waiting.remove(ticket)
+                self._cond.notify_all()
+
+    def throttle(self, spreadsheet_id: str, kind: str) -> None:
+        """Google ответил 429: токены этой таблицы считаются исчерпанными"""
+        with self._cond:
+            self._counters["rate_limited"] += 1
+            self._bucket((spreadsheet_id, kind)).drain()
+        if self.quota is not None:
+            self.quota.drain(spreadsheet_id, kind, self._per_minute(kind))
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def record_retry(self) -> None:
+        with self._cond:
+            self._counters["retries"] += 1
+
+    def stats(self) -> dict:
+        """Глубина очередей по приоритетам и таблицам и счетчики запросов"""
+        with self._cond:
+            by_priority = {name: 0 for name in PRIORITIES}
+            names = {value: name for name, value in PRIORITIES.items()}
+            by_bucket = {}
+            for (spreadsheet_id, kind), waiting in self._waiting.items():
+                if waiting:
+                    by_bucket[f"{spreadsheet_id}:{kind}"] = len(waiting)
+                for priority, _ in waiting:
+                    by_priority[names[priority]] += 1
+            return {"queued": sum(by_priority.values()), "queued_by_priority": by_priority,
+                    "queued_by_spreadsheet": by_bucket, **self._counters}
+
+
+def with_priority(name: str):
+    """Декоратор: все запросы к таблицам внутри функции идут с приоритетом `name`"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with SheetsScheduler.priority(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _operation(method: str, endpoint: str) -> str:
+    """Имя операции Sheets API для меток метрик"""
+    path = endpoint.split("?", 1)[0]
+    if path.endswith(":batchUpdate"):
+        return "values_batch_update" if "/values:" in path else "batch_update"
+    if path.endswith(":batchGet"):
+        return "values_batch_get"
+    if "/values/" in path:
+        return {"GET": "values_get", "PUT": "values_update", "POST": "values_append"}.get(method.upper(), "values")
+    if _SPREADSHEET_RE.search(path) and method.upper() == "GET":
+        return "fetch_sheet_metadata"
+    return "other"
+
+
+class ScheduledHTTPClient(HTTPClient):
+    """HTTP-клиент gspread, пропускающий каждый запрос через SheetsScheduler"""
+
+    scheduler: SheetsScheduler | None = None
+
+    def _send(self, method: str, endpoint: str, *args, **kwargs):
+        operation = _operation(method, endpoint)
+        status = "error"
+        try:
+            with metrics.SHEETS_REQUEST_DURATION.time(operation=operation):
+                response = super().request(method, endpoint, *args, **kwargs)
+            status = response.status_code
+            return response
+        except APIError as e:
+            status = e.code
+            raise
+        finally:
+            metrics.SHEETS_REQUESTS.inc(operation=operation, status=status)
+
+    def request(self, method: str, endpoint: str, *args, **kwargs):
+        match = _SPREADSHEET_RE.search(endpoint)
+        spreadsheet_id = match.group(1) if match else "-"
+        with TRACER.span(f"sheets.{_operation(method, endpoint)}", kind="client",
+                         spreadsheet=spreadsheet_id, priority=_priority.get()) as span:
+            if self.scheduler is None:
+                return self._send(method, endpoint, *args, **kwargs)
+            return self._scheduled(span, spreadsheet_id, method, endpoint, *args, **kwargs)
+
+    def _scheduled(self, span, spreadsheet_id: str, method: str, endpoint: str, *args, **kwargs):
+        kind = "read" if method.upper() == "GET" or endpoint.endswith(":batchGet") else "write"
+
+        attempt = 0
+        waited = 0.0
+        while True:
+            started = time.perf_counter()
+            self.scheduler.acquire(spreadsheet_id, kind)
+            waited += time.perf_counter() - started
+            if span is not None:
+                span.set(wait_ms=round(waited * 1000, 3), attempts=attempt + 1)
+            try:
+                return self._send(method, endpoint, *args, **kwargs)
+            except APIError as e:
+                if e.code not in RETRY_STATUSES or attempt >= self.scheduler.max_retries:
+                    raise
+                if e.code == 429:
+                    self.scheduler.throttle(spreadsheet_id, kind)
+                delay = self.scheduler.backoff(attempt)
+                print(f"Google Sheets ответил {e.code}, повтор через {delay:.1f} с")
+                self.scheduler.record_retry()
+                time.sleep(delay)
+                attempt += 1
@@ -0,0 +1,241 @@
+import contextlib
+import contextvars
+import functools
+import json
+import queue
+import re
+import secrets
+import threading
+import time
+
+import requests
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("trace_span", default=None)
+
+
+def parse_baggage(header: str | None) -> dict[str, str]:
+    """Заголовок W3C baggage: "chat_id=123,lang=ru" -> {"chat_id": "123", "lang": "ru"}"""
+    items = {}
+    for part in (header or "").split(","):
+        key, sep, value = part.split(";", 1)[0].partition("=")
+        if sep and key.strip():
+            items[key.strip()] = value.strip()
+    return items
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, kind: str, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = 0.0
+        self.error: str | None = None
+        self._started = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        self.duration = time.perf_counter() - self._started
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self, service: str) -> dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "service": service, "name": self.name, "kind": self.kind, "start": self.start,
+                "duration_ms": round(self.duration * 1000, 3), "error": self.error,
+                "attributes": self.attributes}
+
+
+class JsonlExporter:
+    """Дописывает спаны в файл, по одному JSON-объекту на строку"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: list[dict]) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + "\n")
+
+
+class OtlpExporter:
+    """Отправляет спаны в коллектор по OTLP/HTTP в JSON-кодировке (POST {endpoint}/v1/traces)"""
+
+    KINDS = {"internal": 1, "server": 2, "client": 3, "consumer": 5}
+
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @staticmethod
+    def _value(value) -> dict:
+        if isinstance(value, bool):
+            return {"boolValue": value}
+        if isinstance(value, int):
+            return {"intValue": str(value)}
+        if isinstance(value, float):
+            return {"doubleValue": value}
+        return {"stringValue": str(value)}
+
+    def _span(self, span: dict) -> dict:
+        start = int(span["start"] * 1e9)
+        otlp = {
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "name": span["name"],
+            "kind": self.KINDS.get(span["kind"], 1),
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(span["duration_ms"] * 1e6)),
+            "attributes": [{"key": k, "value": self._value(v)} for k, v in span["attributes"].items()],
+            "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+        }
+        if span["parent_id"]:
+            otlp["parentSpanId"] = span["parent_id"]
+        return otlp
+
+    def export(self, spans: list[dict]) -> None:
+        by_service: dict[str, list[dict]] = {}
+        for span in spans:
+            by_service.setdefault(span["service"], []).append(self._span(span))
+        body = {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+            "scopeSpans": [{"scope": {"name": "telegram_labs"}, "spans": items}],
+        } for service, items in by_service.items()]}
+        response = self.session.post(self.url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class Tracer:
+    """Трассировка запросов: бот присылает заголовок traceparent, бэкенд
+    открывает корневой спан на запрос и дочерние — на каждый вызов Sheets и
+    GitHub. Спаны вне трассы не записываются. Готовые спаны уходят
+    в экспортер из фонового потока пачками, чтобы не задерживать ответы.
+    """
+
+    def __init__(self, service: str = "backend", exporter=None, batch_size: int = 256, flush_interval: float = 2.0):
+        self.service = service
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.SimpleQueue[dict] = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    @staticmethod
+    def current() -> Span | None:
+        return _current.get()
+
+    def traceparent(self) -> str | None:
+        """Заголовок для передачи текущего контекста дальше (например, в задачу очереди)"""
+        span = _current.get()
+        return span.traceparent if span is not None else None
+
+    @contextlib.contextmanager
+    def _activate(self, span: Span):
+        token = _current.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+            self._queue.put(span.to_dict(self.service))
+
+    @contextlib.contextmanager
+    def trace(self, name: str, traceparent: str | None = None, kind: str = "server", **attributes):
+        """Корневой спан: продолжает трассу из `traceparent` или начинает новую"""
+        if not self.enabled:
+            yield None
+            return
+        match = TRACEPARENT_RE.match(traceparent or "")
+        trace_id, parent_id = match.groups() if match else (secrets.token_hex(16), None)
+        with self._activate(Span(name, trace_id, parent_id, kind, attributes)) as span:
+            yield span
+
+    @contextlib.contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """Дочерний спан текущей трассы; без активной трассы ничего не записывает"""
+        parent = _current.get()
+        if parent is None or not self.enabled:
+            yield None
+            return
+        with self._activate(Span(name, parent.trace_id, parent.span_id, kind, attributes)) as span:
+            yield span
+
+    def propagate(self, func):
+        """Переносит текущий спан в функцию, которая выполнится в другом потоке (ThreadPoolExecutor)"""
+        parent = _current.get()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current.set(parent)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return wrapper
+
+    def flush(self) -> None:
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.exporter.export(batch)
+            except Exception as e:
+                print(f"Не удалось выгрузить спаны ({len(batch)}): {e}")
+                return
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> None:
+        if self._thread is not None or not self.enabled:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.enabled:
+            self.flush()
+
+
+def exporter_from_env(kind: str | None, jsonl_path: str, otlp_endpoint: str):
+    """TRACING_EXPORTER: jsonl, otlp или пусто (трассировка выключена)"""
+    if kind == "jsonl":
+        return JsonlExporter(jsonl_path)
+    if kind == "otlp":
+        return OtlpExporter(otlp_endpoint)
+    if kind:
+        print(f"Неизвестный экспортер трассировки: {kind}, трассировка выключена")
+    return None
+
+
+TRACER = Tracer()
@@ -0,0 +1,31 @@
+import hashlib
+import hmac
+
+from services.courses import Course, CourseRegistry
+
+# События, после которых состояние CI репозитория нужно пересчитать
+CI_EVENTS = {"check_run", "check_suite", "workflow_run"}
+
+
+def verify_signature(secret: str, body: bytes, signature: str | None) -> bool:
+    """Проверяет заголовок X-Hub-Signature-256 (HMAC-SHA256 тела запроса)"""
+    if not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature[len("sha256="):])
+
+
+def resolve_repository(courses: CourseRegistry, full_name: str) -> tuple[Course, str, str] | None:
+    """(курс, ЛР, GitHub-логин) для репозитория вида `org/<github-prefix>-<login>`.
+
+    При пересечении префиксов побеждает самый длинный.
+    """
+    org, _, repo_name = full_name.partition("/")
+    for course in courses.all():
+        settings = course.settings
+        if settings is None or settings.github.organization.lower() != org.lower():
+            continue
+        match = settings.lab_by_repository(repo_name)
+        if match is not None:
+            return course, match[0], match[1]
+    return None
@@ -0,0 +1,34 @@
+import datetime
+
+from services.courses import CourseRegistry
+
+COURSE_YAML = """\
+course:
+    name: Операционные системы
+    semester: Осень 2024
+    start: 2024-09-02
+    github:
+        organization: suai-os-2024
+    google:
+        spreadsheet: spreadsheet-id
+    labs:
+        "ЛР1":
+            github-prefix: os-task1
+            deadline: 2024-10-01
+"""
+
+
+def test_course_dates_survive_reload_in_fresh_registry(tmp_path):
+    (tmp_path / "os-2024.yaml").write_text(COURSE_YAML, encoding="utf-8")
+
+    first = CourseRegistry(str(tmp_path)).by_stem("os-2024")
+    # Новый процесс (воркер, перезапуск) поднимает реестр с нуля
+    second = CourseRegistry(str(tmp_path)).by_stem("os-2024")
+
+    for course in (first, second):
+        assert course.valid
+        assert course.info["start"] == datetime.date(2024, 9, 2)
+        assert course.info["labs"]["ЛР1"]["deadline"] == datetime.date(2024, 10, 1)
+        assert course.settings.labs["ЛР1"].deadline == datetime.date(2024, 10, 1)
+    assert second.data == first.data
+    assert second.config == first.config
@@ -0,0 +1,46 @@
+import time
+
+from services.local_store import LocalStore
+
+SPREADSHEET = "spreadsheet"
+SHEET = "A-01_course"
+HEADER = ["tg_chat_id", "Студент", "GitHub", "ЛР1"]
+
+
+def _store(tmp_path) -> LocalStore:
+    store = LocalStore(str(tmp_path / "store.sqlite3"))
+    store.merge(SPREADSHEET, SHEET, [HEADER, ["1", "Иванов", "ivanov", "✗"]])
+    return store
+
+
+def _push(store: LocalStore, cells: list[tuple[int, int, str]]) -> None:
+    store.write(SPREADSHEET, SHEET, cells)
+    store.mark_pushed(SPREADSHEET, [(SHEET, row, col, value) for row, col, value in cells])
+
+
+def test_pull_read_before_flush_does_not_revert_pushed_cells(tmp_path):
+    store = _store(tmp_path)
+
+    # Лист прочитан из таблицы (или взят из снимка) до того, как записи дошли до Google...
+    fetched_at = time.time()
+    stale = [HEADER, ["1", "Иванов", "ivanov", "✗"]]
+    time.sleep(0.01)
+    # ...а сливается уже после их отправки
+    _push(store, [(2, 4, "✓"), (3, 1, "2"), (3, 2, "Петров"), (3, 3, "petrov")])
+    store.merge(SPREADSHEET, SHEET, stale, pulled_at=fetched_at)
+
+    assert store.value(SPREADSHEET, SHEET, 2, 4) == "✓"
+    assert store.value(SPREADSHEET, SHEET, 3, 2) == "Петров"
+    assert store.dirty_count() == 0
+
+
+def test_pull_read_after_flush_applies_remote_changes(tmp_path):
+    store = _store(tmp_path)
+    _push(store, [(3, 1, "2"), (3, 2, "Петров"), (3, 3, "petrov")])
+    time.sleep(0.01)
+
+    # Преподаватель удалил строку и поправил оценку уже после записи бэкенда
+    store.merge(SPREADSHEET, SHEET, [HEADER, ["1", "Иванов", "ivanov", "✓"]], pulled_at=time.time())
+
+    assert store.value(SPREADSHEET, SHEET, 2, 4) == "✓"
+    assert store.value(SPREADSHEET, SHEET, 3, 2) == ""
@@ -0,0 +1,49 @@
+import multiprocessing
+import time
+
+from services.local_store import LocalStore, LocalWorksheet, SyncEngine
+from services.row_allocator import free_row
+
+SPREADSHEET = "spreadsheet"
+SHEET = "A-01_course"
+REGISTRATIONS = 20
+
+
+class _Spreadsheet:
+    def values_batch_update(self, body):
+        pass
+
+
+class _Sheets:
+    def spreadsheet(self, spreadsheet_id):
+        return _Spreadsheet()
+
+
+def _register(path: str, name: str, barrier) -> None:
+    sync = SyncEngine(LocalStore(path), _Sheets())
+    ws = LocalWorksheet(sync.store, SPREADSHEET, SHEET)
+    barrier.wait()
+    for i in range(REGISTRATIONS):
+        with sync.exclusive():
+            row = free_row(ws.get_all_values())
+            time.sleep(0.002)  # окно между чтением и записью, в котором раньше терялись регистрации
+            sync.update_cells(ws, [(row, 1, i), (row, 2, f"{name} {i}")])
+
+
+def test_concurrent_registrations_from_two_processes_get_distinct_rows(tmp_path):
+    path = str(tmp_path / "store.sqlite3")
+    LocalStore(path).merge(SPREADSHEET, SHEET, [["tg_chat_id", "Студент", "GitHub"]])
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(2)
+    workers = [context.Process(target=_register, args=(path, name, barrier)) for name in ("first", "second")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    values = LocalWorksheet(LocalStore(path), SPREADSHEET, SHEET).get_all_values()
+    students = [row[1] for row in values[1:]]
+    assert len(students) == 2 * REGISTRATIONS
+    assert sorted(students) == sorted(f"{name} {i}" for name in ("first", "second") for i in range(REGISTRATIONS))
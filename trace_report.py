@@ -0,0 +1,80 @@
+"""Разбор трасс из JSONL-файла трассировки: python trace_report.py traces.jsonl
+
+Для каждого взаимодействия (trace id от бота) показывает длительность,
+число запросов к бэкенду, самый медленный запрос и самый медленный внешний
+вызов (Sheets/GitHub). С --trace печатает дерево спанов одной трассы.
+"""
+import argparse
+import json
+from collections import defaultdict
+
+
+def load(path: str) -> dict[str, list[dict]]:
+    traces = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                span = json.loads(line)
+                traces[span["trace_id"]].append(span)
+    return traces
+
+
+def summarize(trace_id: str, spans: list[dict]) -> dict:
+    ids = {span["span_id"] for span in spans}
+    hops = [span for span in spans if span["parent_id"] not in ids]
+    calls = [span for span in spans if span.get("kind") == "client"]
+    start = min(span["start"] for span in spans)
+    end = max(span["start"] + span["duration_ms"] / 1000 for span in spans)
+    slowest_hop = max(hops, key=lambda span: span["duration_ms"])
+    slowest_call = max(calls, key=lambda span: span["duration_ms"]) if calls else None
+    chat_id = next((span["attributes"]["chat_id"] for span in hops if "chat_id" in span["attributes"]), "")
+    return {"trace_id": trace_id, "start": start, "duration_ms": (end - start) * 1000, "hops": len(hops),
+            "calls": len(calls), "chat_id": chat_id, "slowest_hop": slowest_hop, "slowest_call": slowest_call}
+
+
+def print_tree(spans: list[dict]) -> None:
+    ids = {span["span_id"] for span in spans}
+    children = defaultdict(list)
+    for span in spans:
+        children[span["parent_id"] if span["parent_id"] in ids else None].append(span)
+    start = min(span["start"] for span in spans)
+
+    def walk(parent_id, depth):
+        for span in sorted(children[parent_id], key=lambda span: span["start"]):
+            offset = (span["start"] - start) * 1000
+            error = f"  ошибка: {span['error']}" if span.get("error") else ""
+            print(f"{offset:8.1f} мс {'  ' * depth}{span['name']}  {span['duration_ms']:.1f} мс{error}")
+            walk(span["span_id"], depth + 1)
+
+    walk(None, 0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", default="traces.jsonl")
+    parser.add_argument("--top", type=int, default=20, help="сколько самых долгих трасс показать")
+    parser.add_argument("--trace", help="показать дерево спанов трассы с этим id")
+    args = parser.parse_args()
+
+    traces = load(args.path)
+    if args.trace:
+        if args.trace not in traces:
+            raise SystemExit(f"Трасса {args.trace} не найдена")
+        print_tree(traces[args.trace])
+        return
+
+    summaries = sorted((summarize(trace_id, spans) for trace_id, spans in traces.items()),
+                       key=lambda item: item["duration_ms"], reverse=True)
+    for item in summaries[:args.top]:
+        hop, call = item["slowest_hop"], item["slowest_call"]
+        line = (f"{item['trace_id']}  {item['duration_ms']:8.1f} мс  chat={item['chat_id'] or '-'}  "
+                f"запросов={item['hops']}  вызовов={item['calls']}  "
+                f"медленнее всего: {hop['name']} {hop['duration_ms']:.1f} мс")
+        if call is not None:
+            line += f", внешний вызов {call['name']} {call['duration_ms']:.1f} мс"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
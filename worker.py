@@ -0,0 +1,86 @@
+"""Пул воркеров очереди проверки: python worker.py
+
+Число процессов задается GRADING_WORKERS. Процессы делят локальное
+хранилище листов; в Google Sheets его отправляет один процесс, держащий
+аренду записи, а квота запросов к Google общая для всех процессов (Redis).
+"""
+import multiprocessing
+import os
+import signal
+import time
+
+from dotenv import load_dotenv
+from redis import RedisError
+
+load_dotenv()
+
+WORKERS = int(os.getenv("GRADING_WORKERS", "4"))
+JOB_MAX_RUNTIME = float(os.getenv("GRADING_JOB_MAX_RUNTIME", "300"))
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+def work(index: int) -> None:
+    signal.signal(signal.SIGTERM, _stop)
+
+    import main
+    from services.tracing import TRACER
+
+    main.courses.load()
+    main.roster.start()
+    main.sync.start()
+    main.bus.start()
+    TRACER.start()
+    print(f"Воркер {index} запущен")
+    try:
+        while True:
+            try:
+                job = main.jobs.next()
+            except RedisError as e:
+                print(f"Воркер {index}: очередь недоступна: {e}")
+                time.sleep(5)
+                continue
+            if job is not None:
+                main.run_job(job)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.roster.stop()
+        main.sync.stop()
+        main.bus.stop()
+        TRACER.stop()
+
+
+def run() -> None:
+    from services.jobs import JobQueue
+
+    queue = JobQueue(os.getenv("REDIS_URL", "redis://redis:6379/0"))
+    processes: dict[int, multiprocessing.Process] = {}
+
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while True:
+            for i in range(1, WORKERS + 1):
+                if i not in processes or not processes[i].is_alive():
+                    processes[i] = multiprocessing.Process(target=work, args=(i,), name=f"grading-worker-{i}")
+                    processes[i].start()
+            try:
+                requeued = queue.requeue_stale(JOB_MAX_RUNTIME)
+                if requeued:
+                    print(f"Возвращено в очередь зависших задач: {requeued}")
+            except RedisError as e:
+                print(f"Очередь недоступна: {e}")
+            time.sleep(min(JOB_MAX_RUNTIME / 10, 10))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+
+if __name__ == "__main__":
+    run()